@@ -0,0 +1,363 @@
+"""
+Load test of the server with concurrent clients for each authentication scheme.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+import crypt
+from datetime import datetime, timezone
+from http.client import HTTPConnection, HTTPException
+from http.cookies import SimpleCookie
+import importlib.util
+import json
+import os
+from pathlib import Path
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+from server import __version__ as VERSION
+
+USERNAME = 'benchmark'
+PASSWORD = 'benchmark'
+
+SCHEMES = ('open', 'pwd', 'spwd', 'ldap')
+
+# Requests of each flow, with the method, path, whether the session cookie of
+# a logged in user is sent, and the expected status and redirect location.
+FLOWS: Dict[str, Tuple[str, str, bool, int, str]] = {
+    'login': ('POST', '/login', False, 303, '/list'),
+    'page': ('GET', '/list', True, 200, ''),
+    'redirect': ('GET', '/list', False, 303, '/index?page=list'),
+    'not_found': ('GET', '/missing', True, 404, '')
+}
+
+SETTINGS = '''
+[deploy]
+auth = open
+
+[unix]
+passwd_file = {passwd}
+shadow_file = {shadow}
+
+[ldap]
+server = ldap://localhost
+root_dn = dc=benchmark,dc=test
+search_filter = uid={{}}
+manager_dn = cn=manager,dc=benchmark,dc=test
+manager_password = manager
+group_attr = memberUid
+group_dn = cn=benchmark
+display_name = cn
+'''
+
+LOGIN = urlencode({
+    'username': USERNAME,
+    'password': PASSWORD,
+    'page': 'list'
+})
+
+def parse_args() -> Namespace:
+    """
+    Parse command line arguments.
+    """
+
+    parser = ArgumentParser(description='Measure throughput and latency of the server')
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='Number of requests to perform per flow')
+    parser.add_argument('--clients', type=int, default=8,
+                        help='Number of concurrent clients')
+    parser.add_argument('--threads', type=int, default=10,
+                        help='Number of threads to handle requests')
+    parser.add_argument('--schemes', nargs='+', choices=SCHEMES,
+                        default=list(SCHEMES),
+                        help='Authentication schemes to measure')
+    parser.add_argument('--output', default='load-benchmark.json',
+                        help='File to write results to in JSON format')
+    parser.add_argument('--baseline', default=None,
+                        help='File with earlier results to compare against')
+    return parser.parse_args()
+
+def write_settings(directory: Path) -> None:
+    """
+    Write a password database, shadow file and settings file with a user
+    into the `directory`.
+    """
+
+    crypted_password = crypt.crypt(PASSWORD, crypt.mksalt(crypt.METHOD_SHA512))
+    passwd = directory / 'passwd'
+    passwd.write_text(f'{USERNAME}:{crypted_password}:1000:1000:Benchmark,,,:'
+                      f'/home/{USERNAME}:/bin/sh\n', encoding='utf-8')
+    shadow = directory / 'shadow'
+    shadow.write_text(f'{USERNAME}:{crypted_password}:19000:0:99999:7:::\n',
+                      encoding='utf-8')
+
+    settings = directory / 'settings.cfg'
+    settings.write_text(SETTINGS.format(passwd=passwd, shadow=shadow),
+                        encoding='utf-8')
+
+def find_port() -> int:
+    """
+    Retrieve a port that is currently free on the local host.
+    """
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return int(sock.getsockname()[1])
+
+def start_server(args: Namespace, scheme: str, port: int,
+                 directory: Path) -> 'subprocess.Popen[bytes]':
+    """
+    Start the sample server with the authentication `scheme` in a process and
+    wait until it accepts connections.
+    """
+
+    command = [
+        sys.executable, '-m', 'benchmark.sample', '--auth', scheme,
+        '--port', str(port), '--threads', str(args.threads),
+        '--log', 'WARNING', '--log-path', str(directory),
+        '--fake-ldap', f'{USERNAME}:{PASSWORD}'
+    ]
+    if scheme == 'open':
+        # Tracebacks on web pages are only harmless without authentication
+        command.append('--debug')
+    env = {
+        **os.environ,
+        'GATHERER_SETTINGS_FILE': str(directory / 'settings.cfg')
+    }
+    log = directory / f'{scheme}.log'
+    with log.open('wb') as output:
+        # The server keeps running until the caller terminates it.
+        # pylint: disable-next=consider-using-with
+        process = subprocess.Popen(command, env=env, stdout=output,
+                                   stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + 30
+    while process.poll() is None and time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.terminate()
+    process.wait()
+    raise RuntimeError(f'Server for {scheme} did not start:\n' +
+                       log.read_text(encoding='utf-8', errors='replace'))
+
+class Client:
+    """
+    HTTP client with a persistent connection to the server.
+    """
+
+    def __init__(self, port: int):
+        self._connection = HTTPConnection('127.0.0.1', port, timeout=30)
+        self.cookie: Optional[str] = None
+
+    def request(self, method: str, path: str, session: bool = False,
+                body: Optional[str] = None) -> Tuple[int, str]:
+        """
+        Perform a request and read the response, returning the status and the
+        path of the redirect location, if any.
+
+        If `session` is enabled, then the session cookie from an earlier login
+        is sent. A successful login keeps the session cookie of the response.
+        """
+
+        headers = {}
+        if session and self.cookie is not None:
+            headers['Cookie'] = self.cookie
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        try:
+            self._connection.request(method, path, body=body, headers=headers)
+            response = self._connection.getresponse()
+            response.read()
+        except (OSError, HTTPException):
+            # Reconnect on the next request
+            self._connection.close()
+            return 0, ''
+
+        location = urlsplit(response.getheader('Location', ''))
+        target = location.path
+        if location.query != '':
+            target += f'?{location.query}'
+
+        cookie = response.getheader('Set-Cookie')
+        if cookie is not None and target == '/list':
+            self.cookie = '; '.join(f'{name}={morsel.value}' for name, morsel
+                                    in SimpleCookie(cookie).items())
+
+        return response.status, target
+
+    def close(self) -> None:
+        """
+        Close the connection.
+        """
+
+        self._connection.close()
+
+def connect(args: Namespace, port: int, session: bool) -> List[Client]:
+    """
+    Create the clients, which log in beforehand if they use a `session`.
+    """
+
+    clients = [Client(port) for _ in range(args.clients)]
+    if session:
+        for client in clients:
+            if client.request('POST', '/login', body=LOGIN) != (303, '/list'):
+                raise RuntimeError('Could not log in')
+
+    return clients
+
+def perform(client: Client, flow: str, count: int) \
+    -> Tuple[List[float], int]:
+    """
+    Perform `count` requests of a `flow` with a client, returning the latency
+    of each request and the number of responses with an unexpected status or
+    redirect.
+    """
+
+    method, path, session, status, location = FLOWS[flow]
+    body = LOGIN if method == 'POST' else None
+    latencies = []
+    errors = 0
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.request(method, path, session=session, body=body)
+        latencies.append(time.perf_counter() - start)
+        if response != (status, location):
+            errors += 1
+
+    return latencies, errors
+
+def run(args: Namespace, port: int, flow: str) -> Dict[str, Any]:
+    """
+    Perform requests of a `flow` from concurrent clients and return the
+    throughput, latency percentiles in milliseconds and the number of
+    errors.
+    """
+
+    clients = connect(args, port, FLOWS[flow][2])
+    counts = [
+        args.requests // args.clients + int(index < args.requests % args.clients)
+        for index in range(args.clients)
+    ]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as executor:
+        results = list(executor.map(lambda client, count:
+                                    perform(client, flow, count),
+                                    clients, counts))
+    duration = time.perf_counter() - start
+    for client in clients:
+        client.close()
+
+    return summarize(results, duration)
+
+def summarize(results: List[Tuple[List[float], int]], duration: float) \
+    -> Dict[str, Any]:
+    """
+    Combine the latencies and number of errors of clients that performed
+    requests for `duration` seconds.
+    """
+
+    latencies = [latency for result in results for latency in result[0]]
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': len(latencies),
+        'errors': sum(result[1] for result in results),
+        'rate': len(latencies) / duration,
+        'p50': percentiles[49] * 1000,
+        'p95': percentiles[94] * 1000,
+        'p99': percentiles[98] * 1000
+    }
+
+def compare(results: Dict[str, Dict[str, Dict[str, Any]]],
+            baseline: Dict[str, Dict[str, Dict[str, Any]]]) -> None:
+    """
+    Print the relative change of the throughput and 95th percentile latency
+    for each flow of the `results` compared to earlier results.
+    """
+
+    for scheme, flows in results.items():
+        for flow, result in flows.items():
+            previous = baseline.get(scheme, {}).get(flow)
+            if previous is None or not previous['rate'] or not previous['p95']:
+                continue
+
+            rate = (result['rate'] / previous['rate'] - 1) * 100
+            latency = (result['p95'] / previous['p95'] - 1) * 100
+            print(f'{scheme} {flow}: {rate:+.1f}% requests/s, '
+                  f'{latency:+.1f}% p95 latency')
+
+def main() -> None:
+    """
+    Main entry point.
+    """
+
+    args = parse_args()
+    results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    with tempfile.TemporaryDirectory() as temp_directory:
+        directory = Path(temp_directory)
+        write_settings(directory)
+        for scheme in args.schemes:
+            if scheme == 'ldap' and importlib.util.find_spec('ldap') is None:
+                print('Skipping ldap scheme: python-ldap is not installed')
+                continue
+
+            port = find_port()
+            process = start_server(args, scheme, port, directory)
+            try:
+                results[scheme] = {
+                    flow: run(args, port, flow) for flow in FLOWS
+                }
+            finally:
+                process.terminate()
+                process.wait()
+
+            for flow, result in results[scheme].items():
+                print(f"{scheme} {flow}: {result['rate']:.1f} requests/s, "
+                      f"p50/p95/p99 {result['p50']:.1f}/{result['p95']:.1f}/"
+                      f"{result['p99']:.1f} ms, {result['errors']} errors")
+
+    report = {
+        'version': VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.now(timezone.utc).isoformat(),
+        'requests': args.requests,
+        'clients': args.clients,
+        'threads': args.threads,
+        'results': results
+    }
+    Path(args.output).write_text(json.dumps(report, indent=4) + '\n',
+                                 encoding='utf-8')
+
+    if args.baseline is not None:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        compare(results, baseline['results'])
+
+if __name__ == '__main__':
+    main()
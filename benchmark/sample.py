@@ -0,0 +1,227 @@
+"""
+Sample server with an in-process stand-in for an LDAP directory.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from argparse import ArgumentParser
+from configparser import RawConfigParser
+import html
+import itertools
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast, \
+    TYPE_CHECKING
+import cherrypy
+from server.application import Authenticated_Application
+from server.authentication import Authentication
+from server.bootstrap import Bootstrap
+from server.directory import LDAP, LDAPResult, ldap
+if TYPE_CHECKING:
+    from ldap.ldapobject import LDAPObject
+
+class FakeConnection:
+    """
+    Connection to an in-process LDAP directory with a group of users that have
+    fixed passwords, which answers searches and binds of the LDAP scheme.
+    """
+
+    _msgids = itertools.count(1)
+
+    def __init__(self, config: RawConfigParser, users: Dict[str, str]):
+        self._config = config
+        self._users = users
+        self._root_dn = config.get('ldap', 'root_dn')
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Callable[[], LDAPResult]] = {}
+
+    def _user_dn(self, username: str) -> str:
+        return f'uid={username},{self._root_dn}'
+
+    def set_option(self, option: int, invalue: float) -> None:
+        """
+        Set an option of the connection, which is ignored.
+        """
+
+    def simple_bind_s(self, who: str, cred: str) -> None:
+        """
+        Bind as the manager or as a user with a password.
+        """
+
+        if who == self._config.get('ldap', 'manager_dn') and \
+            cred == self._config.get('ldap', 'manager_password'):
+            return
+
+        for username, password in self._users.items():
+            if who == self._user_dn(username) and cred == password:
+                return
+
+        raise ldap.INVALID_CREDENTIALS({'desc': 'Invalid credentials'})
+
+    def search_s(self, base: str, scope: int, filterstr: str,
+                 attrlist: List[str]) -> LDAPResult:
+        """
+        Search for the group or for a user.
+        """
+
+        # pylint: disable=unused-argument
+        if filterstr == self._config.get('ldap', 'group_dn'):
+            group_attr = self._config.get('ldap', 'group_attr')
+            members = [username.encode('utf-8') for username in self._users]
+            return [(f'{filterstr},{self._root_dn}', {group_attr: members})]
+
+        search_filter = self._config.get('ldap', 'search_filter')
+        display_name = self._config.get('ldap', 'display_name')
+        return [
+            (self._user_dn(username),
+             {display_name: [username.title().encode('utf-8')]})
+            for username in self._users
+            if search_filter.format(username) == filterstr
+        ]
+
+    def _operate(self, operation: Callable[[], LDAPResult]) -> int:
+        msgid = next(self._msgids)
+        with self._lock:
+            self._pending[msgid] = operation
+
+        return msgid
+
+    def search(self, base: str, scope: int, filterstr: str,
+               attrlist: List[str]) -> int:
+        """
+        Start a search and return its message ID.
+        """
+
+        return self._operate(lambda: self.search_s(base, scope, filterstr,
+                                                   attrlist))
+
+    def simple_bind(self, who: str, cred: str) -> int:
+        """
+        Start a bind and return its message ID.
+        """
+
+        def bind() -> LDAPResult:
+            self.simple_bind_s(who, cred)
+            return []
+
+        return self._operate(bind)
+
+    def result(self, msgid: int, all: int = 1, # pylint: disable=redefined-builtin
+               timeout: Optional[float] = None) -> Tuple[int, LDAPResult]:
+        """
+        Retrieve the result of a started operation.
+        """
+
+        # pylint: disable=unused-argument
+        with self._lock:
+            operation = self._pending.pop(msgid)
+
+        return 0, operation()
+
+    def abandon(self, msgid: int) -> None:
+        """
+        Abandon a started operation.
+        """
+
+        with self._lock:
+            self._pending.pop(msgid, None)
+
+    def whoami_s(self) -> str:
+        """
+        Check the connection.
+        """
+
+        return ''
+
+    def unbind(self) -> None:
+        """
+        Close the connection.
+        """
+
+class FakeLDAP(LDAP):
+    """
+    LDAP authentication scheme which connects to an in-process directory
+    instead of the configured server.
+    """
+
+    users: Dict[str, str] = {}
+
+    def _connect(self) -> 'LDAPObject':
+        return cast('LDAPObject', FakeConnection(self.config, self.users))
+
+class Sample_Application(Authenticated_Application):
+    """
+    Sample application with a login form and one authenticated page.
+    """
+
+    @cherrypy.expose
+    def index(self, page: str = 'list', params: str = '') -> str:
+        page = html.escape(page, quote=True)
+        params = html.escape(params, quote=True)
+        return f'''<form method="post" action="login">
+<input type="hidden" name="page" value="{page}">
+<input type="hidden" name="params" value="{params}">
+<input name="username"> <input name="password" type="password">
+<button>Login</button>
+</form>'''
+
+    @cherrypy.expose
+    def list(self) -> str:
+        """
+        Authenticated page.
+        """
+
+        self.validate_login()
+
+        return f"Logged in as {cherrypy.session['authenticated']}"
+
+class SampleSetup(Bootstrap):
+    """
+    Server setup procedure of the sample application.
+    """
+
+    @property
+    def application_id(self) -> str:
+        return 'sample'
+
+    @property
+    def description(self) -> str:
+        return 'Run a sample authenticated application'
+
+    def add_args(self, parser: ArgumentParser) -> None:
+        parser.add_argument('--fake-ldap', dest='fake_ldap', default=[],
+                            action='append', metavar='USER:PASSWORD',
+                            help='Use an in-process LDAP directory with users')
+
+    def mount(self, conf: Dict[str, Dict[str, Any]]) -> None:
+        if self.args.fake_ldap:
+            FakeLDAP.users = dict(user.split(':', 1)
+                                  for user in self.args.fake_ldap)
+            Authentication.register('ldap')(FakeLDAP)
+
+        cherrypy.config.update({'engine.autoreload.on': False})
+        cherrypy.tree.mount(Sample_Application(self.args, self.config), '/',
+                            conf)
+
+def main() -> None:
+    """
+    Main entry point.
+    """
+
+    SampleSetup().bootstrap()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark of session storage backends.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import tempfile
+import time
+from typing import Any, Dict, Type
+from cherrypy.lib.sessions import RamSession, Session
+from server.sessions import SQLiteSession
+
+def parse_args() -> Namespace:
+    """
+    Parse command line arguments.
+    """
+
+    parser = ArgumentParser(description='Measure throughput of session storage')
+    parser.add_argument('--requests', type=int, default=5000,
+                        help='Number of requests to load and save sessions for')
+    parser.add_argument('--sessions', type=int, default=100,
+                        help='Number of distinct sessions')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='Number of concurrent request threads')
+    return parser.parse_args()
+
+def run(args: Namespace, storage_class: Type[Session],
+        options: Dict[str, Any]) -> float:
+    """
+    Load, lock and save sessions from concurrent threads and return the
+    throughput.
+    """
+
+    ids = []
+    for _ in range(args.sessions):
+        session = storage_class(clean_freq=0, **options)
+        session['authenticated'] = 'user'
+        session.save()
+        ids.append(session.id)
+
+    def request(index: int) -> None:
+        session = storage_class(ids[index % len(ids)], clean_freq=0, **options)
+        session.acquire_lock()
+        if 'authenticated' not in session:
+            raise RuntimeError('Session data was lost')
+        session.save()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        list(executor.map(request, range(args.requests)))
+    duration = time.perf_counter() - start
+
+    return args.requests / duration
+
+def main() -> None:
+    """
+    Main entry point.
+    """
+
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        database = str(Path(directory) / 'sessions.db')
+        for label, storage_class, options in (
+            ('RAM', RamSession, {}),
+            ('SQLite', SQLiteSession, {'database': database})
+        ):
+            rate = run(args, storage_class, options)
+            print(f'{label} sessions: {rate:.1f} requests/s')
+
+if __name__ == '__main__':
+    main()
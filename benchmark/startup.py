@@ -0,0 +1,84 @@
+"""
+Benchmark of server startup time.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from argparse import ArgumentParser, Namespace
+import statistics
+import subprocess
+import sys
+from typing import List
+
+# Code that is timed in a fresh interpreter, which prints the duration of
+# importing the bootstrapper and listing the authentication schemes, as is done
+# before parsing command line arguments.
+STARTUP = '''
+import time
+start = time.perf_counter()
+from server.bootstrap import Bootstrap
+from server.authentication import Authentication
+types = Authentication.get_types()
+{load}
+print(time.perf_counter() - start)
+'''
+
+def parse_args() -> Namespace:
+    """
+    Parse command line arguments.
+    """
+
+    parser = ArgumentParser(description='Measure startup time of the server')
+    parser.add_argument('--runs', type=int, default=20,
+                        help='Number of interpreters to start per measurement')
+    return parser.parse_args()
+
+def run(args: Namespace, load: str) -> float:
+    """
+    Measure the median startup time in seconds in fresh interpreters, with
+    additional `load` code executed after listing authentication schemes.
+    """
+
+    code = STARTUP.format(load=load)
+    durations: List[float] = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True).stdout
+        durations.append(float(output))
+
+    return statistics.median(durations)
+
+def main() -> None:
+    """
+    Main entry point.
+    """
+
+    args = parse_args()
+    for label, load in (
+        ('Lazy schemes', ''),
+        ('Open scheme', "Authentication.get_type('open')"),
+        ('Unix scheme', "Authentication.get_type('spwd')"),
+        ('All schemes', '''
+for auth_type in types:
+    Authentication.get_type(auth_type)
+''')
+    ):
+        duration = run(args, load)
+        print(f'{label}: {duration * 1000:.1f} ms')
+
+if __name__ == '__main__':
+    main()
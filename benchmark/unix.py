@@ -0,0 +1,98 @@
+"""
+Benchmark of Unix password verification with and without a process pool.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from configparser import RawConfigParser
+import crypt
+import os
+import time
+from server.unix import Unix
+
+PASSWORD = 'benchmark'
+
+class BenchmarkUnix(Unix):
+    """
+    Unix authentication with a single user that has a fixed password hash.
+    """
+
+    crypted_password = crypt.crypt(PASSWORD, crypt.mksalt(crypt.METHOD_SHA512))
+
+    def get_crypted_password(self, username: str) -> str:
+        return self.crypted_password
+
+    def get_display_name(self, username: str) -> str:
+        return username
+
+def parse_args() -> Namespace:
+    """
+    Parse command line arguments.
+    """
+
+    parser = ArgumentParser(description='Measure throughput of Unix password verification')
+    parser.add_argument('--logins', type=int, default=400,
+                        help='Number of logins to validate per run')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='Number of concurrent request threads')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='Number of processes in the verification pool')
+    return parser.parse_args()
+
+def run(args: Namespace, processes: int) -> float:
+    """
+    Validate logins from concurrent threads and return the throughput.
+    """
+
+    config = RawConfigParser()
+    config['unix'] = {
+        'processes': str(processes),
+        'queue_size': str(args.logins),
+        'timeout': '60'
+    }
+    auth = BenchmarkUnix(Namespace(), config)
+    try:
+        # Warm up the process pool before measuring.
+        auth.validate('user', PASSWORD)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as executor:
+            results = list(executor.map(lambda _: auth.validate('user', PASSWORD),
+                                        range(args.logins)))
+        duration = time.perf_counter() - start
+    finally:
+        auth.close()
+
+    if len(results) != args.logins:
+        raise RuntimeError('Not all logins were validated')
+
+    return args.logins / duration
+
+def main() -> None:
+    """
+    Main entry point.
+    """
+
+    args = parse_args()
+    for label, processes in (('request threads', 0),
+                             (f'a pool of {args.processes}', args.processes)):
+        rate = run(args, processes)
+        print(f'Verification in {label}: {rate:.1f} logins/s')
+
+if __name__ == '__main__':
+    main()
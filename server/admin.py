@@ -0,0 +1,65 @@
+"""
+Administrative endpoints with restricted access.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hmac
+from typing import Optional, Sequence
+import cherrypy
+
+class Admin_Application:
+    # pylint: disable=too-few-public-methods
+    """
+    Web application for administration, which is only accessible to clients
+    with one of the `clients` addresses or which provide the `token` in
+    a bearer authorization header. No addresses are trusted by default, since
+    all requests behind a reverse proxy come from a local address.
+    """
+
+    # Serve the pages without redirecting to a trailing slash
+    _cp_config = {
+        'tools.trailing_slash.on': False
+    }
+
+    def __init__(self, clients: Sequence[str] = (),
+                 token: Optional[str] = None):
+        self._clients = frozenset(clients)
+        self._token = token
+
+    def _is_allowed(self) -> bool:
+        request = cherrypy.serving.request
+        if request.remote.ip in self._clients:
+            return True
+
+        if self._token is None:
+            return False
+
+        authorization = request.headers.get('Authorization', '')
+        scheme, _, token = authorization.partition(' ')
+        return scheme.lower() == 'bearer' and \
+            hmac.compare_digest(token.strip().encode('utf-8'),
+                                self._token.encode('utf-8'))
+
+    def validate_access(self) -> None:
+        """
+        Validate that the client may access the application. Raises an
+        `HTTPError` if the client is not allowed.
+        """
+
+        if not self._is_allowed():
+            raise cherrypy.HTTPError(403, 'Access is not allowed')
@@ -20,20 +20,285 @@ limitations under the License.
 
 from argparse import Namespace
 from configparser import RawConfigParser
+from contextlib import contextmanager
 import logging
-from typing import Any, Optional
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Mapping, \
+    Optional, Tuple
 from urllib.parse import quote
 import cherrypy
-from .authentication import LoginException, Authentication
+from .authentication import BackendException, LoginException, \
+    Authentication, Validation
+from .breaker import CircuitBreaker, CircuitOpenError
+from .cache import CredentialCache
+from .limiter import TokenBucketLimiter
+from .metrics import AUTHENTICATION_DURATION, LOGIN_REDIRECTS, REGISTRY, \
+    Labels, Registry, Samples
+from .routes import Route, build_routes
+from .timing import timed
+
+class RateLimitError(cherrypy.HTTPError):
+    """
+    HTTP error which indicates that too many requests were made, along with
+    the number of seconds after which the client may retry.
+    """
+
+    def __init__(self, retry_after: int, message: Optional[str] = None):
+        super().__init__(429, message)
+        self.retry_after = retry_after
+
+    def set_response(self) -> None:
+        super().set_response()
+        cherrypy.serving.response.headers['Retry-After'] = \
+            str(self.retry_after)
+
+class AuthenticationState:
+    """
+    Authentication scheme in use by an application, along with its credential
+    cache and circuit breaker.
+
+    Requests acquire the state while they use it. Once the state is replaced
+    and `retire` is called, the authentication scheme is closed when the last
+    request that uses it releases it.
+    """
+
+    def __init__(self, auth_type: str, authentication: Authentication,
+                 credential_cache: Optional[CredentialCache],
+                 breaker: CircuitBreaker):
+        self.auth_type = auth_type
+        self.authentication = authentication
+        self.credential_cache = credential_cache
+        self.breaker = breaker
+
+        self._lock = threading.Lock()
+        self._users = 0
+        self._retired = False
+
+    def validate(self, username: str, password: str) -> Validation:
+        """
+        Validate the credentials with the authentication scheme, observing the
+        duration and outcome of the validation.
+        """
+
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = self.authentication.validate(username, password)
+            outcome = 'success' if result else 'rejected'
+            return result
+        except LoginException:
+            outcome = 'rejected'
+            raise
+        finally:
+            AUTHENTICATION_DURATION.observe(time.perf_counter() - start,
+                                            self.auth_type, outcome)
+
+    def acquire(self) -> None:
+        """
+        Register that a request uses the state.
+        """
+
+        with self._lock:
+            self._users += 1
+
+    def release(self) -> None:
+        """
+        Register that a request no longer uses the state.
+        """
+
+        with self._lock:
+            self._users -= 1
+            close = self._retired and self._users == 0
+
+        if close:
+            self.authentication.close()
+
+    def retire(self) -> None:
+        """
+        Mark the state as no longer in use by new requests, and close the
+        authentication scheme when no requests use it anymore.
+        """
+
+        with self._lock:
+            self._retired = True
+            close = self._users == 0
+
+        if close:
+            self.authentication.close()
 
 class Authenticated_Application:
     """
     A Web application that requires authentication.
+
+    If the `cache_size` option in the `auth` section of the configuration is
+    set, then successful validations are cached for `cache_ttl` seconds, such
+    that repeated logins with the same credentials skip the authentication
+    scheme.
+
+    Validation by the authentication scheme fails fast for `breaker_cooldown`
+    seconds after `breaker_threshold` consecutive backend errors, as set in
+    the `auth` section of the configuration, after which single probes are
+    let through until one succeeds.
+
+    Login attempts may be limited per user name and per client address through
+    the `user_login_rate` and `client_login_rate` arguments, in attempts per
+    minute, allowing bursts of `login_burst` attempts. Rejected attempts do not
+    reach the authentication scheme.
+
+    The authentication scheme, cache and breaker are replaced with `reload`
+    when the configuration changes, while requests in progress finish with
+    the previous scheme.
     """
 
     def __init__(self, args: Namespace, config: RawConfigParser):
-        auth_type = Authentication.get_type(args.auth)
-        self.authentication = auth_type(args, config)
+        self._state_lock = threading.Lock()
+        self._state = self._create_state(args, config)
+        self._routes: Optional[Mapping[str, Route]] = None
+
+        # Login rate limits, when parsed by the bootstrapper
+        burst = int(getattr(args, 'login_burst', 5))
+        size = int(getattr(args, 'login_limit_size', 10000))
+        self._user_limiter: Optional[TokenBucketLimiter] = None
+        self._client_limiter: Optional[TokenBucketLimiter] = None
+        user_rate = float(getattr(args, 'user_login_rate', 0))
+        if user_rate > 0:
+            self._user_limiter = \
+                TokenBucketLimiter(user_rate / 60, burst, size=size)
+        client_rate = float(getattr(args, 'client_login_rate', 0))
+        if client_rate > 0:
+            self._client_limiter = \
+                TokenBucketLimiter(client_rate / 60, burst, size=size)
+
+    @staticmethod
+    def _create_state(args: Namespace, config: RawConfigParser) \
+        -> AuthenticationState:
+        auth_type = str(args.auth)
+        authentication = Authentication.get_type(auth_type)(args, config)
+
+        credential_cache: Optional[CredentialCache] = None
+        if config.has_option('auth', 'cache_size'):
+            ttl = 60.0
+            if config.has_option('auth', 'cache_ttl'):
+                ttl = config.getfloat('auth', 'cache_ttl')
+            credential_cache = \
+                CredentialCache(config.getint('auth', 'cache_size'), ttl)
+
+        threshold = 5
+        if config.has_option('auth', 'breaker_threshold'):
+            threshold = config.getint('auth', 'breaker_threshold')
+        cooldown = 30.0
+        if config.has_option('auth', 'breaker_cooldown'):
+            cooldown = config.getfloat('auth', 'breaker_cooldown')
+        breaker = CircuitBreaker(threshold, cooldown,
+                                 name=f'{auth_type} authentication',
+                                 ignore=(LoginException,),
+                                 failures=(BackendException, OSError))
+
+        return AuthenticationState(auth_type, authentication, credential_cache,
+                                   breaker)
+
+    @contextmanager
+    def _use_state(self) -> Iterator[AuthenticationState]:
+        with self._state_lock:
+            state = self._state
+            state.acquire()
+
+        try:
+            yield state
+        finally:
+            state.release()
+
+    @property
+    def authentication(self) -> Authentication:
+        """
+        Retrieve the current authentication scheme.
+        """
+
+        return self._state.authentication
+
+    @authentication.setter
+    def authentication(self, authentication: Authentication) -> None:
+        """
+        Replace the authentication scheme, keeping the circuit breaker and
+        removing validations of the previous scheme from the credential cache.
+        The previous scheme is closed when requests no longer use it.
+        """
+
+        with self._state_lock:
+            previous = self._state
+            self._state = AuthenticationState(previous.auth_type,
+                                              authentication,
+                                              previous.credential_cache,
+                                              previous.breaker)
+
+        if previous.credential_cache is not None:
+            previous.credential_cache.invalidate()
+        previous.retire()
+
+    @property
+    def login_limiters(self) -> Dict[str, TokenBucketLimiter]:
+        """
+        Retrieve the rate limiters of login attempts that are enabled, keyed
+        by `user` or `client`.
+        """
+
+        limiters = {}
+        if self._user_limiter is not None:
+            limiters['user'] = self._user_limiter
+        if self._client_limiter is not None:
+            limiters['client'] = self._client_limiter
+
+        return limiters
+
+    @property
+    def credential_cache(self) -> Optional[CredentialCache]:
+        """
+        Retrieve the cache of validated credentials, if it is enabled.
+        """
+
+        return self._state.credential_cache
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        """
+        Retrieve the circuit breaker of the authentication scheme.
+        """
+
+        return self._state.breaker
+
+    def reload(self, args: Namespace, config: RawConfigParser) -> None:
+        """
+        Replace the authentication scheme, credential cache and circuit breaker
+        with new instances based on the `args` and `config`.
+
+        If the new authentication scheme cannot be created, then the exception
+        is raised and the current scheme remains in use.
+        """
+
+        state = self._create_state(args, config)
+        with self._state_lock:
+            previous = self._state
+            self._state = state
+
+        logging.info('Replaced %s authentication with %s authentication',
+                     previous.auth_type, state.auth_type)
+        previous.retire()
+
+    @property
+    def routes(self) -> Mapping[str, Route]:
+        """
+        Retrieve the immutable table of exposed routes of the application.
+
+        The table is built when it is first used, which is after the
+        application is mounted and its handlers are set up.
+        """
+
+        if self._routes is None:
+            self._routes = build_routes(self)
+
+        return self._routes
 
     @cherrypy.expose
     def index(self, page: str = 'list', params: str = '') -> str:
@@ -60,15 +325,42 @@ class Authenticated_Application:
         not an existing exposed route.
         """
 
-        try:
-            getattr(self, page).exposed
-        except AttributeError as error:
-            # Invalid method or not exposed
-            raise cherrypy.HTTPError(400, 'Page must be valid') from error
+        if page not in self.routes:
+            raise cherrypy.HTTPError(400, 'Page must be valid')
+
+    def _limit_login(self, username: str) -> None:
+        # A limited client does not take tokens of the user, so that it cannot
+        # lock out the account of another user.
+        wait = 0.0
+        if self._client_limiter is not None:
+            wait = self._client_limiter.acquire(cherrypy.request.remote.ip)
+        if wait == 0 and self._user_limiter is not None:
+            wait = self._user_limiter.acquire(username)
+
+        if wait > 0:
+            logging.info('Rate limit exceeded for login of %s from %s',
+                         username, cherrypy.request.remote.ip)
+            raise RateLimitError(math.ceil(wait), 'Too many login attempts')
+
+    def _validate_credentials(self, username: str, password: str) \
+        -> Validation:
+        with self._use_state() as state, timed('authentication'):
+            cache = state.credential_cache
+            if cache is None:
+                return state.breaker.call(state.validate, username, password)
+
+            result = cache.get(state.auth_type, username, password)
+            if result is None:
+                result = state.breaker.call(state.validate, username,
+                                            password)
+                if result:
+                    cache.put(state.auth_type, username, password, result)
+
+            return result
 
     def _perform_login(self, username: str, password: str) -> bool:
         try:
-            result = self.authentication.validate(username, password)
+            result = self._validate_credentials(username, password)
             if not result:
                 raise LoginException('Credentials rejected')
 
@@ -82,6 +374,9 @@ class Authenticated_Application:
         except LoginException as error:
             logging.info(str(error))
             return False
+        except (BackendException, CircuitOpenError) as error:
+            logging.warning(str(error))
+            raise cherrypy.HTTPError(503, 'Authentication unavailable') from error
 
     def validate_login(self, username: Optional[str] = None,
                        password: Optional[str] = None,
@@ -108,14 +403,20 @@ class Authenticated_Application:
             cherrypy.request.method != 'POST':
             raise cherrypy.HTTPError(400, 'POST only allowed for username and password')
 
-        if username is not None and password is not None and \
-            not self._perform_login(username, password):
-            raise cherrypy.HTTPRedirect(redirect)
+        if username is not None and password is not None:
+            self._limit_login(username)
+            if not self._perform_login(username, password):
+                LOGIN_REDIRECTS.inc('rejected')
+                raise cherrypy.HTTPRedirect(redirect)
 
         if 'authenticated' not in cherrypy.session:
             logging.info('No credentials or session found')
+            LOGIN_REDIRECTS.inc('unauthenticated')
             raise cherrypy.HTTPRedirect(redirect)
 
+        # Provide the user to access logs
+        cherrypy.request.login = cherrypy.session['authenticated']
+
     @cherrypy.expose
     def login(self, username: Optional[str] = None,
               password: Optional[str] = None, page: str = 'list',
@@ -147,3 +448,145 @@ class Authenticated_Application:
             raise cherrypy.HTTPRedirect('index')
 
         raise cherrypy.NotFound()
+
+StatisticsSource = Callable[[], Iterable[Tuple[Labels, Mapping[str, Any]]]]
+
+def _mounted_applications() -> Iterator[Tuple[str, Authenticated_Application]]:
+    for script_name, app in cherrypy.tree.apps.items():
+        if isinstance(app.root, Authenticated_Application):
+            yield script_name or '/', app.root
+
+def _breaker_stats() -> Iterable[Tuple[Labels, Mapping[str, Any]]]:
+    for name, application in _mounted_applications():
+        yield (name,), application.breaker.stats
+
+def _breaker_states() -> Iterable[Tuple[Labels, float]]:
+    for name, application in _mounted_applications():
+        state = application.breaker.state
+        for value in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN,
+                      CircuitBreaker.HALF_OPEN):
+            yield (name, value), float(state == value)
+
+def _cache_stats() -> Iterable[Tuple[Labels, Mapping[str, Any]]]:
+    for name, application in _mounted_applications():
+        cache = application.credential_cache
+        if cache is not None:
+            for scheme, stats in cache.stats.items():
+                yield (name, scheme), stats
+
+def _limiter_stats() -> Iterable[Tuple[Labels, Mapping[str, Any]]]:
+    for name, application in _mounted_applications():
+        for limiter, bucket in application.login_limiters.items():
+            yield (name, limiter), bucket.stats
+
+def _pool_stats() -> Iterable[Tuple[Labels, Mapping[str, Any]]]:
+    for name, application in _mounted_applications():
+        stats = application.authentication.stats
+        for pool in ('manager', 'user'):
+            if f'{pool}_pool' in stats:
+                yield (name, pool), stats[f'{pool}_pool']
+
+def _component_stats(component: str) -> StatisticsSource:
+    def source() -> Iterable[Tuple[Labels, Mapping[str, Any]]]:
+        for name, application in _mounted_applications():
+            stats = application.authentication.stats
+            if component in stats:
+                yield (name,), stats[component]
+
+    return source
+
+def _statistic(source: StatisticsSource, key: str) \
+        -> Callable[[], Iterable[Tuple[Labels, float]]]:
+    return lambda: ((labels, stats[key]) for labels, stats in source())
+
+# Metrics of components of authenticated applications, with the name suffix,
+# help text, kind, label names, source of statistics and key in statistics
+_BREAKER = (('application',), _breaker_stats)
+_CACHE = (('application', 'scheme'), _cache_stats)
+_LIMITER = (('application', 'limiter'), _limiter_stats)
+_POOL = (('application', 'pool'), _pool_stats)
+_GROUP = (('application',), _component_stats('group'))
+_USERS = (('application',), _component_stats('user_cache'))
+_METRICS = (
+    ('authentication_breaker_trips_total',
+     'Number of times that the circuit breaker opened.', 'counter', _BREAKER,
+     'trips'),
+    ('authentication_breaker_rejected_total',
+     'Number of logins rejected while the circuit breaker was open.',
+     'counter', _BREAKER, 'rejected'),
+    ('authentication_breaker_failures_total',
+     'Number of backend errors of the authentication scheme.', 'counter',
+     _BREAKER, 'failures'),
+    ('authentication_breaker_consecutive_failures',
+     'Number of backend errors since the last success.', 'gauge', _BREAKER,
+     'consecutive_failures'),
+    ('credential_cache_hits_total',
+     'Number of credentials validated from the cache.', 'counter', _CACHE,
+     'hits'),
+    ('credential_cache_misses_total',
+     'Number of credentials not found in the cache.', 'counter', _CACHE,
+     'misses'),
+    ('credential_cache_hit_ratio',
+     'Fraction of credentials validated from the cache.', 'gauge', _CACHE,
+     'hit_rate'),
+    ('login_limiter_allowed_total',
+     'Number of login attempts allowed by the rate limiter.', 'counter',
+     _LIMITER, 'allowed'),
+    ('login_limiter_rejected_total',
+     'Number of login attempts rejected by the rate limiter.', 'counter',
+     _LIMITER, 'rejected'),
+    ('login_limiter_evictions_total',
+     'Number of rate limit buckets that were evicted.', 'counter', _LIMITER,
+     'evictions'),
+    ('login_limiter_buckets', 'Number of tracked rate limit buckets.',
+     'gauge', _LIMITER, 'size'),
+    ('ldap_pool_created_total', 'Number of LDAP connections created.',
+     'counter', _POOL, 'created'),
+    ('ldap_pool_reused_total', 'Number of times LDAP connections were reused.',
+     'counter', _POOL, 'reused'),
+    ('ldap_pool_discarded_total', 'Number of broken LDAP connections.',
+     'counter', _POOL, 'discarded'),
+    ('ldap_pool_expired_total', 'Number of idle LDAP connections closed.',
+     'counter', _POOL, 'expired'),
+    ('ldap_pool_timeouts_total',
+     'Number of times no LDAP connection became available.', 'counter',
+     _POOL, 'timeouts'),
+    ('ldap_pool_open_connections', 'Number of open LDAP connections.',
+     'gauge', _POOL, 'open'),
+    ('ldap_pool_idle_connections', 'Number of idle LDAP connections.',
+     'gauge', _POOL, 'idle'),
+    ('ldap_group_refreshes_total', 'Number of refreshes of group members.',
+     'counter', _GROUP, 'refreshes'),
+    ('ldap_group_refresh_failures_total',
+     'Number of failed refreshes of group members.', 'counter', _GROUP,
+     'failures'),
+    ('ldap_group_age_seconds',
+     'Time since the group members were refreshed.', 'gauge', _GROUP, 'age'),
+    ('ldap_group_stale', 'Whether a refresh of group members is overdue.',
+     'gauge', _GROUP, 'stale'),
+    ('ldap_group_members', 'Number of group members and whitelisted users.',
+     'gauge', _GROUP, 'members'),
+    ('ldap_user_cache_hits_total', 'Number of users found in the cache.',
+     'counter', _USERS, 'hits'),
+    ('ldap_user_cache_misses_total', 'Number of users not in the cache.',
+     'counter', _USERS, 'misses'),
+    ('ldap_user_cache_evictions_total',
+     'Number of users evicted from the cache.', 'counter', _USERS,
+     'evictions'),
+    ('ldap_user_cache_entries', 'Number of users in the cache.', 'gauge',
+     _USERS, 'size')
+)
+
+def register_authentication_metrics(registry: Registry = REGISTRY) -> None:
+    """
+    Register metrics of the circuit breakers, credential caches, login rate
+    limiters and components of authentication schemes, such as LDAP
+    connection pools, of the mounted authenticated applications.
+    """
+
+    registry.register(Samples('gros_server_authentication_breaker_state',
+                              'Current state of the circuit breaker.',
+                              ('application', 'state'), _breaker_states))
+    for name, help_text, kind, (labels, source), key in _METRICS:
+        registry.register(Samples(f'gros_server_{name}', help_text, labels,
+                                  _statistic(source, key), kind=kind))
@@ -20,48 +20,64 @@ limitations under the License.
 
 from argparse import Namespace
 from configparser import RawConfigParser
-import crypt
-import logging
-import re
-from typing import Callable, Dict, List, Optional, Tuple, Type, Union, \
-    TYPE_CHECKING
-try:
-    import pwd
-except ImportError:
-    if not TYPE_CHECKING:
-        pwd = None
-try:
-    import spwd
-except ImportError:
-    if not TYPE_CHECKING:
-        spwd = None
-try:
-    import ldap
-except ImportError:
-    if not TYPE_CHECKING:
-        ldap = None
+import importlib
+import sys
+from typing import Any, Callable, Dict, Optional, Tuple, Type, Union
 
 Validation = Union[bool, str]
+Statistics = Dict[str, Union[int, float, bool]]
+
+ENTRY_POINT_GROUP = 'gros_server.authentication'
+
+# Schemes that are defined in their own modules, which are still importable
+# from this module
+_SCHEME_MODULES = {
+    'UnixDatabase': 'unix',
+    'Unix': 'unix',
+    'UnixPwd': 'unix',
+    'UnixSpwd': 'unix',
+    'MembershipIndex': 'directory',
+    'LDAP': 'directory'
+}
 
 class LoginException(RuntimeError):
     """
     Exception that indicates a login error.
     """
 
+class BackendException(RuntimeError):
+    """
+    Exception that indicates that the authentication backend is unable to
+    handle a login at this moment.
+    """
+
 class Authentication:
     """
     Authentication scheme.
+
+    Schemes are registered by name, either directly with a class or lazily
+    with an import path of the form `module:class`, in which case the module
+    is only imported when the scheme is first retrieved. Schemes of other
+    packages are discovered through entry points in the
+    `gros_server.authentication` group.
     """
 
-    _auth_types: Dict[str, Type['Authentication']] = {}
+    _auth_types: Dict[str, Union[Type['Authentication'], str]] = {}
+    _discovered = False
 
     @classmethod
-    def register(cls, auth_type: str) -> \
+    def register(cls, auth_type: str, path: Optional[str] = None) -> \
         Callable[[Type['Authentication']], Type['Authentication']]:
         """
         Decorator method for a class that registers a certain `auth_type`.
+
+        If an import `path` is given, then the scheme is registered lazily and
+        the decorator need not be used.
         """
 
+        if path is not None:
+            cls._auth_types[auth_type] = path
+
         def decorator(subject: Type['Authentication']) \
             -> Type['Authentication']:
             """
@@ -75,16 +91,47 @@ class Authentication:
 
         return decorator
 
+    @classmethod
+    def _discover(cls) -> None:
+        if cls._discovered:
+            return
+
+        cls._discovered = True
+
+        # Reading package metadata is deferred until the schemes are needed.
+        # pylint: disable=import-outside-toplevel
+        from importlib.metadata import entry_points
+        if sys.version_info >= (3, 10):
+            entries = entry_points(group=ENTRY_POINT_GROUP)
+        else:
+            entries = entry_points().get(ENTRY_POINT_GROUP, [])
+
+        for entry in entries:
+            cls._auth_types.setdefault(entry.name, entry.value)
+
     @classmethod
     def get_type(cls, auth_type: str) -> Type['Authentication']:
         """
         Retrieve the class registered for the given `auth_type` string.
         """
 
+        if auth_type not in cls._auth_types:
+            cls._discover()
         if auth_type not in cls._auth_types:
             raise RuntimeError(f'Authentication type {auth_type} is not supported')
 
-        return cls._auth_types[auth_type]
+        subject = cls._auth_types[auth_type]
+        if isinstance(subject, str):
+            module_name, _, name = subject.partition(':')
+            loaded = getattr(importlib.import_module(module_name), name)
+            if not isinstance(loaded, type) or \
+                not issubclass(loaded, Authentication):
+                raise RuntimeError(f'{subject} is not an authentication scheme')
+
+            subject = loaded
+            cls._auth_types[auth_type] = subject
+
+        return subject
 
     @classmethod
     def get_types(cls) -> Tuple[str, ...]:
@@ -92,12 +139,28 @@ class Authentication:
         Retrieve the authentication type names.
         """
 
+        cls._discover()
         return tuple(cls._auth_types.keys())
 
     def __init__(self, args: Namespace, config: RawConfigParser):
         self.args = args
         self.config = config
 
+    def _get_float(self, section: str, option: str, default: float) -> float:
+        if self.config.has_option(section, option):
+            return self.config.getfloat(section, option)
+
+        return default
+
+    @property
+    def stats(self) -> Dict[str, Statistics]:
+        """
+        Retrieve counters of components of the authentication scheme, such as
+        connection pools and caches, keyed by the name of the component.
+        """
+
+        return {}
+
     def validate(self, username: str, password: str) -> Validation:
         """
         Validate the login of a user with the given password.
@@ -109,6 +172,11 @@ class Authentication:
 
         raise NotImplementedError('Must be implemented by subclasses')
 
+    def close(self) -> None:
+        """
+        Release any resources held by the authentication scheme.
+        """
+
 @Authentication.register('open')
 class Open(Authentication):
     """
@@ -126,155 +194,16 @@ class Open(Authentication):
     def validate(self, username: str, password: str) -> Validation:
         return username != ''
 
-class Unix(Authentication):
-    """
-    Authentication based on Unix password databases.
-    """
-
-    def get_crypted_password(self, username: str) -> str:
-        """
-        Retrieve the crypted password for the username from the database.
-
-        If the password cannot be retrieved, a `LoginException` is raised.
-        """
-
-        raise NotImplementedError('Must be implemented in subclasses')
-
-    def get_display_name(self, username: str) -> str:
-        """
-        Retrieve the display name for the username.
-
-        If the display name is unavailable, then the username is returned.
-        """
-
-        try:
-            display_name = pwd.getpwnam(username).pw_gecos.split(',', 1)[0]
-        except KeyError:
-            return username
-
-        if display_name == '':
-            return username
-
-        return display_name
-
-    def validate(self, username: str, password: str) -> Validation:
-        crypted_password = self.get_crypted_password(username)
-        if crypted_password in ('', 'x', '*', '********'):
-            raise LoginException(f'Password is disabled for {username}')
-
-        if crypt.crypt(password, crypted_password) == crypted_password:
-            return self.get_display_name(username)
-
-        raise LoginException('Invalid credentials')
-
-@Authentication.register('pwd')
-class UnixPwd(Unix):
-    """
-    Authentication using the `/etc/passwd` database.
-    """
-
-    def __init__(self, args: Namespace, config: RawConfigParser):
-        super().__init__(args, config)
-        if pwd is None:
-            raise ImportError('pwd not available on this platform')
-
-    def get_crypted_password(self, username: str) -> str:
-        try:
-            return pwd.getpwnam(username).pw_passwd
-        except KeyError as error:
-            raise LoginException(f'User {username} does not exist') from error
-
-@Authentication.register('spwd')
-class UnixSpwd(Unix):
-    """
-    Authentication using the `/etc/shadow` privileged database.
-    """
-
-    def __init__(self, args: Namespace, config: RawConfigParser):
-        super().__init__(args, config)
-        if spwd is None:
-            raise ImportError('spwd not available on this platform')
-
-    def get_crypted_password(self, username: str) -> str:
-        try:
-            return spwd.getspnam(username).sp_pwdp
-        except KeyError as error:
-            raise LoginException(f'User {username} does not exist') from error
-
-@Authentication.register('ldap')
-class LDAP(Authentication):
-    """
-    LDAP group-based authentication scheme.
-    """
+# Schemes with platform-specific or optional dependencies are only imported
+# when they are used
+Authentication.register('pwd', f'{__package__}.unix:UnixPwd')
+Authentication.register('spwd', f'{__package__}.unix:UnixSpwd')
+Authentication.register('ldap', f'{__package__}.directory:LDAP')
 
-    def __init__(self, args: Namespace, config: RawConfigParser):
-        super().__init__(args, config)
-        if ldap is None:
-            raise ImportError('Unable to use LDAP; install the python-ldap package')
-
-        self._group = self._retrieve_ldap_group()
-        self._whitelist: List[str] = []
-        if config.has_option('ldap', 'whitelist'):
-            self._whitelist = re.split(r'\s*(?<!\\),\s*',
-                                       self.config.get('ldap', 'whitelist'))
-
-    def _retrieve_ldap_group(self) -> List[str]:
-        logging.info('Retrieving LDAP group list using manager DN...')
-        group_attr = self.config.get('ldap', 'group_attr')
-        result = self._query_ldap(self.config.get('ldap', 'manager_dn'),
-                                  self.config.get('ldap', 'manager_password'),
-                                  search=self.config.get('ldap', 'group_dn'),
-                                  search_attrs=[str(group_attr)])
-        if isinstance(result, bool):
-            raise ValueError('Invalid LDAP response')
-        group = result[0][1]
-        return [username.decode('utf-8') for username in group[group_attr]]
-
-    def _query_ldap(self, username: str, password: str,
-                    search: Optional[str] = None,
-                    search_attrs: Optional[List[str]] = None) \
-        -> Union[bool, List[Tuple[str, Dict[str, List[bytes]]]]]:
-        client = ldap.initialize(self.config.get('ldap', 'server'))
-        # Synchronous bind
-        client.set_option(ldap.OPT_REFERRALS, 0)
-
-        try:
-            client.simple_bind_s(username, password)
-            if search is not None:
-                return client.search_s(self.config.get('ldap', 'root_dn'),
-                                       ldap.SCOPE_SUBTREE, search,
-                                       search_attrs)
-
-            return True
-        except (ldap.INVALID_CREDENTIALS, ldap.UNWILLING_TO_PERFORM):
-            return False
-        finally:
-            client.unbind()
-
-    def _validate_ldap(self, username: str, password: str) -> str:
-        # Pre-check: user in group or whitelist?
-        if username not in self._group and username not in self._whitelist:
-            raise LoginException(f'User {username} not in group')
-
-        # Next check: get DN from uid
-        search = self.config.get('ldap', 'search_filter').format(username)
-        display_name_field = str(self.config.get('ldap', 'display_name'))
-        result = self._query_ldap(self.config.get('ldap', 'manager_dn'),
-                                  self.config.get('ldap', 'manager_password'),
-                                  search=search,
-                                  search_attrs=[display_name_field])
-        if isinstance(result, bool):
-            raise ValueError('Invalid LDAP response')
-
-        # Retrieve DN and display name
-        login_name = result[0][0]
-        display_name = result[0][1][display_name_field][0].decode('utf-8')
-
-        # Final check: log in
-        if self._query_ldap(login_name, password):
-            return display_name
-
-        raise LoginException('Credentials invalid')
+def __getattr__(name: str) -> Any:
+    if name in _SCHEME_MODULES:
+        module = importlib.import_module(f'.{_SCHEME_MODULES[name]}',
+                                         __package__)
+        return getattr(module, name)
 
-    def validate(self, username: str, password: str) -> Validation:
-        return self._validate_ldap(username, password)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -19,17 +19,39 @@ limitations under the License.
 """
 
 from argparse import ArgumentParser, Namespace
+import atexit
 import logging.config
+import os
 from pathlib import Path
+import socket
 import sys
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, Optional, Sequence, Union
 import cherrypy
 import cherrypy.daemon
+from cherrypy._cpwsgi_server import CPWSGIServer
+from cherrypy.lib.sessions import RamSession
+from cherrypy.process.plugins import Daemonizer, Monitor
 from gatherer.config import Configuration
 from gatherer.log import Log_Setup
 from . import __version__ as VERSION
+from .application import Authenticated_Application, \
+    register_authentication_metrics
 from .authentication import Authentication
 from .dispatcher import HostDispatcher
+from .log import LogQueue
+from .metrics import REGISTRY, Callback, Metrics_Application, \
+    register_thread_pool
+from .profiler import PROFILER, Profile_Application
+from .routes import Routes_Application
+from .sessions import SESSION_FREE, CookieSession, SQLiteSession, \
+    read_session_keys
+from .sockets import ListeningSocketServer, open_listener, use_socket
+from .threadpool import MonitoredThreadPool
+from .timing import StructuredAccessFilter
+from .workers import Supervisor, share_port
+
+# File mode creation mask of the daemon, since daemonizing clears the mask
+DAEMON_UMASK = 0o027
 
 class Bootstrap:
     """
@@ -39,6 +61,10 @@ class Bootstrap:
     def __init__(self) -> None:
         self.config = Configuration.get_settings()
         self._args: Optional[Namespace] = None
+        self.log_queue: Optional[LogQueue] = None
+        # Relative paths in arguments refer to the directory at startup, even
+        # if the working directory changes later on
+        self._directory = Path.cwd()
 
     @property
     def application_id(self) -> str:
@@ -50,6 +76,18 @@ class Bootstrap:
 
         return ''
 
+    @property
+    def session_free_paths(self) -> Sequence[str]:
+        """
+        Retrieve path prefixes of the application that do not use sessions,
+        such as static files and health checks.
+
+        Handlers can also be marked with the `server.sessions.session_free`
+        decorator.
+        """
+
+        return ()
+
     @property
     def description(self) -> str:
         """
@@ -87,17 +125,53 @@ class Bootstrap:
                             help='Display logging in terminal and traces on web')
         parser.add_argument('--log-path', dest='log_path', default='.',
                             help='Path to store logs at in production')
+        parser.add_argument('--log-queue', dest='log_queue', type=int,
+                            default=0,
+                            help='Log records to queue for a writer thread, or 0 to write directly')
+        parser.add_argument('--access-log', dest='access_log',
+                            choices=('combined', 'json'), default='combined',
+                            help='Format of access log, json with phase timings')
         parser.add_argument('--auth', choices=Authentication.get_types(),
                             default=auth, help='Authentication scheme')
         parser.add_argument('--host', default=None,
                             help='Hostname to validate before allowing access')
         parser.add_argument('--port', type=int, default=8080,
                             help='Port for the server to listen on')
+        parser.add_argument('--socket-path', dest='socket_path', default=None,
+                            help='Unix domain socket to listen on instead of the port')
+        parser.add_argument('--socket-mode', dest='socket_mode',
+                            type=lambda mode: int(mode, 8), default='660',
+                            help='Octal permissions of the Unix domain socket')
         parser.add_argument('--daemonize', action='store_true', default=False,
                             help='Run the server as a daemon')
         parser.add_argument('--pidfile', help='Store process ID in file')
-        parser.add_argument('--expiry', type=int, default=12 * 60,
-                            help='Number of minutes that session cookies are valid')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes to pre-fork')
+        parser.add_argument('--threads', type=int, default=10,
+                            help='Number of threads to handle requests')
+        parser.add_argument('--max-threads', dest='max_threads', type=int,
+                            default=-1,
+                            help='Maximum number of threads, or -1 for no limit')
+        parser.add_argument('--adaptive-threads', dest='adaptive_threads',
+                            action='store_true', default=False,
+                            help='Grow and shrink threads based on queued connections')
+        parser.add_argument('--socket-queue', dest='socket_queue', type=int,
+                            default=5,
+                            help='Number of connections to queue on the socket')
+        self._add_session_args(parser)
+        parser.add_argument('--user-login-rate', dest='user_login_rate',
+                            type=float, default=0,
+                            help='Login attempts per minute for each username')
+        parser.add_argument('--client-login-rate', dest='client_login_rate',
+                            type=float, default=0,
+                            help='Login attempts per minute for each client')
+        parser.add_argument('--login-burst', dest='login_burst', type=int,
+                            default=5, help='Login attempts allowed in a burst')
+        parser.add_argument('--login-limit-size', dest='login_limit_size',
+                            type=int, default=10000,
+                            help='Number of users and clients to track limits')
+
+        self._add_admin_args(parser)
 
         server = parser.add_mutually_exclusive_group()
         server.add_argument('--fastcgi', action='store_true', default=False,
@@ -108,7 +182,75 @@ class Bootstrap:
                             help='Start a CGI server instead of the HTTP')
 
         self.add_args(parser)
-        return parser.parse_args(args=sys.argv[1:])
+        args = parser.parse_args(args=sys.argv[1:])
+        if args.session_store == 'cookie' and args.session_key_file is None:
+            parser.error('--session-key-file is required for cookie sessions')
+        if args.workers > 1 and (args.fastcgi or args.scgi or args.cgi):
+            parser.error('--workers is only supported for the HTTP server')
+        if (args.metrics or args.profile_endpoint or args.routes_endpoint) and \
+            args.admin_clients.strip(', ') == '' and \
+            args.admin_token_file is None:
+            parser.error('Admin endpoints require --admin-clients or --admin-token-file')
+        if args.socket_mode & ~0o777:
+            parser.error('--socket-mode must only contain permission bits')
+        if args.log_queue < 0:
+            parser.error('--log-queue must not be negative')
+        if args.profile < 0 or args.profile_threshold < 0:
+            parser.error('--profile and --profile-threshold must not be negative')
+        if args.threads < 1:
+            parser.error('--threads must be at least 1')
+        if args.adaptive_threads and args.max_threads <= args.threads:
+            parser.error('--adaptive-threads requires --max-threads above --threads')
+
+        return args
+
+    @staticmethod
+    def _add_session_args(parser: ArgumentParser) -> None:
+        """
+        Register arguments for the storage and lifetime of sessions.
+        """
+
+        parser.add_argument('--expiry', type=int, default=12 * 60,
+                            help='Number of minutes that session cookies are valid')
+        parser.add_argument('--session-store', dest='session_store',
+                            choices=('ram', 'cookie', 'sqlite'),
+                            default='ram', help='Storage of session data')
+        parser.add_argument('--session-path', dest='session_path',
+                            default='sessions.db',
+                            help='Database file shared by processes for sqlite sessions')
+        parser.add_argument('--lazy-sessions', dest='lazy_sessions',
+                            action='store_true', default=False,
+                            help='Only load sessions when handlers use them')
+        parser.add_argument('--session-key-file', dest='session_key_file',
+                            default=None,
+                            help='File with keys to sign session cookies')
+
+    @staticmethod
+    def _add_admin_args(parser: ArgumentParser) -> None:
+        """
+        Register arguments for metrics, profiling and route listing endpoints.
+        """
+
+        admin = parser.add_argument_group('administration')
+        admin.add_argument('--metrics', action='store_true', default=False,
+                           help='Expose metrics in Prometheus format at /metrics')
+        admin.add_argument('--profile', type=float, default=0,
+                           help='Seconds to profile request threads after starting')
+        admin.add_argument('--profile-threshold', dest='profile_threshold',
+                           type=float, default=0,
+                           help='Only profile requests taking at least these seconds')
+        admin.add_argument('--profile-endpoint', dest='profile_endpoint',
+                           action='store_true', default=False,
+                           help='Start the profiler through /profile/start')
+        admin.add_argument('--routes-endpoint', dest='routes_endpoint',
+                           action='store_true', default=False,
+                           help='List exposed routes of applications at /routes')
+        admin.add_argument('--admin-clients', dest='admin_clients',
+                           default='',
+                           help='Comma-separated clients allowed to use admin endpoints')
+        admin.add_argument('--admin-token-file', dest='admin_token_file',
+                           default=None,
+                           help='File with bearer token to use admin endpoints')
 
     def add_args(self, parser: ArgumentParser) -> None:
         """
@@ -117,21 +259,37 @@ class Bootstrap:
 
         raise NotImplementedError('Must be overridden by subclasses')
 
-    def _build_log_file_handler(self, filename: str) \
+    def _resolve_path(self, path: str) -> Path:
+        """
+        Resolve a path from the arguments relative to the working directory
+        in which the server was started.
+        """
+
+        return (self._directory / path).resolve()
+
+    def _build_log_file_handler(self, filename: str,
+                                worker: Optional[int] = None) \
         -> Dict[str, Union[str, int]]:
+        path = self._resolve_path(self.args.log_path) / filename
+        if worker is not None:
+            path = path.with_name(f'{path.stem}.{worker}{path.suffix}')
+
         return {
             'level': str(self.args.log),
-            'class': 'logging.handlers.RotatingFileHandler',
-            'filename': str(Path(self.args.log_path) / filename),
+            'class': 'server.log.CompressedRotatingFileHandler'
+                if self.args.log_queue else
+                'logging.handlers.RotatingFileHandler',
+            'filename': str(path),
             'formatter': 'void',
             'maxBytes': 10485760,
             'backupCount': 20,
             'encoding': 'utf8'
         }
 
-    def _setup_log(self) -> None:
+    def _setup_log(self, worker: Optional[int] = None) -> None:
         """
-        Setup logging.
+        Setup logging. If `worker` is provided, then the log files of the
+        worker process contain the number in their names.
         """
 
         log_level = str(self.args.log)
@@ -144,7 +302,7 @@ class Bootstrap:
             'stream': 'ext://sys.stdout'
         }
 
-        config = {
+        config: Dict[str, Any] = {
             'version': 1,
             'formatters': {
                 'void': {
@@ -157,9 +315,11 @@ class Bootstrap:
             'handlers': {
                 'default': stream_handler.copy(),
                 'cherrypy_console': stream_handler.copy(),
-                'cherrypy_access': self._build_log_file_handler('access.log'),
-                'cherrypy_error': self._build_log_file_handler('error.log'),
-                'python': self._build_log_file_handler('python.log')
+                'cherrypy_access':
+                    self._build_log_file_handler('access.log', worker),
+                'cherrypy_error':
+                    self._build_log_file_handler('error.log', worker),
+                'python': self._build_log_file_handler('python.log', worker)
             },
             'loggers': {
                 '': {
@@ -178,8 +338,59 @@ class Bootstrap:
                 },
             }
         }
+        if self.args.access_log == 'json':
+            # Replace the default access log lines with structured records
+            config['filters'] = {
+                'structured_access': {
+                    '()': StructuredAccessFilter
+                }
+            }
+            for handler in ('cherrypy_console', 'cherrypy_access'):
+                config['handlers'][handler]['filters'] = ['structured_access']
+
         logging.config.dictConfig(config)
 
+        # Request threads only put records on the queue, while a thread writes
+        # them in batches, until the engine exits.
+        if self.args.log_queue:
+            self.log_queue = LogQueue(size=self.args.log_queue)
+            self.log_queue.install(['', 'cherrypy.access', 'cherrypy.error'])
+            cherrypy.engine.subscribe('exit', self.log_queue.stop,
+                                      priority=100)
+            atexit.register(self.log_queue.stop)
+
+    def _build_session_config(self) -> Dict[str, Any]:
+        """
+        Build the configuration of the sessions tool.
+        """
+
+        name = f'{self.application_id}_session'
+        options: Dict[str, Any] = {
+            'on': True,
+            'name': name,
+            'httponly': True,
+            'timeout': self.args.expiry
+        }
+        if self.args.session_store == 'cookie':
+            options.update({
+                'storage_class': CookieSession,
+                'signing_keys':
+                    read_session_keys(self.args.session_key_file)
+            })
+        elif self.args.session_store == 'sqlite':
+            # Resolve the database relative to the directory at startup
+            options.update({
+                'storage_class': SQLiteSession,
+                'database': str(self._resolve_path(self.args.session_path))
+            })
+
+        tool = 'lazy_sessions' if self.args.lazy_sessions else 'sessions'
+        conf = {f'tools.{tool}.{key}': value for key, value in options.items()}
+
+        # The cookie name is also used when expiring the session on logout.
+        conf['tools.sessions.name'] = name
+        return conf
+
     def mount(self, conf: Dict[str, Dict[str, Any]]) -> None:
         """
         Mount the application on the server. `conf` is a dictionary of cherrypy
@@ -188,6 +399,106 @@ class Bootstrap:
 
         raise NotImplementedError('Must be implemented by subclasses')
 
+    def reload(self) -> None:
+        """
+        Read the configuration and arguments again, and replace the
+        authentication scheme of the mounted applications whose root is an
+        authenticated application.
+
+        If the configuration cannot be loaded, then an error is logged and the
+        previous configuration remains in use.
+        """
+
+        logging.info('Reloading configuration')
+        try:
+            Configuration.clear()
+            self.config = Configuration.get_settings()
+            self._args = self._parse_args()
+            for app in cherrypy.tree.apps.values():
+                if isinstance(app.root, Authenticated_Application):
+                    app.root.reload(self.args, self.config)
+        except (Exception, SystemExit): # pylint: disable=broad-exception-caught
+            logging.exception('Could not reload configuration')
+
+    def _build_http_server(self, listener: Optional[socket.socket] = None) \
+        -> CPWSGIServer:
+        """
+        Create the HTTP server with a thread pool that is monitored and, if
+        enabled, adapted to the number of queued connections. If a `listener`
+        socket is provided, then the server accepts connections on it.
+        """
+
+        httpserver: CPWSGIServer
+        if listener is None:
+            httpserver = CPWSGIServer(cherrypy.server)
+        else:
+            httpserver = ListeningSocketServer(cherrypy.server, listener)
+        pool = MonitoredThreadPool.replace(httpserver)
+        if self.args.metrics:
+            register_thread_pool(pool)
+        Monitor(cherrypy.engine,
+                lambda: pool.monitor(adaptive=self.args.adaptive_threads),
+                frequency=5, name='Thread pool monitor').subscribe()
+        return httpserver
+
+    def _mount_admin(self) -> None:
+        """
+        Mount the metrics, profiler and route listing endpoints, if enabled,
+        register metrics of the session storage and start the profiler if
+        requested.
+        """
+
+        if self.args.profile > 0:
+            # Start sampling in the process that runs the engine, after any
+            # daemonizing or forking of workers.
+            cherrypy.engine.subscribe('start', lambda: PROFILER.start(
+                self.args.profile, threshold=self.args.profile_threshold,
+                path=self._resolve_path(self.args.log_path)
+            ), priority=80)
+
+        if not self.args.metrics and not self.args.profile_endpoint and \
+            not self.args.routes_endpoint:
+            return
+
+        token: Optional[str] = None
+        if self.args.admin_token_file is not None:
+            path = Path(self.args.admin_token_file)
+            token = path.read_text(encoding='utf-8').strip()
+        clients = [
+            client.strip() for client in self.args.admin_clients.split(',')
+            if client.strip() != ''
+        ]
+
+        if self.args.profile_endpoint:
+            cherrypy.tree.mount(Profile_Application(
+                path=self._resolve_path(self.args.log_path),
+                threshold=self.args.profile_threshold,
+                clients=clients, token=token
+            ), '/profile')
+
+        if self.args.routes_endpoint:
+            cherrypy.tree.mount(Routes_Application(clients=clients,
+                                                   token=token), '/routes')
+
+        if not self.args.metrics:
+            return
+
+        # Signed cookies are not stored by the server
+        if self.args.session_store == 'ram':
+            REGISTRY.register(Callback('gros_server_sessions_active',
+                                       'Number of stored sessions.',
+                                       lambda: len(RamSession.cache)))
+        elif self.args.session_store == 'sqlite':
+            database = str(self._resolve_path(self.args.session_path))
+            REGISTRY.register(Callback(
+                'gros_server_sessions_active', 'Number of stored sessions.',
+                lambda: len(SQLiteSession(database=database))
+            ))
+
+        register_authentication_metrics()
+        cherrypy.tree.mount(Metrics_Application(clients=clients, token=token),
+                            '/metrics')
+
     def bootstrap(self) -> None:
         """
         Start the WSGI server.
@@ -205,21 +516,87 @@ class Bootstrap:
                 'request.show_tracebacks': self.args.debug
             },
             '/': {
-                'tools.sessions.on': True,
-                'tools.sessions.name': f'{self.application_id}_session',
-                'tools.sessions.httponly': True,
-                'tools.sessions.expiry': self.args.expiry,
+                **self._build_session_config(),
                 'request.dispatch': HostDispatcher(host=self.args.host,
                                                    port=self.args.port),
-                'response.headers.server': server
+                'response.headers.server': server,
+                'tools.timing.on': self.args.access_log == 'json',
+                'tools.metrics.on': self.args.metrics,
+                'tools.profiler.on':
+                    self.args.profile > 0 or self.args.profile_endpoint
             }
         }
-        cherrypy.config.update({'server.socket_port': self.args.port})
+        for path in self.session_free_paths:
+            conf[path] = SESSION_FREE.copy()
+
+        cherrypy.config.update({
+            'server.socket_port': self.args.port,
+            'server.socket_file': self.args.socket_path,
+            'server.thread_pool': self.args.threads,
+            'server.thread_pool_max': self.args.max_threads,
+            'server.socket_queue_size': self.args.socket_queue
+        })
+
+        # Reload the configuration on SIGHUP instead of restarting
+        if cherrypy.engine.signal_handler is not None:
+            cherrypy.engine.signal_handler.handlers['SIGHUP'] = self.reload
+
+        # Sockets inherited from systemd are only passed to this process, while
+        # a Unix socket is bound once and shared by workers and restarts.
+        http = not (self.args.fastcgi or self.args.scgi or self.args.cgi)
+        listener = None
+        if http:
+            listener = open_listener(self.args.socket_path,
+                                     self.args.socket_queue,
+                                     self.args.socket_mode)
+
+        if self.args.workers > 1:
+            if self.args.daemonize:
+                Daemonizer.daemonize()
+                os.umask(DAEMON_UMASK)
+
+            supervisor = Supervisor(self.args.workers,
+                                    lambda: self._start_worker(conf, listener),
+                                    reload=self.reload,
+                                    pidfile=self.args.pidfile)
+            supervisor.start()
+            return
 
         # Start the application and server daemon.
+        if listener is not None:
+            use_socket(self._build_http_server(listener))
+        elif http:
+            cherrypy.server.instance = self._build_http_server()
         self.mount(conf)
+        self._mount_admin()
+        if self.args.daemonize:
+            # Restrict the mask right after the daemonizer of the engine
+            cherrypy.engine.subscribe('start',
+                                      lambda: os.umask(DAEMON_UMASK),
+                                      priority=66)
         cherrypy.daemon.start(daemonize=self.args.daemonize,
                               pidfile=self.args.pidfile,
                               fastcgi=self.args.fastcgi,
                               scgi=self.args.scgi,
                               cgi=self.args.cgi)
+
+    def _start_worker(self, conf: Dict[str, Dict[str, Any]],
+                      listener: Optional[socket.socket]) -> None:
+        """
+        Start the application and server in a worker process, which shares the
+        port or the `listener` socket with the other workers.
+        """
+
+        # Workers rotate their own log files instead of those of the supervisor
+        if self.log_queue is not None:
+            self.log_queue.stop()
+        self._setup_log(worker=os.getpid())
+
+        httpserver = self._build_http_server(listener)
+        if listener is None:
+            share_port(httpserver)
+        else:
+            use_socket(httpserver)
+        self.mount(conf)
+        self._mount_admin()
+        cherrypy.daemon.start()
@@ -0,0 +1,173 @@
+"""
+Circuit breaker for calls to backends.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, Type, TypeVar, Union
+
+Result = TypeVar('Result')
+
+class CircuitOpenError(RuntimeError):
+    """
+    Exception that indicates that a call was rejected because the circuit is
+    open.
+    """
+
+class CircuitBreaker:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Circuit breaker which stops calling a backend after `threshold` consecutive
+    failures.
+
+    While the circuit is open, calls fail fast with a `CircuitOpenError`. After
+    `cooldown` seconds, at most `probes` calls are let through at a time to
+    test the backend: a success closes the circuit again while a failure
+    reopens it. Only exceptions of the types in `failures` count as failures,
+    while exceptions of the types in `ignore` indicate that the backend is
+    working and count as successes. Other exceptions, such as programming
+    errors, do not change the state of the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0,
+                 probes: int = 1, name: str = 'backend',
+                 ignore: Tuple[Type[BaseException], ...] = (), *,
+                 failures: Tuple[Type[BaseException], ...] = (Exception,)):
+        # pylint: disable=too-many-arguments
+        if threshold < 1:
+            raise ValueError('Threshold must be at least 1')
+
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._probes = probes
+        self._name = name
+        self._ignore = ignore
+        self._failure_types = failures
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened = 0.0
+        self._active_probes = 0
+        self._stats = {
+            'trips': 0,
+            'rejected': 0,
+            'failures': 0
+        }
+
+    @property
+    def state(self) -> str:
+        """
+        Retrieve the current state of the circuit.
+        """
+
+        with self._lock:
+            if self._state == self.OPEN and \
+                time.monotonic() - self._opened >= self._cooldown:
+                return self.HALF_OPEN
+
+            return self._state
+
+    @property
+    def stats(self) -> Dict[str, Union[str, int]]:
+        """
+        Retrieve the state and counters of the circuit breaker.
+        """
+
+        state = self.state
+        with self._lock:
+            stats: Dict[str, Union[str, int]] = dict(self._stats)
+            stats['state'] = state
+            stats['consecutive_failures'] = self._failures
+
+        return stats
+
+    def _enter(self) -> bool:
+        # Check whether a call may be made. Returns whether it is a probe.
+        with self._lock:
+            if self._state == self.CLOSED:
+                return False
+
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened < self._cooldown:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(f'{self._name} circuit is open')
+
+                logging.info('%s circuit is half-open, probing', self._name)
+                self._state = self.HALF_OPEN
+
+            if self._active_probes >= self._probes:
+                self._stats['rejected'] += 1
+                raise CircuitOpenError(f'{self._name} circuit is half-open')
+
+            self._active_probes += 1
+            return True
+
+    def _exit(self, probe: bool, success: Optional[bool]) -> None:
+        # Track the outcome of a call, where None leaves the state unchanged.
+        with self._lock:
+            if probe:
+                self._active_probes -= 1
+
+            if success is None:
+                return
+
+            if success:
+                if self._state != self.CLOSED:
+                    logging.info('%s circuit is closed', self._name)
+                self._state = self.CLOSED
+                self._failures = 0
+                return
+
+            self._failures += 1
+            self._stats['failures'] += 1
+            if self._state == self.HALF_OPEN or \
+                (self._state == self.CLOSED and
+                 self._failures >= self._threshold):
+                logging.warning('%s circuit is open after %d failures',
+                                self._name, self._failures)
+                self._state = self.OPEN
+                self._opened = time.monotonic()
+                self._stats['trips'] += 1
+
+    def call(self, function: Callable[..., Result], *args: object) -> Result:
+        """
+        Call the `function` with the `args` if the circuit allows it.
+        """
+
+        probe = self._enter()
+        try:
+            result = function(*args)
+        except self._ignore:
+            self._exit(probe, True)
+            raise
+        except self._failure_types:
+            self._exit(probe, False)
+            raise
+        except BaseException:
+            self._exit(probe, None)
+            raise
+
+        self._exit(probe, True)
+        return result
@@ -0,0 +1,334 @@
+"""
+Caches for authentication results and data retrieved from backends.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from collections import OrderedDict
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Callable, Dict, Generic, Hashable, Optional, Tuple, \
+    TypeVar, Union
+
+Key = TypeVar('Key', bound=Hashable)
+Value = TypeVar('Value')
+
+class LRUCache(Generic[Key, Value]):
+    """
+    Thread-safe cache of at most `size` entries which expire `ttl` seconds
+    after they were stored.
+
+    When the cache is full, the least recently used entry is evicted. A size of
+    zero disables the cache.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self._size = size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Key, Tuple[Value, float]] = OrderedDict()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Retrieve counters of the cache, including its current size.
+        """
+
+        with self._lock:
+            stats = self._stats.copy()
+            stats['size'] = len(self._entries)
+
+        return stats
+
+    def get(self, key: Key) -> Optional[Value]:
+        """
+        Retrieve the value for the `key`, or `None` if it is not cached or it
+        has expired.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def put(self, key: Key, value: Value) -> None:
+        """
+        Store the `value` for the `key`, evicting the least recently used
+        entry if the cache is full.
+        """
+
+        if self._size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self._ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key: Key) -> bool:
+        """
+        Remove the entry for the `key`. Returns whether it was cached.
+        """
+
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return False
+
+            self._stats['invalidations'] += 1
+            return True
+
+    def invalidate_matching(self, predicate: Callable[[Key, Value], bool]) \
+        -> int:
+        """
+        Remove all entries for which the `predicate` holds. Returns the number
+        of removed entries.
+        """
+
+        with self._lock:
+            keys = [
+                key for key, (value, _) in self._entries.items()
+                if predicate(key, value)
+            ]
+            for key in keys:
+                del self._entries[key]
+
+            self._stats['invalidations'] += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        """
+        Remove all entries from the cache.
+        """
+
+        with self._lock:
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+class CredentialCache:
+    """
+    Cache of credentials that were recently validated by an authentication
+    scheme, along with the result of the validation.
+
+    The credentials are never stored in plain text. Entries are identified by
+    an HMAC of the scheme, user name and password, keyed with a random secret
+    that is generated for each cache and acts as its salt.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self._secret = secrets.token_bytes(32)
+        self._cache: LRUCache[bytes, Tuple[str, str, Union[bool, str]]] = \
+            LRUCache(size, ttl)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _digest(self, scheme: str, username: str, password: str) -> bytes:
+        message = b''.join(
+            len(part).to_bytes(4, 'big') + part
+            for part in (scheme.encode('utf-8'), username.encode('utf-8'),
+                         password.encode('utf-8'))
+        )
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def _count(self, scheme: str, counter: str) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(scheme, {'hits': 0, 'misses': 0})
+            stats[counter] += 1
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        """
+        Retrieve hit and miss counters and the hit rate for each scheme.
+        """
+
+        with self._lock:
+            return {
+                scheme: {
+                    'hits': stats['hits'],
+                    'misses': stats['misses'],
+                    'hit_rate': stats['hits'] / (stats['hits'] + stats['misses'])
+                }
+                for scheme, stats in self._stats.items()
+            }
+
+    def get(self, scheme: str, username: str, password: str) \
+        -> Optional[Union[bool, str]]:
+        """
+        Retrieve the cached validation result of the credentials, or `None` if
+        they were not validated recently.
+        """
+
+        entry = self._cache.get(self._digest(scheme, username, password))
+        if entry is None:
+            self._count(scheme, 'misses')
+            return None
+
+        self._count(scheme, 'hits')
+        return entry[2]
+
+    def put(self, scheme: str, username: str, password: str,
+            result: Union[bool, str]) -> None:
+        """
+        Store the successful validation `result` of the credentials.
+        """
+
+        self._cache.put(self._digest(scheme, username, password),
+                        (scheme, username, result))
+
+    def invalidate(self, username: Optional[str] = None,
+                   scheme: Optional[str] = None) -> int:
+        """
+        Remove cached validations of the `username` for the `scheme`. If either
+        is not provided, then entries of all users or schemes are removed.
+        Returns the number of removed entries.
+        """
+
+        return self._cache.invalidate_matching(
+            lambda key, entry: (scheme is None or entry[0] == scheme) and \
+                (username is None or entry[1] == username)
+        )
+
+class Snapshot(Generic[Value]):
+    # pylint: disable=too-many-instance-attributes
+    """
+    Value that is loaded once and then refreshed by a background thread every
+    `interval` seconds.
+
+    The value is replaced as a whole after a successful load, so readers never
+    wait for a refresh. If a refresh fails, then the last loaded value remains
+    in use. An interval of zero or less disables the background refresh.
+
+    The thread is started when the value is first retrieved, and started again
+    when it is retrieved in a process forked from the one that ran the thread,
+    such as a daemon or worker process, since threads do not survive forks.
+    """
+
+    def __init__(self, loader: Callable[[], Value], interval: float,
+                 name: str = 'snapshot'):
+        self._loader = loader
+        self._interval = interval
+        self._name = name
+
+        self._value = loader()
+        self._loaded = time.monotonic()
+        self._refreshes = 0
+        self._failures = 0
+        self._consecutive_failures = 0
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def _start(self) -> None:
+        with self._lock:
+            pid = os.getpid()
+            if self._pid == pid or self._stop.is_set():
+                return
+
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run,
+                                            name=f'{self._name}-refresh',
+                                            daemon=True)
+            self._thread.start()
+
+    @property
+    def value(self) -> Value:
+        """
+        Retrieve the most recently loaded value.
+        """
+
+        if self._interval > 0 and self._pid != os.getpid():
+            self._start()
+
+        return self._value
+
+    @property
+    def stats(self) -> Dict[str, Union[int, float, bool]]:
+        """
+        Retrieve counters of the snapshot. The `age` is the number of seconds
+        since the last successful load, and the snapshot is `stale` if a
+        refresh has been due without succeeding.
+        """
+
+        age = time.monotonic() - self._loaded
+        return {
+            'refreshes': self._refreshes,
+            'failures': self._failures,
+            'consecutive_failures': self._consecutive_failures,
+            'age': age,
+            'stale': self._interval > 0 and age > self._interval * 2
+        }
+
+    def refresh(self) -> bool:
+        """
+        Load the value again and swap it in if the load succeeds.
+
+        Returns whether the value was refreshed.
+        """
+
+        try:
+            value = self._loader()
+        except Exception: # pylint: disable=broad-exception-caught
+            self._failures += 1
+            self._consecutive_failures += 1
+            logging.exception('Could not refresh %s, keeping previous value',
+                              self._name)
+            return False
+
+        self._value = value
+        self._loaded = time.monotonic()
+        self._refreshes += 1
+        self._consecutive_failures = 0
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self.refresh()
+
+    def close(self) -> None:
+        """
+        Stop refreshing the value in the background. A refresh that is in
+        progress is allowed to complete.
+        """
+
+        self._stop.set()
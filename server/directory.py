@@ -0,0 +1,421 @@
+"""
+LDAP group-based authentication scheme.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from argparse import Namespace
+from collections import deque
+from configparser import RawConfigParser
+import logging
+import re
+from typing import Callable, Deque, Dict, FrozenSet, Iterable, List, \
+    Optional, Set, Tuple, TypeVar, Union, TYPE_CHECKING
+try:
+    import ldap
+except ImportError:
+    if not TYPE_CHECKING:
+        ldap = None
+if TYPE_CHECKING:
+    from ldap.ldapobject import LDAPObject
+
+from .authentication import Authentication, BackendException, \
+    LoginException, Statistics, Validation
+from .cache import LRUCache, Snapshot
+from .pool import ConnectionPool, PoolTimeout
+
+LDAPResult = List[Tuple[str, Dict[str, List[bytes]]]]
+Operation = TypeVar('Operation')
+
+class MembershipIndex:
+    """
+    Immutable hashed index of user names for constant-time membership checks.
+
+    Names are stripped of surrounding whitespace, and if `case_insensitive` is
+    enabled, they are compared in a case-folded form.
+    """
+
+    __slots__ = ('_members', '_case_insensitive')
+
+    def __init__(self, members: Iterable[str], case_insensitive: bool = False):
+        self._case_insensitive = case_insensitive
+        normalized = (self.normalize(member) for member in members)
+        self._members: FrozenSet[str] = \
+            frozenset(member for member in normalized if member != '')
+
+    def normalize(self, username: str) -> str:
+        """
+        Convert a user name to the form that is stored in the index.
+        """
+
+        username = username.strip()
+        if self._case_insensitive:
+            return username.casefold()
+
+        return username
+
+    def __contains__(self, username: object) -> bool:
+        if not isinstance(username, str):
+            return False
+
+        return self.normalize(username) in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+@Authentication.register('ldap')
+class LDAP(Authentication):
+    # pylint: disable=too-many-instance-attributes
+    """
+    LDAP group-based authentication scheme.
+
+    Searches are performed on pooled connections that are bound with the
+    manager DN once, while user logins are bound on a separate pool of
+    connections that are reused between logins. The members of one or more
+    groups, including nested groups, are indexed together with the whitelist
+    and refreshed in the background. The DN and display name of users who
+    logged in recently are cached to avoid searching for them again.
+
+    Connections time out after `connect_timeout` seconds and operations after
+    `operation_timeout` seconds. If the `asynchronous` option is enabled, then
+    operations use message IDs and are abandoned after the operation timeout.
+    The search for a user is then sent before the connection for binding as
+    the user is prepared.
+    """
+
+    def __init__(self, args: Namespace, config: RawConfigParser):
+        super().__init__(args, config)
+        if ldap is None:
+            raise ImportError('Unable to use LDAP; install the python-ldap package')
+
+        self._asynchronous = config.has_option('ldap', 'asynchronous') and \
+            config.getboolean('ldap', 'asynchronous')
+        self._timeout = self._get_float('ldap', 'operation_timeout', 10.0)
+        self._connect_timeout = self._get_float('ldap', 'connect_timeout', 5.0)
+        self._manager_pool = self._create_pool(self._connect_manager)
+        self._user_pool = self._create_pool(self._connect)
+
+        self._whitelist: List[str] = []
+        if config.has_option('ldap', 'whitelist'):
+            self._whitelist = re.split(r'\s*(?<!\\),\s*',
+                                       self.config.get('ldap', 'whitelist'))
+
+        self._case_insensitive = config.has_option('ldap', 'case_insensitive') \
+            and config.getboolean('ldap', 'case_insensitive')
+        self._group = Snapshot(self._retrieve_ldap_group,
+                               self._get_float('ldap', 'group_ttl', 300.0),
+                               name='LDAP group')
+        self._users: LRUCache[str, Tuple[str, str]] = \
+            LRUCache(int(self._get_float('ldap', 'user_cache_size', 1024)),
+                     self._get_float('ldap', 'user_cache_ttl', 600.0))
+
+    def _create_pool(self, factory: Callable[[], 'LDAPObject']) \
+        -> ConnectionPool['LDAPObject']:
+        return ConnectionPool(factory, self._disconnect,
+                              size=int(self._get_float('ldap', 'pool_size', 4)),
+                              timeout=self._get_float('ldap', 'pool_timeout',
+                                                      10.0),
+                              idle_timeout=self._get_float('ldap',
+                                                           'idle_timeout',
+                                                           300.0),
+                              check=self._check_connection,
+                              check_interval=self._get_float('ldap',
+                                                             'check_interval',
+                                                             60.0),
+                              discard_on=(ldap.SERVER_DOWN, ldap.TIMEOUT,
+                                          ldap.CONNECT_ERROR))
+
+    def _connect(self) -> 'LDAPObject':
+        client = ldap.initialize(self.config.get('ldap', 'server'))
+        client.set_option(ldap.OPT_REFERRALS, 0)
+        client.set_option(ldap.OPT_NETWORK_TIMEOUT, self._connect_timeout)
+        client.set_option(ldap.OPT_TIMEOUT, self._timeout)
+        return client
+
+    def _connect_manager(self) -> 'LDAPObject':
+        client = self._connect()
+        try:
+            client.simple_bind_s(self.config.get('ldap', 'manager_dn'),
+                                 self.config.get('ldap', 'manager_password'))
+        except ldap.LDAPError:
+            self._disconnect(client)
+            raise
+
+        return client
+
+    @staticmethod
+    def _disconnect(client: 'LDAPObject') -> None:
+        client.unbind()
+
+    @staticmethod
+    def _check_connection(client: 'LDAPObject') -> bool:
+        client.whoami_s()
+        return True
+
+    @property
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Retrieve counters of the manager and user connection pools.
+        """
+
+        return {
+            'manager': self._manager_pool.stats,
+            'user': self._user_pool.stats
+        }
+
+    @property
+    def group_stats(self) -> Dict[str, Union[int, float, bool]]:
+        """
+        Retrieve counters of the refreshes of the group members, as well as
+        the number of members including the whitelist.
+        """
+
+        stats = self._group.stats
+        stats['members'] = len(self._group.value)
+        return stats
+
+    @property
+    def user_stats(self) -> Dict[str, int]:
+        """
+        Retrieve counters of the cache of DNs and display names of users.
+        """
+
+        return self._users.stats
+
+    @property
+    def stats(self) -> Dict[str, Statistics]:
+        pools = self.pool_stats
+        return {
+            'manager_pool': dict(pools['manager']),
+            'user_pool': dict(pools['user']),
+            'group': self.group_stats,
+            'user_cache': dict(self.user_stats)
+        }
+
+    def _retrieve_ldap_group(self) -> MembershipIndex:
+        logging.info('Retrieving LDAP group list using manager DN...')
+        group_attr = str(self.config.get('ldap', 'group_attr'))
+        search_attrs = [group_attr]
+        nested_attr: Optional[str] = None
+        if self.config.has_option('ldap', 'nested_group_attr'):
+            nested_attr = str(self.config.get('ldap', 'nested_group_attr'))
+            search_attrs.append(nested_attr)
+
+        # Search each configured group and follow nested group DNs, keeping
+        # track of visited groups to break cycles.
+        searches: Deque[Tuple[str, Optional[str]]] = deque(
+            (group, None)
+            for group in re.split(r'\s*[;\n]\s*',
+                                  self.config.get('ldap', 'group_dn').strip())
+        )
+        visited: Set[str] = set()
+        members: Set[str] = set(self._whitelist)
+        while searches:
+            search, base = searches.popleft()
+            try:
+                result = self._search_ldap(search, search_attrs, base=base)
+            except ldap.NO_SUCH_OBJECT:
+                if base is None:
+                    raise
+                logging.warning('Nested LDAP group %s does not exist', base)
+                continue
+
+            if isinstance(result, bool) or not result:
+                raise ValueError('Invalid LDAP response')
+
+            for group_dn, group in result:
+                if group_dn is None:
+                    # Referral
+                    continue
+
+                members.update(username.decode('utf-8')
+                               for username in group.get(group_attr, []))
+                if nested_attr is not None:
+                    nested = set(value.decode('utf-8')
+                                 for value in group.get(nested_attr, []))
+                    searches.extend(('(objectClass=*)', nested_dn)
+                                    for nested_dn in nested - visited)
+                    visited.update(nested)
+
+        return MembershipIndex(members,
+                               case_insensitive=self._case_insensitive)
+
+    def _result(self, client: 'LDAPObject', msgid: int) -> LDAPResult:
+        # Wait for the result of an asynchronous operation, abandoning it when
+        # it takes too long.
+        try:
+            _, result = client.result(msgid, all=1, timeout=self._timeout)
+        except ldap.TIMEOUT:
+            client.abandon(msgid)
+            raise
+
+        return result
+
+    def _search(self, client: 'LDAPObject', base: str, scope: int,
+                search: str, search_attrs: List[str]) -> LDAPResult:
+        if self._asynchronous:
+            msgid = client.search(base, scope, search, search_attrs)
+            return self._result(client, msgid)
+
+        return client.search_s(base, scope, search, search_attrs)
+
+    def _bind(self, client: 'LDAPObject', username: str, password: str) \
+        -> None:
+        if self._asynchronous:
+            self._result(client, client.simple_bind(username, password))
+        else:
+            client.simple_bind_s(username, password)
+
+    @staticmethod
+    def _operate(pool: ConnectionPool['LDAPObject'],
+                 operation: Callable[['LDAPObject'], Operation]) -> Operation:
+        # Perform an operation on a pooled connection, reconnecting once if
+        # the connection turns out to be broken.
+        for attempt in (1, 2):
+            try:
+                with pool.connection() as client:
+                    return operation(client)
+            except (ldap.SERVER_DOWN, ldap.CONNECT_ERROR) as error:
+                if attempt == 2:
+                    raise BackendException('LDAP server unavailable') from error
+                logging.warning('LDAP connection lost, reconnecting')
+            except ldap.UNAVAILABLE as error:
+                raise BackendException('LDAP server unavailable') from error
+            except ldap.TIMEOUT as error:
+                raise BackendException('LDAP operation timed out') from error
+            except PoolTimeout as error:
+                raise BackendException('No LDAP connection available') from error
+
+        raise AssertionError('Unreachable') # pragma: no cover
+
+    def _search_ldap(self, search: str, search_attrs: List[str],
+                     base: Optional[str] = None) -> Union[bool, LDAPResult]:
+        # Search using a connection bound as manager. Without a base, the
+        # search is performed in the subtree of the root DN, otherwise only the
+        # base entry is searched.
+        if base is None:
+            base = self.config.get('ldap', 'root_dn')
+            scope = ldap.SCOPE_SUBTREE
+        else:
+            scope = ldap.SCOPE_BASE
+
+        try:
+            return self._operate(self._manager_pool,
+                                 lambda client: self._search(client, base,
+                                                             scope, search,
+                                                             search_attrs))
+        except (ldap.INVALID_CREDENTIALS, ldap.UNWILLING_TO_PERFORM):
+            return False
+
+    def _bind_ldap(self, username: str, password: str) -> bool:
+        try:
+            self._operate(self._user_pool,
+                          lambda client: self._bind(client, username, password))
+        except (ldap.INVALID_CREDENTIALS, ldap.UNWILLING_TO_PERFORM):
+            return False
+
+        return True
+
+    def _parse_ldap_user(self, result: Union[bool, LDAPResult]) \
+        -> Tuple[str, str]:
+        if isinstance(result, bool):
+            raise ValueError('Invalid LDAP response')
+
+        # Retrieve DN and display name
+        display_name_field = str(self.config.get('ldap', 'display_name'))
+        login_name = result[0][0]
+        display_name = result[0][1][display_name_field][0].decode('utf-8')
+        return login_name, display_name
+
+    def _retrieve_ldap_user(self, username: str) -> Tuple[str, str]:
+        search = self.config.get('ldap', 'search_filter').format(username)
+        display_name_field = str(self.config.get('ldap', 'display_name'))
+        return self._parse_ldap_user(self._search_ldap(search,
+                                                       [display_name_field]))
+
+    def _pipeline_ldap(self, username: str, password: str) \
+        -> Tuple[str, str, bool]:
+        # Send the search for the user on a manager connection and prepare a
+        # user connection while the search is in progress, then bind with it.
+        search = self.config.get('ldap', 'search_filter').format(username)
+        display_name_field = str(self.config.get('ldap', 'display_name'))
+        try:
+            with self._manager_pool.connection() as manager:
+                msgid = manager.search(self.config.get('ldap', 'root_dn'),
+                                       ldap.SCOPE_SUBTREE, search,
+                                       [display_name_field])
+                with self._user_pool.connection() as client:
+                    login_name, display_name = \
+                        self._parse_ldap_user(self._result(manager, msgid))
+                    try:
+                        self._bind(client, login_name, password)
+                    except (ldap.INVALID_CREDENTIALS,
+                            ldap.UNWILLING_TO_PERFORM):
+                        return login_name, display_name, False
+
+                    return login_name, display_name, True
+        except (ldap.INVALID_CREDENTIALS, ldap.UNWILLING_TO_PERFORM) as error:
+            raise ValueError('Invalid LDAP response') from error
+        except (ldap.SERVER_DOWN, ldap.CONNECT_ERROR):
+            logging.warning('LDAP connection lost, retrying sequentially')
+        except ldap.UNAVAILABLE as error:
+            raise BackendException('LDAP server unavailable') from error
+        except ldap.TIMEOUT as error:
+            raise BackendException('LDAP operation timed out') from error
+        except PoolTimeout as error:
+            raise BackendException('No LDAP connection available') from error
+
+        login_name, display_name = self._retrieve_ldap_user(username)
+        return login_name, display_name, self._bind_ldap(login_name, password)
+
+    def _validate_ldap(self, username: str, password: str) -> str:
+        # Pre-check: user in group or whitelist?
+        group = self._group.value
+        if username not in group:
+            raise LoginException(f'User {username} not in group')
+
+        # Next check: get DN from uid, possibly from an earlier login, and
+        # final check: log in
+        key = group.normalize(username)
+        user = self._users.get(key)
+        if user is not None:
+            login_name, display_name = user
+            bound = self._bind_ldap(login_name, password)
+        elif self._asynchronous:
+            login_name, display_name, bound = \
+                self._pipeline_ldap(username, password)
+        else:
+            login_name, display_name = self._retrieve_ldap_user(username)
+            bound = self._bind_ldap(login_name, password)
+
+        if bound:
+            if user is None:
+                self._users.put(key, (login_name, display_name))
+            return display_name
+
+        if user is not None:
+            self._users.invalidate(key)
+
+        raise LoginException('Credentials invalid')
+
+    def validate(self, username: str, password: str) -> Validation:
+        return self._validate_ldap(username, password)
+
+    def close(self) -> None:
+        self._group.close()
+        self._manager_pool.close()
+        self._user_pool.close()
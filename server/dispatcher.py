@@ -20,6 +20,7 @@ limitations under the License.
 
 from typing import Callable, Optional
 import cherrypy
+from .timing import timed
 
 Dispatcher = Callable[[str], None]
 
@@ -58,14 +59,15 @@ class HostDispatcher:
         return self._domain
 
     def __call__(self, path_info: str) -> None:
-        if self._domain is None:
-            return self._next_dispatcher(path_info)
-
-        request = cherrypy.serving.request
-        host = request.headers.get('Host', '')
-        if host == self._domain:
-            return self._next_dispatcher(path_info)
-
-        request.config = cherrypy.config.copy()
-        request.handler = cherrypy.HTTPError(403, 'Invalid Host header')
-        return None
+        with timed('dispatch'):
+            if self._domain is None:
+                return self._next_dispatcher(path_info)
+
+            request = cherrypy.serving.request
+            host = request.headers.get('Host', '')
+            if host == self._domain:
+                return self._next_dispatcher(path_info)
+
+            request.config = cherrypy.config.copy()
+            request.handler = cherrypy.HTTPError(403, 'Invalid Host header')
+            return None
@@ -0,0 +1,88 @@
+"""
+Rate limiting of requests.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+from typing import Dict, Tuple
+
+class TokenBucketLimiter:
+    """
+    Rate limiter which keeps a token bucket for each key.
+
+    Each bucket holds at most `burst` tokens and is refilled with `rate` tokens
+    per second. At most `size` buckets are kept; the least recently used bucket
+    is evicted when more keys are seen, which resets the limit for its key.
+    """
+
+    def __init__(self, rate: float, burst: int, size: int = 10000):
+        if rate <= 0 or burst < 1:
+            raise ValueError('Rate must be positive and burst at least 1')
+
+        self._rate = rate
+        self._burst = float(burst)
+        self._size = size
+        self._lock = threading.Lock()
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+        self._stats = {
+            'allowed': 0,
+            'rejected': 0,
+            'evictions': 0
+        }
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Retrieve counters of allowed and rejected attempts and evicted buckets,
+        as well as the current number of buckets.
+        """
+
+        with self._lock:
+            stats = self._stats.copy()
+            stats['size'] = len(self._buckets)
+
+        return stats
+
+    def acquire(self, key: str) -> float:
+        """
+        Take a token from the bucket for the `key`.
+
+        Returns zero if the attempt is allowed, otherwise the number of seconds
+        until a token becomes available.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self._burst, now))
+            tokens = min(self._burst, tokens + (now - updated) * self._rate)
+            if tokens >= 1.0:
+                tokens -= 1.0
+                wait = 0.0
+                self._stats['allowed'] += 1
+            else:
+                wait = (1.0 - tokens) / self._rate
+                self._stats['rejected'] += 1
+
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self._size:
+                self._buckets.popitem(last=False)
+                self._stats['evictions'] += 1
+
+        return wait
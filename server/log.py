@@ -0,0 +1,274 @@
+"""
+Queued logging with batched writes and compressed log rotation.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gzip
+import logging
+from logging.handlers import QueueHandler, RotatingFileHandler
+import os
+import queue
+import shutil
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+import weakref
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler which compresses rotated files with gzip in
+    a background thread.
+
+    While `deferred` is enabled, records are written to the file buffer
+    without flushing it, such that a batch of records is written at once.
+    """
+
+    def __init__(self, filename: str, mode: str = 'a', maxBytes: int = 0,
+                 backupCount: int = 0, encoding: Optional[str] = None,
+                 delay: bool = False):
+        # pylint: disable=too-many-arguments
+        # pylint: disable=invalid-name
+        super().__init__(filename, mode=mode, maxBytes=maxBytes,
+                         backupCount=backupCount, encoding=encoding,
+                         delay=delay)
+        self.namer = self._compressed_name
+        self.rotator = self._rotate
+        self.deferred = False
+        self._compression: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _compressed_name(name: str) -> str:
+        return f'{name}.gz'
+
+    @staticmethod
+    def _compress(source: str, dest: str) -> None:
+        with open(source, 'rb') as log_file:
+            with gzip.open(dest, 'wb') as compressed_file:
+                shutil.copyfileobj(log_file, compressed_file)
+
+        os.remove(source)
+
+    def _rotate(self, source: str, dest: str) -> None:
+        # Move the file aside quickly and compress it in the background.
+        uncompressed = dest[:-len('.gz')]
+        os.replace(source, uncompressed)
+        self._compression = threading.Thread(target=self._compress,
+                                             args=(uncompressed, dest),
+                                             name='Log compression')
+        self._compression.start()
+
+    def wait(self) -> None:
+        """
+        Wait until a rotated file is compressed.
+        """
+
+        if self._compression is not None:
+            self._compression.join()
+            self._compression = None
+
+    def doRollover(self) -> None:
+        self.wait()
+        super().doRollover()
+
+    def flush(self) -> None:
+        if not self.deferred:
+            super().flush()
+
+    def close(self) -> None:
+        super().close()
+        self.wait()
+
+class _RouteHandler(QueueHandler):
+    """
+    Handler which puts records on a log queue for the handlers of a route.
+    The queue of the handler itself remains unused.
+    """
+
+    def __init__(self, log_queue: 'LogQueue', route: str):
+        super().__init__(queue.Queue(1))
+        self.log_queue = log_queue
+        self.route = route
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.log_queue.put(self.route, record)
+
+class LogQueue:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Bounded queue of log records which a background thread writes in batches
+    of at most `batch_size` records to the handlers of the loggers that the
+    records were logged to.
+
+    When the queue holds `size` records, further records are dropped, and the
+    number of dropped records is logged once the queue is written again.
+    After the queue is stopped, records are written directly.
+    """
+
+    def __init__(self, size: int = 10000, batch_size: int = 100):
+        self._size = size
+        self._batch_size = batch_size
+        self._queue: 'queue.Queue[Optional[Tuple[str, logging.LogRecord]]]' = \
+            queue.Queue(size)
+        self._routes: Dict[str, List[logging.Handler]] = {}
+        self._lock = threading.Lock()
+        self._dropped: Dict[str, int] = {}
+        self._reported: Dict[str, int] = {}
+        self._written = 0
+        self._thread: Optional[threading.Thread] = None
+        _QUEUES.add(self)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Retrieve the number of records in the queue, written by the background
+        thread and dropped because the queue was full.
+        """
+
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'written': self._written,
+                'dropped': sum(self._dropped.values())
+            }
+
+    def install(self, names: Sequence[str]) -> None:
+        """
+        Replace the handlers of the loggers with the `names` with handlers
+        that put records on the queue, and start writing the queue.
+        """
+
+        for name in names:
+            logger = logging.getLogger(name)
+            self._routes[name] = list(logger.handlers)
+            self._dropped[name] = 0
+            self._reported[name] = 0
+            for handler in self._routes[name]:
+                logger.removeHandler(handler)
+            logger.addHandler(_RouteHandler(self, name))
+
+        self.start()
+
+    def put(self, route: str, record: logging.LogRecord) -> None:
+        """
+        Put a record on the queue to be written to the handlers of the route.
+        """
+
+        if self._thread is None:
+            self._write(route, [record])
+            return
+
+        try:
+            self._queue.put_nowait((route, record))
+        except queue.Full:
+            with self._lock:
+                self._dropped[route] += 1
+
+    def start(self) -> None:
+        """
+        Start writing records from the queue in a background thread.
+        """
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name='Log queue', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Write the remaining records and stop the background thread.
+        """
+
+        thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+            self._thread = None
+
+    def _after_fork(self) -> None:
+        # Threads and locks do not survive in a forked process.
+        self._queue = queue.Queue(self._size)
+        self._lock = threading.Lock()
+        if self._thread is not None:
+            self._thread = None
+            self.start()
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            batch = [self._queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records: Dict[str, List[logging.LogRecord]] = {}
+            for item in batch:
+                if item is None:
+                    stopped = True
+                else:
+                    records.setdefault(item[0], []).append(item[1])
+
+            for route, route_records in records.items():
+                self._write(route, route_records)
+            self._report_dropped()
+
+            with self._lock:
+                self._written += len(batch) - int(stopped)
+
+    def _write(self, route: str, records: List[logging.LogRecord]) -> None:
+        for handler in self._routes.get(route, []):
+            if isinstance(handler, CompressedRotatingFileHandler):
+                handler.deferred = True
+            try:
+                for record in records:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            finally:
+                if isinstance(handler, CompressedRotatingFileHandler):
+                    handler.deferred = False
+                    handler.flush()
+
+    def _report_dropped(self) -> None:
+        with self._lock:
+            dropped = {
+                route: count - self._reported[route]
+                for route, count in self._dropped.items()
+                if count > self._reported[route]
+            }
+            self._reported.update(self._dropped)
+
+        for route, count in dropped.items():
+            record = logging.makeLogRecord({
+                'name': __name__,
+                'levelno': logging.WARNING,
+                'levelname': logging.getLevelName(logging.WARNING),
+                'msg': 'Dropped %d log records of %s logger',
+                'args': (count, route if route != '' else 'root')
+            })
+            self._write('', [record])
+
+# Queues which are still in use, whose writers are restarted after a fork
+_QUEUES: 'weakref.WeakSet[LogQueue]' = weakref.WeakSet()
+
+def _restart_queues() -> None:
+    for log_queue in list(_QUEUES):
+        log_queue._after_fork() # pylint: disable=protected-access
+
+# Processes are not forked on Windows
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_queues)
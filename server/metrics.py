@@ -0,0 +1,354 @@
+"""
+Metrics of requests and authentication in Prometheus text format.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from bisect import bisect_left
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import cherrypy
+from .admin import Admin_Application
+from .sessions import session_free
+from .threadpool import MonitoredThreadPool
+from .timing import route_label
+
+Labels = Tuple[str, ...]
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+# Request methods that have their own label, to bound the number of series
+METHODS = frozenset({
+    'GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS'
+})
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = value.replace('\\', '\\\\').replace('\n', '\\n') \
+            .replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+
+    return '{' + ','.join(pairs) + '}'
+
+class Metric:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Metric with a number of values for each combination of label values.
+
+    Each thread updates its own values, such that observations do not take
+    a shared lock except when a thread first uses a combination of labels.
+    Collection adds up the values of all threads, and merges the values of
+    threads that no longer exist.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 size: int = 1):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[Tuple[threading.Thread, Labels, List[float]]] = []
+        self._retired: Dict[Labels, List[float]] = {}
+
+    def _cells(self, values: Labels) -> List[float]:
+        if len(values) != len(self.labels):
+            raise ValueError(f'Metric {self.name} requires labels {self.labels}')
+
+        shard: Optional[Dict[Labels, List[float]]] = \
+            getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+
+        cells = shard.get(values)
+        if cells is None:
+            cells = [0.0] * self._size
+            shard[values] = cells
+            with self._lock:
+                self._shards.append((threading.current_thread(), values,
+                                     cells))
+
+        return cells
+
+    def collect(self) -> Dict[Labels, List[float]]:
+        """
+        Retrieve the values for each combination of label values.
+        """
+
+        totals: Dict[Labels, List[float]] = {}
+        with self._lock:
+            alive = []
+            for thread, values, cells in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, values, cells))
+                    target = totals.setdefault(values, [0.0] * self._size)
+                else:
+                    target = self._retired.setdefault(values,
+                                                      [0.0] * self._size)
+
+                for index, value in enumerate(cells):
+                    target[index] += value
+
+            self._shards = alive
+            for values, retired in self._retired.items():
+                target = totals.setdefault(values, [0.0] * self._size)
+                for index, value in enumerate(retired):
+                    target[index] += value
+
+        return totals
+
+    def render(self) -> Iterable[str]:
+        """
+        Generate lines of the metric in Prometheus text format.
+        """
+
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for values, cells in sorted(self.collect().items()):
+            yield from self._render_sample(values, cells)
+
+    def _render_sample(self, values: Labels, cells: List[float]) \
+            -> Iterable[str]:
+        labels = _format_labels(self.labels, values)
+        yield f'{self.name}{labels} {_format_value(cells[0])}'
+
+class Counter(Metric):
+    """
+    Metric which counts events.
+    """
+
+    kind = 'counter'
+
+    def inc(self, *values: str, amount: float = 1.0) -> None:
+        """
+        Increase the counter for the label `values` by `amount`.
+        """
+
+        self._cells(values)[0] += amount
+
+class Histogram(Metric):
+    """
+    Metric which counts observations in buckets with upper bounds.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # One cell for each bucket, one for the infinite bucket and the sum
+        super().__init__(name, help_text, labels=labels,
+                         size=len(self.buckets) + 2)
+
+    def observe(self, value: float, *values: str) -> None:
+        """
+        Count an observation of `value` for the label `values`.
+        """
+
+        cells = self._cells(values)
+        cells[bisect_left(self.buckets, value)] += 1
+        cells[-1] += value
+
+    def _render_sample(self, values: Labels, cells: List[float]) \
+            -> Iterable[str]:
+        names = self.labels + ('le',)
+        count = 0.0
+        for bound, bucket in zip(self.buckets + (float('inf'),), cells):
+            count += bucket
+            labels = _format_labels(names, values + (_format_value(bound),))
+            yield f'{self.name}_bucket{labels} {_format_value(count)}'
+
+        labels = _format_labels(self.labels, values)
+        yield f'{self.name}_sum{labels} {_format_value(cells[-1])}'
+        yield f'{self.name}_count{labels} {_format_value(count)}'
+
+class Callback(Metric):
+    """
+    Metric with a value that is retrieved from a callback upon collection.
+    """
+
+    def __init__(self, name: str, help_text: str,
+                 callback: Callable[[], float], kind: str = 'gauge'):
+        super().__init__(name, help_text)
+        self.kind = kind
+        self._callback = callback
+
+    def collect(self) -> Dict[Labels, List[float]]:
+        return {(): [float(self._callback())]}
+
+class Samples(Metric):
+    """
+    Metric with values for combinations of label values that are retrieved
+    from a callback upon collection.
+    """
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str],
+                 callback: Callable[[], Iterable[Tuple[Labels, float]]],
+                 kind: str = 'gauge'):
+        super().__init__(name, help_text, labels=labels)
+        self.kind = kind
+        self._callback = callback
+
+    def collect(self) -> Dict[Labels, List[float]]:
+        return {
+            values: [float(value)] for values, value in self._callback()
+        }
+
+class Registry:
+    """
+    Collection of metrics.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        """
+        Add a metric, replacing any metric with the same name.
+        """
+
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name: str) -> None:
+        """
+        Remove the metric with the `name`, if it exists.
+        """
+
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """
+        Format all metrics in Prometheus text format.
+        """
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+REQUEST_DURATION = Histogram('gros_server_http_request_duration_seconds',
+                             'Time to handle requests and write responses.',
+                             labels=('route', 'method', 'status'))
+AUTHENTICATION_DURATION = Histogram(
+    'gros_server_authentication_duration_seconds',
+    'Time to validate credentials with the authentication scheme.',
+    labels=('scheme', 'outcome')
+)
+LOGIN_REDIRECTS = Counter('gros_server_login_redirects_total',
+                          'Redirects to the login form by login validation.',
+                          labels=('reason',))
+for _metric in (REQUEST_DURATION, AUTHENTICATION_DURATION, LOGIN_REDIRECTS):
+    REGISTRY.register(_metric)
+
+def _pool_statistic(pool: MonitoredThreadPool, key: str) \
+        -> Callable[[], float]:
+    return lambda: pool.stats[key]
+
+def register_thread_pool(pool: MonitoredThreadPool,
+                         registry: Registry = REGISTRY) -> None:
+    """
+    Register metrics of the usage of a thread pool of the HTTP server.
+    """
+
+    for key, name, help_text, kind in (
+        ('threads', 'threads', 'Number of threads in the pool.', 'gauge'),
+        ('idle', 'idle_threads', 'Number of idle threads in the pool.',
+         'gauge'),
+        ('queue', 'queued_connections',
+         'Number of connections waiting in the queue.', 'gauge'),
+        ('utilization', 'utilization', 'Fraction of busy threads.', 'gauge'),
+        ('queued', 'dequeued_total',
+         'Number of connections taken from the queue.', 'counter'),
+        ('queue_wait', 'queue_wait_seconds_total',
+         'Time that connections waited in the queue.', 'counter'),
+        ('queue_wait_max', 'queue_wait_seconds_max',
+         'Longest time that a connection waited in the queue.', 'gauge')
+    ):
+        registry.register(Callback(f'gros_server_thread_pool_{name}',
+                                   help_text, _pool_statistic(pool, key),
+                                   kind=kind))
+
+def record_request() -> None:
+    """
+    Observe the duration of the current request for its route.
+    """
+
+    request = cherrypy.serving.request
+    response = cherrypy.serving.response
+    method = request.method if request.method in METHODS else 'other'
+    status = '-'
+    if response.output_status is not None:
+        code = response.output_status.split(b' ', 1)[0]
+        if len(code) == 3 and code.isdigit() and code[:1] in b'12345':
+            status = code.decode('ascii')
+        else:
+            status = 'other'
+
+    REQUEST_DURATION.observe(time.time() - response.time, route_label(),
+                             method, status)
+
+cherrypy.tools.metrics = cherrypy.Tool('on_end_request', record_request,
+                                       priority=100)
+
+class Metrics_Application(Admin_Application):
+    # pylint: disable=too-few-public-methods
+    """
+    Web application which exposes the metrics of a registry in Prometheus text
+    format to clients that are allowed to access administration.
+    """
+
+    def __init__(self, registry: Registry = REGISTRY,
+                 clients: Sequence[str] = (),
+                 token: Optional[str] = None):
+        super().__init__(clients=clients, token=token)
+        self._registry = registry
+
+    @cherrypy.expose
+    @session_free
+    def index(self) -> str:
+        """
+        Metrics in Prometheus text format.
+        """
+
+        self.validate_access()
+        cherrypy.serving.response.headers['Content-Type'] = CONTENT_TYPE
+        return self._registry.render()
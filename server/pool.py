@@ -0,0 +1,270 @@
+"""
+Bounded pool of reusable connections.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import logging
+import threading
+import time
+from typing import Callable, Deque, Dict, Generic, Iterator, List, Optional, \
+    Tuple, Type, TypeVar
+
+Connection = TypeVar('Connection')
+
+class PoolTimeout(RuntimeError):
+    """
+    Exception that indicates that no connection became available in time.
+    """
+
+class _Entry(Generic[Connection]):
+    # pylint: disable=too-few-public-methods
+    """
+    Bookkeeping for an idle connection.
+    """
+
+    def __init__(self, connection: Connection, checked: float):
+        self.connection = connection
+        self.used = time.monotonic()
+        self.checked = checked
+
+class ConnectionPool(Generic[Connection]):
+    # pylint: disable=too-many-instance-attributes
+    """
+    Thread-safe pool of at most `size` connections.
+
+    Connections are created with the `factory` when none are idle. Idle
+    connections that have not been used for `idle_timeout` seconds are closed
+    instead of being handed out again. If `check` is provided, then it is
+    called on an idle connection that has not been checked for
+    `check_interval` seconds; a falsy result or an exception discards it.
+    """
+
+    def __init__(self, factory: Callable[[], Connection],
+                 close: Callable[[Connection], None], *, size: int = 4,
+                 timeout: float = 10.0, idle_timeout: float = 300.0,
+                 check: Optional[Callable[[Connection], bool]] = None,
+                 check_interval: float = 60.0,
+                 discard_on: Tuple[Type[BaseException], ...] = ()):
+        # pylint: disable=too-many-arguments
+        if size < 1:
+            raise ValueError('Pool size must be at least 1')
+
+        self._factory = factory
+        self._close = close
+        self._size = size
+        self._timeout = timeout
+        self._idle_timeout = idle_timeout
+        self._check = check
+        self._check_interval = check_interval
+        self._discard_on = discard_on
+
+        self._condition = threading.Condition()
+        self._idle: Deque[_Entry[Connection]] = deque()
+        self._checked: Dict[int, float] = {}
+        self._count = 0
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'discarded': 0,
+            'expired': 0,
+            'timeouts': 0
+        }
+
+    @property
+    def size(self) -> int:
+        """
+        Retrieve the maximum number of connections in the pool.
+        """
+
+        return self._size
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Retrieve counters of the pool, including the number of open and idle
+        connections.
+        """
+
+        with self._condition:
+            stats = self._stats.copy()
+            stats['open'] = self._count
+            stats['idle'] = len(self._idle)
+
+        return stats
+
+    def _expire(self) -> List[Connection]:
+        # Remove the idle entries that expired, which are the least recently
+        # released ones at the left. Must be called with the condition held.
+        expired: List[Connection] = []
+        now = time.monotonic()
+        while self._idle and now - self._idle[0].used > self._idle_timeout:
+            expired.append(self._idle.popleft().connection)
+            self._count -= 1
+            self._stats['expired'] += 1
+
+        return expired
+
+    def _take(self) -> Tuple[Optional[_Entry[Connection]],
+                             List[Connection]]:
+        # Retrieve the most recently released idle entry, if any, after
+        # removing expired entries. Must be called with the condition held.
+        expired = self._expire()
+        if self._idle:
+            return self._idle.pop(), expired
+
+        return None, expired
+
+    def _discard(self, connection: Connection) -> None:
+        try:
+            self._close(connection)
+        except Exception: # pylint: disable=broad-exception-caught
+            logging.exception('Could not close pooled connection')
+
+    def _is_healthy(self, entry: _Entry[Connection]) -> bool:
+        if self._check is None:
+            return True
+        if time.monotonic() - entry.checked < self._check_interval:
+            return True
+
+        try:
+            healthy = bool(self._check(entry.connection))
+        except Exception: # pylint: disable=broad-exception-caught
+            healthy = False
+
+        if healthy:
+            entry.checked = time.monotonic()
+        return healthy
+
+    def acquire(self) -> Connection:
+        """
+        Retrieve a connection from the pool, creating it if there is room.
+
+        If all connections are in use for longer than the pool timeout, then
+        a `PoolTimeout` is raised.
+        """
+
+        deadline = time.monotonic() + self._timeout
+        while True:
+            with self._condition:
+                if self._closed:
+                    raise RuntimeError('Connection pool is closed')
+
+                entry, expired = self._take()
+                create = False
+                if entry is None and self._count < self._size:
+                    self._count += 1
+                    create = True
+                elif entry is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout('No pooled connection available')
+
+                    self._condition.wait(remaining)
+
+            for connection in expired:
+                self._discard(connection)
+
+            if entry is not None:
+                if self._is_healthy(entry):
+                    with self._condition:
+                        self._stats['reused'] += 1
+                        self._checked[id(entry.connection)] = entry.checked
+                    return entry.connection
+
+                self._release_slot(entry.connection)
+            elif create:
+                return self._create()
+
+    def _create(self) -> Connection:
+        try:
+            connection = self._factory()
+        except BaseException:
+            with self._condition:
+                self._count -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._stats['created'] += 1
+            self._checked[id(connection)] = time.monotonic()
+        return connection
+
+    def _release_slot(self, connection: Connection) -> None:
+        self._discard(connection)
+        with self._condition:
+            self._count -= 1
+            self._stats['discarded'] += 1
+            self._checked.pop(id(connection), None)
+            self._condition.notify()
+
+    def release(self, connection: Connection, discard: bool = False) -> None:
+        """
+        Return a connection that was acquired from the pool. If `discard` is
+        true, then the connection is closed instead of kept for reuse.
+        """
+
+        if discard or self._closed:
+            self._release_slot(connection)
+            return
+
+        with self._condition:
+            checked = self._checked.pop(id(connection), time.monotonic())
+            self._idle.append(_Entry(connection, checked))
+            expired = self._expire()
+            self._condition.notify(len(expired) + 1)
+
+        for connection_expired in expired:
+            self._discard(connection_expired)
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        """
+        Context manager that provides a pooled connection and releases it
+        afterward. If the context raises an exception of the types that the
+        pool discards on, then the connection is closed rather than reused.
+        """
+
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except self._discard_on:
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def close(self) -> None:
+        """
+        Close all idle connections and stop handing out connections.
+        Connections that are in use are closed once they are released.
+        """
+
+        with self._condition:
+            self._closed = True
+            idle = [entry.connection for entry in self._idle]
+            self._idle.clear()
+            self._count -= len(idle)
+            self._condition.notify_all()
+
+        for connection in idle:
+            self._discard(connection)
@@ -0,0 +1,285 @@
+"""
+Sampling profiler of request threads with per-route stacks.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from datetime import datetime
+import logging
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Dict, List, Optional, Sequence, Union
+import cherrypy
+from .admin import Admin_Application
+from .sessions import session_free
+from .timing import route_label
+
+class _Request:
+    # pylint: disable=too-few-public-methods
+    """
+    Bookkeeping for a request in progress while profiling.
+    """
+
+    __slots__ = ('route', 'start', 'samples')
+
+    def __init__(self, route: str, start: float):
+        self.route = route
+        self.start = start
+        self.samples: Dict[str, int] = {}
+
+class SamplingProfiler:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Profiler which periodically samples the stacks of threads that handle
+    requests, every `interval` seconds while it is running.
+
+    Stacks are aggregated per route in the folded format of flame graph tools,
+    with one line for each stack and its number of samples. If a threshold
+    is given when starting, then only samples of requests that took at least
+    that many seconds are kept.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._requests: Dict[int, _Request] = {}
+        self._stacks: Dict[str, int] = {}
+        self._threshold = 0.0
+        self._until = 0.0
+        self._path: Optional[Path] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.result: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        """
+        Check whether the profiler is sampling request threads.
+        """
+
+        return self._thread is not None
+
+    def start(self, duration: float, threshold: float = 0.0,
+              path: Optional[Union[str, Path]] = None) -> bool:
+        """
+        Sample the request threads for `duration` seconds, keeping samples of
+        requests that took at least `threshold` seconds. The folded stacks are
+        written to a file in the `path` directory, if provided, once done.
+
+        Returns whether the profiler started, which it does not do if it was
+        already running.
+        """
+
+        with self._lock:
+            if self._thread is not None:
+                return False
+
+            self._requests = {}
+            self._stacks = {}
+            self._threshold = threshold
+            self._until = time.monotonic() + duration
+            self._path = Path(path) if path is not None else None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name='Sampling profiler',
+                                            daemon=True)
+            self._thread.start()
+
+        logging.info('Profiling requests for %.1f seconds', duration)
+        return True
+
+    def stop(self) -> None:
+        """
+        Stop sampling before the duration ends and wait for the result.
+        """
+
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def begin_request(self) -> None:
+        """
+        Start sampling the thread of the current request.
+        """
+
+        if self._thread is not None:
+            self._requests[threading.get_ident()] = \
+                _Request(route_label(), time.monotonic())
+
+    def end_request(self) -> None:
+        """
+        Stop sampling the thread of the current request, and keep its samples
+        if the request took long enough.
+        """
+
+        request = self._requests.pop(threading.get_ident(), None)
+        if request is not None:
+            self._keep(request, time.monotonic())
+
+    def _keep(self, request: _Request, now: float) -> None:
+        if now - request.start < self._threshold:
+            return
+
+        with self._lock:
+            for stack, count in request.samples.items():
+                self._stacks[stack] = self._stacks.get(stack, 0) + count
+
+    @staticmethod
+    def _fold(route: str, frame: Optional[FrameType]) -> str:
+        names: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            module = frame.f_globals.get('__name__', '?')
+            name = getattr(code, 'co_qualname', code.co_name)
+            names.append(f'{module}:{name}')
+            frame = frame.f_back
+
+        names.append(route)
+        return ';'.join(reversed(names))
+
+    def _sample(self) -> None:
+        frames = sys._current_frames() # pylint: disable=protected-access
+        stacks = []
+        for ident, request in list(self._requests.items()):
+            frame = frames.get(ident)
+            if frame is not None:
+                stacks.append((request, self._fold(request.route, frame)))
+        del frames
+
+        with self._lock:
+            for request, stack in stacks:
+                request.samples[stack] = request.samples.get(stack, 0) + 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval) and \
+            time.monotonic() < self._until:
+            self._sample()
+
+        # Requests in progress are kept if they already took long enough
+        now = time.monotonic()
+        requests = list(self._requests.values())
+        self._requests = {}
+        for request in requests:
+            self._keep(request, now)
+
+        with self._lock:
+            self.result = ''.join(
+                f'{stack} {count}\n'
+                for stack, count in sorted(self._stacks.items())
+            )
+            self._thread = None
+
+        samples = sum(self._stacks.values())
+        if self._path is None:
+            logging.info('Profiled %d samples', samples)
+            return
+
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = self._path / f'profile-{timestamp}-{os.getpid()}.folded'
+        try:
+            path.write_text(self.result, encoding='utf-8')
+            logging.info('Profiled %d samples to %s', samples, path)
+        except OSError:
+            logging.exception('Could not write profile to %s', path)
+
+PROFILER = SamplingProfiler()
+
+class ProfilerTool(cherrypy.Tool):
+    # pylint: disable=too-few-public-methods
+    """
+    Tool which lets the sampling profiler sample the thread of a request.
+    """
+
+    def __init__(self, profiler: SamplingProfiler = PROFILER):
+        super().__init__('on_start_resource', profiler.begin_request)
+        self._profiler = profiler
+
+    def _setup(self) -> None:
+        hooks = cherrypy.serving.request.hooks
+        hooks.attach(self._point, self.callable, priority=self._priority)
+        hooks.attach('on_end_request', self._profiler.end_request,
+                     priority=100)
+
+cherrypy.tools.profiler = ProfilerTool()
+
+class Profile_Application(Admin_Application):
+    """
+    Web application which starts the sampling profiler and provides its most
+    recent result to clients that are allowed to access administration.
+    """
+
+    def __init__(self, profiler: SamplingProfiler = PROFILER,
+                 path: Optional[Union[str, Path]] = None,
+                 threshold: float = 0.0,
+                 clients: Sequence[str] = (),
+                 token: Optional[str] = None):
+        # pylint: disable=too-many-arguments
+        super().__init__(clients=clients, token=token)
+        self._profiler = profiler
+        self._path = path
+        self._threshold = threshold
+
+    @cherrypy.expose
+    @session_free
+    def index(self) -> str:
+        """
+        Most recent result of the profiler in folded stack format.
+        """
+
+        self.validate_access()
+        if self._profiler.running:
+            raise cherrypy.HTTPError(409, 'Profiler is running')
+        if self._profiler.result is None:
+            raise cherrypy.HTTPError(404, 'No profile available')
+
+        cherrypy.serving.response.headers['Content-Type'] = 'text/plain'
+        return self._profiler.result
+
+    @cherrypy.expose
+    @session_free
+    def start(self, duration: str = '30', threshold: Optional[str] = None) \
+            -> str:
+        """
+        Start the profiler for `duration` seconds, keeping samples of requests
+        that took at least `threshold` seconds, or the default threshold.
+        """
+
+        self.validate_access()
+        if cherrypy.request.method != 'POST':
+            raise cherrypy.HTTPError(405, 'Profiler must be started with POST')
+
+        try:
+            seconds = float(duration)
+            minimum = float(threshold) if threshold is not None else \
+                self._threshold
+        except ValueError as error:
+            raise cherrypy.HTTPError(400, 'Duration and threshold must be numbers') \
+                from error
+        if not 0 < seconds <= 3600 or minimum < 0:
+            raise cherrypy.HTTPError(400, 'Duration or threshold out of range')
+
+        if not self._profiler.start(seconds, threshold=minimum,
+                                    path=self._path):
+            raise cherrypy.HTTPError(409, 'Profiler is running')
+
+        cherrypy.serving.response.status = 202
+        return f'Profiling for {seconds} seconds'
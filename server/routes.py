@@ -0,0 +1,126 @@
+"""
+Table of exposed routes of Web applications.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import inspect
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Mapping, NamedTuple, Optional
+import cherrypy
+from .admin import Admin_Application
+from .sessions import session_free
+
+class Route(NamedTuple):
+    """
+    Exposed route of an application, with the handler, the HTTP methods that
+    it allows or `None` if it allows all methods, and whether it uses a
+    session that is locked, only read or not loaded at all.
+    """
+
+    name: str
+    handler: Any
+    methods: Optional[FrozenSet[str]]
+    session: str
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Describe the route in a JSON-serializable dictionary.
+        """
+
+        return {
+            'name': self.name,
+            'methods': sorted(self.methods) if self.methods is not None \
+                else None,
+            'session': self.session
+        }
+
+def _describe(name: str, handler: Any) -> Route:
+    config: Dict[str, Any] = getattr(handler, '_cp_config', {})
+    methods: Optional[FrozenSet[str]] = None
+    if config.get('tools.allow.on', False):
+        allowed = config.get('tools.allow.methods', ('GET', 'HEAD'))
+        if isinstance(allowed, str):
+            allowed = (allowed,)
+        methods = frozenset(method.upper() for method in allowed)
+
+    if config.get('tools.sessions.on', True) is False:
+        session = 'none'
+    elif config.get('tools.read_only_session.on', False):
+        session = 'read_only'
+    else:
+        session = 'locked'
+
+    return Route(name, handler, methods, session)
+
+def build_routes(root: object) -> Mapping[str, Route]:
+    """
+    Build an immutable table of the exposed attributes of the `root` object
+    of an application, keyed by their name.
+
+    Properties and attributes whose name starts with an underscore are not
+    considered, so that building the table has no side effects.
+    """
+
+    routes: Dict[str, Route] = {}
+    for name in dir(root):
+        if name.startswith('_') or \
+            isinstance(inspect.getattr_static(root, name), property):
+            continue
+
+        handler = getattr(root, name)
+        if getattr(handler, 'exposed', False) is True:
+            routes[name] = _describe(name, handler)
+
+    return MappingProxyType(routes)
+
+def get_routes(root: object) -> Mapping[str, Route]:
+    """
+    Retrieve the table of exposed routes of the `root` object of an
+    application, using the table that the object keeps in its `routes`
+    attribute if it has one.
+    """
+
+    routes = getattr(root, 'routes', None)
+    if isinstance(routes, Mapping):
+        return routes
+
+    return build_routes(root)
+
+class Routes_Application(Admin_Application):
+    # pylint: disable=too-few-public-methods
+    """
+    Web application which lists the exposed routes of the mounted applications
+    to clients that are allowed to access administration.
+    """
+
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    @session_free
+    def index(self) -> Dict[str, Any]:
+        """
+        Exposed routes of each mounted application in JSON format.
+        """
+
+        self.validate_access()
+        listing: Dict[str, Any] = {}
+        for script_name, app in sorted(cherrypy.tree.apps.items()):
+            listing[script_name or '/'] = [
+                route.as_dict() for route in get_routes(app.root).values()
+            ]
+
+        return listing
@@ -0,0 +1,602 @@
+"""
+Session storage backends.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+import hashlib
+import hmac
+import json
+import os
+from pathlib import Path
+import pickle
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, ItemsView, KeysView, Optional, \
+    Sequence, Tuple, TypeVar, Union, ValuesView
+import zlib
+import cherrypy
+from cherrypy._cptools import SessionTool
+from cherrypy.lib import sessions
+from cherrypy.lib.sessions import Session
+from .timing import timed
+
+SessionData = Tuple[Dict[str, Any], datetime]
+Handler = TypeVar('Handler', bound=Callable[..., Any])
+
+SESSION_FREE = {
+    'tools.sessions.on': False,
+    'tools.lazy_sessions.on': False
+}
+
+def session_free(handler: Handler) -> Handler:
+    """
+    Decorator for an exposed handler which does not use the session, such that
+    no session is loaded or locked and no session cookie is sent.
+    """
+
+    config: Dict[str, Any] = getattr(handler, '_cp_config', {})
+    config.update(SESSION_FREE)
+    setattr(handler, '_cp_config', config)
+    return handler
+
+def read_only_session(handler: Handler) -> Handler:
+    """
+    Decorator for an exposed handler which only reads from the session.
+
+    The session is not locked for the entire request. Instead, the data is
+    copied while the session is briefly locked when the handler first uses it.
+    If the handler writes to the session after all, then it is locked and
+    loaded again before the change is made and saved. Requests that only read
+    the session do not extend its expiry.
+    """
+
+    config: Dict[str, Any] = getattr(handler, '_cp_config', {})
+    config.update({
+        'tools.sessions.locking': 'explicit',
+        'tools.lazy_sessions.locking': 'explicit',
+        'tools.read_only_session.on': True
+    })
+    setattr(handler, '_cp_config', config)
+    return handler
+
+def read_session_keys(path: Union[str, Path]) -> Tuple[bytes, ...]:
+    """
+    Read secret keys for signing session cookies from a file with one key per
+    line. The first key is used to sign new cookies, while all keys are used
+    to verify cookies, so that keys can be rotated.
+    """
+
+    with open(path, 'r', encoding='utf-8') as key_file:
+        keys = tuple(line.strip().encode('utf-8') for line in key_file
+                     if line.strip() != '')
+
+    if not keys:
+        raise ValueError(f'No session keys found in {path}')
+
+    return keys
+
+class CookieSession(Session):
+    """
+    Session which keeps its data in the session cookie itself.
+
+    The cookie holds the JSON-encoded session data and its expiration time,
+    signed with an HMAC using the first of the `signing_keys`. Any process that
+    has the keys can verify the cookie, so no shared store or locks are needed.
+    The session data must be serializable as JSON and should stay small.
+    """
+
+    signing_keys: Sequence[bytes] = ()
+
+    @staticmethod
+    def _encode(data: bytes) -> str:
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def _decode(data: str) -> bytes:
+        return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+    @staticmethod
+    def _sign(key: bytes, payload: str) -> bytes:
+        return hmac.new(key, payload.encode('ascii'), hashlib.sha256).digest()
+
+    def _verify(self) -> Optional[SessionData]:
+        if self.id is None or '.' not in self.id:
+            return None
+
+        payload, signature = self.id.rsplit('.', 1)
+        try:
+            digest = self._decode(signature)
+            if not any(hmac.compare_digest(self._sign(key, payload), digest)
+                       for key in self.signing_keys):
+                return None
+
+            content = json.loads(self._decode(payload))
+            return content['data'], datetime.fromtimestamp(content['expires'])
+        except (binascii.Error, UnicodeError, ValueError, TypeError,
+                KeyError):
+            return None
+
+    def _exists(self) -> bool:
+        session = self._verify()
+        return session is not None and session[1] >= self.now()
+
+    def _load(self) -> Optional[SessionData]:
+        with timed('session'):
+            return self._verify()
+
+    def _save(self, expiration_time: datetime) -> None:
+        if not self.signing_keys:
+            raise ValueError('No keys to sign the session cookie with')
+
+        content = json.dumps({
+            'data': self._data,
+            'expires': expiration_time.timestamp()
+        }, separators=(',', ':'))
+        payload = self._encode(content.encode('utf-8'))
+        signature = self._encode(self._sign(self.signing_keys[0], payload))
+
+        # Changing the ID updates the response cookie.
+        self.id = f'{payload}.{signature}'
+
+    def _delete(self) -> None:
+        # The cookie is expired by the client.
+        pass
+
+    def acquire_lock(self) -> None:
+        """
+        Mark the session as locked. No lock is held since the data is local to
+        the request.
+        """
+
+        self.locked = True
+
+    def release_lock(self) -> None:
+        """
+        Mark the session as unlocked.
+        """
+
+        self.locked = False
+
+    def __len__(self) -> int:
+        # Sessions are not tracked by the server.
+        return 0
+
+class StripedLock:
+    """
+    Set of locks that are shared between threads and processes, where a key
+    is mapped to one of `count` stripes.
+
+    Each stripe combines a thread lock with a lock on a byte of the lock file
+    at `path`, since record locks are owned by the process and thus do not
+    exclude other threads.
+    """
+
+    def __init__(self, path: str, count: int):
+        # Record locks are only available on POSIX platforms, so the module is
+        # only imported once the lock is used.
+        # pylint: disable=import-outside-toplevel
+        import fcntl
+        self._fcntl = fcntl
+        self._count = count
+        self._locks = [threading.Lock() for _ in range(count)]
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def stripe(self, key: str) -> int:
+        """
+        Retrieve the stripe of the `key`, which is the same in all processes.
+        """
+
+        return zlib.crc32(key.encode('utf-8')) % self._count
+
+    def acquire(self, stripe: int) -> None:
+        """
+        Acquire the lock of the `stripe`, waiting until it is available.
+        """
+
+        self._locks[stripe].acquire() # pylint: disable=consider-using-with
+        try:
+            self._fcntl.lockf(self._fd, self._fcntl.LOCK_EX, 1, stripe)
+        except OSError:
+            self._locks[stripe].release()
+            raise
+
+    def release(self, stripe: int) -> None:
+        """
+        Release the lock of the `stripe`.
+        """
+
+        try:
+            self._fcntl.lockf(self._fd, self._fcntl.LOCK_UN, 1, stripe)
+        finally:
+            self._locks[stripe].release()
+
+class SQLiteSession(Session):
+    """
+    Session stored in an SQLite database in WAL mode, which is shared by the
+    processes on the same host that use the same `database` file.
+
+    Each thread uses its own connection to the database. Sessions are locked
+    with one of `stripes` locks that are shared between processes through a
+    lock file next to the database, rather than with one global lock. Expired
+    sessions are removed in batches of `batch_size` rows.
+    """
+
+    database = 'sessions.db'
+    stripes = 64
+    batch_size = 500
+
+    _local = threading.local()
+    _setup_lock = threading.Lock()
+    _locks: Dict[str, StripedLock] = {}
+
+    _stripe: Optional[int] = None
+
+    @property
+    def _lock(self) -> StripedLock:
+        with self._setup_lock:
+            lock = self._locks.get(self.database)
+            if lock is None:
+                lock = StripedLock(f'{self.database}.lock', self.stripes)
+                self._locks[self.database] = lock
+
+            return lock
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        if getattr(self._local, 'pid', None) != os.getpid():
+            # Connections must not be shared with forked processes.
+            self._local.pid = os.getpid()
+            self._local.connections = {}
+
+        connections: Dict[str, sqlite3.Connection] = self._local.connections
+        connection = connections.get(self.database)
+        if connection is None:
+            # Only the user may read the session data, regardless of the umask.
+            # SQLite creates the WAL files with the mode of the database.
+            os.close(os.open(self.database, os.O_RDWR | os.O_CREAT, 0o600))
+            connection = sqlite3.connect(self.database, timeout=30,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('''CREATE TABLE IF NOT EXISTS session (
+                id TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL
+            )''')
+            connection.execute('''CREATE INDEX IF NOT EXISTS session_expires
+                ON session (expires)''')
+            connections[self.database] = connection
+
+        return connection
+
+    def _exists(self) -> bool:
+        cursor = self._connection.execute('SELECT 1 FROM session WHERE id = ?',
+                                          (self.id,))
+        return cursor.fetchone() is not None
+
+    def _load(self) -> Optional[SessionData]:
+        with timed('session'):
+            cursor = self._connection.execute(
+                'SELECT data, expires FROM session WHERE id = ?', (self.id,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+
+            return pickle.loads(row[0]), datetime.fromtimestamp(row[1])
+
+    def _save(self, expiration_time: datetime) -> None:
+        data = pickle.dumps(self._data, pickle.HIGHEST_PROTOCOL)
+        self._connection.execute(
+            'INSERT OR REPLACE INTO session (id, data, expires) VALUES (?, ?, ?)',
+            (self.id, data, expiration_time.timestamp())
+        )
+
+    def _delete(self) -> None:
+        self._connection.execute('DELETE FROM session WHERE id = ?',
+                                 (self.id,))
+
+    def acquire_lock(self) -> None:
+        """
+        Acquire the lock of the stripe of the session.
+        """
+
+        stripe = self._lock.stripe(str(self.id))
+        self._lock.acquire(stripe)
+        self._stripe = stripe
+        self.locked = True
+
+    def release_lock(self) -> None:
+        """
+        Release the lock of the stripe of the session.
+        """
+
+        if self._stripe is not None:
+            self._lock.release(self._stripe)
+            self._stripe = None
+        self.locked = False
+
+    def clean_up(self) -> None:
+        """
+        Remove expired sessions in batches, so that other processes are not
+        blocked from writing for a long time.
+        """
+
+        now = self.now().timestamp()
+        while True:
+            cursor = self._connection.execute('''DELETE FROM session
+                WHERE rowid IN (
+                    SELECT rowid FROM session WHERE expires < ? LIMIT ?
+                )''', (now, self.batch_size))
+            if cursor.rowcount < self.batch_size:
+                break
+
+    def __len__(self) -> int:
+        cursor = self._connection.execute('SELECT COUNT(*) FROM session')
+        count: int = cursor.fetchone()[0]
+        return count
+
+class LazySession:
+    """
+    Placeholder for the session of a request, which initializes the session
+    only when it is used by the handler.
+
+    Until then, no session data is read from the storage, no lock is acquired
+    and no session cookie is sent in the response.
+    """
+
+    locked = False
+
+    def __init__(self, **kwargs: Any):
+        self._kwargs = kwargs
+        self._lock = False
+        self._session: Optional[Session] = None
+
+    def initialize(self) -> Session:
+        """
+        Initialize the session of the request if it was not yet used, and
+        return the session.
+        """
+
+        if self._session is None:
+            with timed('session'):
+                sessions.init(**self._kwargs)
+                self._session = cherrypy.serving.session
+                if self._lock:
+                    self._session.acquire_lock()
+
+        return self._session
+
+    def acquire_lock(self) -> None:
+        """
+        Lock the session once it is initialized.
+        """
+
+        self._lock = True
+
+    def release_lock(self) -> None:
+        """
+        Do not lock the session once it is initialized.
+        """
+
+        self._lock = False
+
+    def save(self) -> None:
+        """
+        Do nothing, since an unused session has no data to save.
+        """
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.initialize(), name)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.initialize()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.initialize()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.initialize()[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.initialize()
+
+def init_lazy(**kwargs: Any) -> None:
+    """
+    Attach a placeholder session to the request, which initializes the session
+    with the `kwargs` of `cherrypy.lib.sessions.init` when it is used.
+    """
+
+    cherrypy.serving.session = LazySession(**kwargs)
+    if not hasattr(cherrypy, 'session'):
+        # Proxy to the session of the request as set up by the sessions tool
+        # pylint: disable=protected-access
+        cherrypy.session = cherrypy._ThreadLocalProxy('session')
+
+class LazySessionTool(SessionTool):
+    """
+    Session tool which initializes the session only when it is used.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.callable = init_lazy
+
+cherrypy.tools.lazy_sessions = LazySessionTool()
+
+class ReadOnlySession:
+    """
+    Snapshot of the session of a request, which holds the lock of the session
+    only while the data is copied.
+
+    Writing to the snapshot replaces it with the session, which is then locked
+    and loaded again, so that changes from concurrent requests are kept. Only
+    attributes that do not change the session are read from it directly, while
+    other methods, such as `update` or `regenerate`, upgrade it first.
+
+    Since an unchanged snapshot is not saved, the expiry of the session is not
+    extended by the request.
+    """
+
+    locked = False
+
+    # Attributes of the session that are read without locking it
+    _read_only = frozenset({
+        'id', 'originalid', 'missing', 'regenerated', 'loaded', 'timeout',
+        'debug', 'clean_freq', 'id_observers', 'now'
+    })
+
+    def __init__(self, session: Union[Session, LazySession]):
+        self._session = session
+        self._data: Optional[Dict[str, Any]] = None
+
+    @property
+    def session(self) -> Session:
+        """
+        Retrieve the session of the request.
+        """
+
+        if isinstance(self._session, LazySession):
+            self._session = self._session.initialize()
+
+            # Keep the snapshot in place of the initialized session.
+            cherrypy.serving.session = self
+
+        return self._session
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """
+        Retrieve a copy of the session data.
+        """
+
+        if self._data is None:
+            session = self.session
+            locked = session.locked
+            if not locked:
+                session.acquire_lock()
+            try:
+                self._data = dict(session.items())
+            finally:
+                session.release_lock()
+
+        return self._data
+
+    def upgrade(self) -> Session:
+        """
+        Lock and load the session for writing and use it for the remainder of
+        the request.
+        """
+
+        session = self.session
+        if cherrypy.serving.session is self:
+            session.acquire_lock()
+            session.load()
+            cherrypy.serving.session = session
+
+        return session
+
+    def acquire_lock(self) -> None:
+        """
+        Lock the session for writing.
+        """
+
+        self.upgrade()
+
+    def release_lock(self) -> None:
+        """
+        Do nothing, since the snapshot holds no lock.
+        """
+
+    def save(self) -> None:
+        """
+        Do nothing, since the snapshot was not changed.
+        """
+
+    def __getattr__(self, name: str) -> Any:
+        if name in self._read_only:
+            return getattr(self.session, name)
+
+        return getattr(self.upgrade(), name)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Retrieve the value of the `key` in the session, or the `default` if
+        it is not set.
+        """
+
+        return self.data.get(key, default)
+
+    def keys(self) -> KeysView[str]:
+        """
+        Retrieve the keys in the session.
+        """
+
+        return self.data.keys()
+
+    def values(self) -> ValuesView[Any]:
+        """
+        Retrieve the values in the session.
+        """
+
+        return self.data.values()
+
+    def items(self) -> ItemsView[str, Any]:
+        """
+        Retrieve the key-value pairs in the session.
+        """
+
+        return self.data.items()
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.upgrade()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.upgrade()[key]
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """
+        Remove the `key` from the session and return its value.
+        """
+
+        return self.upgrade().pop(key, default)
+
+def snapshot_session() -> None:
+    """
+    Replace the session of the request with a read-only snapshot. If the
+    session is already locked, then the lock is released right away.
+    """
+
+    session = getattr(cherrypy.serving, 'session', None)
+    if session is None:
+        return
+
+    snapshot = ReadOnlySession(session)
+    cherrypy.serving.session = snapshot
+    if session.locked:
+        snapshot.data.keys()
+
+cherrypy.tools.read_only_session = cherrypy.Tool('before_handler',
+                                                 snapshot_session, priority=60)
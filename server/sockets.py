@@ -0,0 +1,145 @@
+"""
+Listening sockets inherited from systemd or bound before starting workers.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import os
+from pathlib import Path
+import socket
+import stat
+from typing import Any, List, Optional
+import cherrypy
+from cherrypy._cpserver import Server
+from cherrypy._cpwsgi_server import CPWSGIServer
+from .workers import SharedPortServer
+
+# First file descriptor passed by systemd socket activation
+SD_LISTEN_FDS_START = 3
+
+def inherit_sockets() -> List[socket.socket]:
+    """
+    Retrieve the listening sockets that systemd passed to this process through
+    socket activation.
+
+    The environment variables of the protocol are removed, such that the
+    sockets are not used again by child processes or by the HTTP server.
+    """
+
+    try:
+        pid = int(os.environ.get('LISTEN_PID', ''))
+        count = int(os.environ.get('LISTEN_FDS', ''))
+    except ValueError:
+        return []
+    finally:
+        for variable in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+            os.environ.pop(variable, None)
+
+    if pid != os.getpid():
+        return []
+
+    listeners = []
+    for descriptor in range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + count):
+        os.set_inheritable(descriptor, False)
+        listeners.append(socket.socket(fileno=descriptor))
+
+    return listeners
+
+def bind_unix_socket(path: str, backlog: int = 5, mode: int = 0o660) \
+        -> socket.socket:
+    """
+    Create a Unix domain socket that listens at the `path`, replacing a stale
+    socket file that is left there. The socket file receives the permission
+    bits of the `mode`.
+    """
+
+    socket_path = Path(path)
+    try:
+        if stat.S_ISSOCK(socket_path.lstat().st_mode):
+            socket_path.unlink()
+    except FileNotFoundError:
+        pass
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        listener.bind(path)
+        # Allow the reverse proxy to connect through its user or group
+        socket_path.chmod(mode)
+        listener.listen(backlog)
+    except OSError:
+        listener.close()
+        raise
+
+    return listener
+
+class ListeningSocketServer(CPWSGIServer):
+    """
+    HTTP server which accepts connections on a socket that is already
+    listening, such as a socket inherited from systemd or one that is shared
+    between worker processes.
+
+    The server uses a duplicate of the `listener`, such that the socket stays
+    open when the server stops.
+    """
+
+    def __init__(self, server_adapter: Server, listener: socket.socket):
+        super().__init__(server_adapter)
+        self.listener = listener
+        address = listener.getsockname()
+        self.bind_addr = address[:2] if isinstance(address, tuple) \
+            else address
+
+    def bind(self, family: int, type: int, proto: int = 0) -> None:
+        # pylint: disable=redefined-builtin,unused-argument
+        self.socket = self.listener.dup() # pylint: disable=attribute-defined-outside-init
+
+    def bind_unix_socket(self, bind_addr: Any) -> None:
+        # pylint: disable=unused-argument
+        self.socket = self.listener.dup() # pylint: disable=attribute-defined-outside-init
+
+def use_socket(httpserver: CPWSGIServer) -> None:
+    """
+    Replace the HTTP server of CherryPy with the `httpserver` which accepts
+    connections on a socket that is already listening.
+    """
+
+    cherrypy.server.unsubscribe()
+    SharedPortServer(cherrypy.engine, httpserver,
+                     httpserver.bind_addr).subscribe()
+
+def open_listener(socket_path: Optional[str] = None, backlog: int = 5,
+                  mode: int = 0o660) -> Optional[socket.socket]:
+    """
+    Retrieve a listening socket inherited from systemd, or otherwise bind one
+    at the `socket_path` with the permission `mode`, if provided.
+    """
+
+    listeners = inherit_sockets()
+    if listeners:
+        if len(listeners) > 1:
+            logging.warning('Using only the first of %d inherited sockets',
+                            len(listeners))
+            for listener in listeners[1:]:
+                listener.close()
+
+        return listeners[0]
+
+    if socket_path is not None:
+        return bind_unix_socket(socket_path, backlog, mode)
+
+    return None
@@ -0,0 +1,154 @@
+"""
+Thread pool of the HTTP server with saturation metrics.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Deque, Dict, List, Union
+from cheroot.workers.threadpool import ThreadPool
+
+class MonitoredThreadPool(ThreadPool):
+    """
+    Thread pool of the HTTP server which tracks how long connections wait in
+    the queue before a thread handles them, and which can grow and shrink
+    between its minimum and maximum number of threads based on the queue.
+    """
+
+    # Attributes of the cheroot thread pool
+    _threads: List[Any]
+    _queue: 'queue.Queue[Any]'
+    _queue_put_timeout: int
+    _pending_shutdowns: Deque[None]
+
+    def __init__(self, server: Any, minimum: int = 10, maximum: int = -1,
+                 accepted_queue_size: int = -1,
+                 accepted_queue_timeout: int = 10):
+        # pylint: disable=too-many-arguments
+        super().__init__(server, min=minimum, max=maximum,
+                         accepted_queue_size=accepted_queue_size,
+                         accepted_queue_timeout=accepted_queue_timeout)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._queue_wait = 0.0
+        self._queue_wait_max = 0.0
+        self._idle_samples = 0
+        self.get = self._get
+
+    @classmethod
+    def replace(cls, httpserver: Any) -> 'MonitoredThreadPool':
+        """
+        Replace the thread pool of the `httpserver` with a monitored pool that
+        has the same settings, before the server is started.
+        """
+
+        # pylint: disable=protected-access
+        requests = httpserver.requests
+        pool = cls(httpserver, minimum=requests.min, maximum=requests.max,
+                   accepted_queue_size=requests._queue.maxsize,
+                   accepted_queue_timeout=requests._queue_put_timeout)
+        httpserver.requests = pool
+        return pool
+
+    def put(self, obj: Any) -> None:
+        self._queue.put((time.monotonic(), obj), block=True,
+                        timeout=self._queue_put_timeout)
+
+    def _get(self, block: bool = True, timeout: Union[float, None] = None) \
+        -> Any:
+        item = self._queue.get(block=block, timeout=timeout)
+        if not isinstance(item, tuple):
+            # Shutdown requests are put on the queue directly.
+            return item
+
+        start, conn = item
+        wait = time.monotonic() - start
+        with self._lock:
+            self._queued += 1
+            self._queue_wait += wait
+            self._queue_wait_max = max(self._queue_wait_max, wait)
+
+        return conn
+
+    @property
+    def size(self) -> int:
+        """
+        Retrieve the number of threads, excluding those that are shutting down.
+        """
+
+        return len(self._threads) - len(self._pending_shutdowns)
+
+    @property
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """
+        Retrieve the number of threads, idle threads and connections in the
+        queue, the utilization of the threads, and the number of times that
+        connections were taken from the queue, including kept-alive connections
+        with new requests, along with the total and maximum seconds that they
+        waited in the queue.
+        """
+
+        threads = self.size
+        idle = self.idle
+        with self._lock:
+            return {
+                'threads': threads,
+                'idle': idle,
+                'queue': self.qsize,
+                'utilization': (threads - idle) / threads if threads else 0.0,
+                'queued': self._queued,
+                'queue_wait': self._queue_wait,
+                'queue_wait_max': self._queue_wait_max
+            }
+
+    def adapt(self, shrink_after: int = 6) -> None:
+        """
+        Grow the pool when connections are queued while no thread is idle, or
+        shrink it when more than half of the threads were idle in the last
+        `shrink_after` calls.
+        """
+
+        threads = self.size
+        idle = self.idle
+        queued = self.qsize
+        if queued > 0 and idle == 0 and threads < self.max:
+            self._idle_samples = 0
+            logging.info('Growing thread pool of %d threads for %d queued connections',
+                         threads, queued)
+            self.grow(queued)
+        elif idle > threads // 2 and threads > self.min:
+            self._idle_samples += 1
+            if self._idle_samples >= shrink_after:
+                self._idle_samples = 0
+                logging.info('Shrinking thread pool of %d threads by %d',
+                             threads, idle // 2)
+                self.shrink(idle // 2)
+        else:
+            self._idle_samples = 0
+
+    def monitor(self, adaptive: bool = False) -> None:
+        """
+        Log the statistics of the pool and adapt the pool size if `adaptive`
+        is enabled. This is meant to be called periodically.
+        """
+
+        logging.debug('Thread pool: %r', self.stats)
+        if adaptive:
+            self.adapt()
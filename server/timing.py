@@ -0,0 +1,232 @@
+"""
+Timing of request phases and structured access logging.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import json
+import logging
+import time
+from typing import Any, Dict, Iterator, List, Optional
+import cherrypy
+
+PHASES = ('dispatch', 'session', 'authentication', 'handler', 'write')
+
+class _Phase:
+    # pylint: disable=too-few-public-methods
+    """
+    Bookkeeping for a phase in progress.
+    """
+
+    __slots__ = ('name', 'start', 'nested')
+
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.start = start
+        self.nested = 0.0
+
+class RequestTiming:
+    """
+    Wall time spent in phases of a request.
+
+    Time spent in a phase which starts while another phase is in progress is
+    only attributed to the inner phase.
+    """
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+        self._stack: List[_Phase] = []
+
+    @classmethod
+    def current(cls) -> 'RequestTiming':
+        """
+        Retrieve the timing of the current request.
+        """
+
+        request = cherrypy.serving.request
+        timing: Optional[RequestTiming] = getattr(request, 'timing', None)
+        if timing is None:
+            timing = cls()
+            setattr(request, 'timing', timing)
+
+        return timing
+
+    def start(self, phase: str) -> None:
+        """
+        Start measuring the time spent in a phase.
+        """
+
+        self._stack.append(_Phase(phase, time.perf_counter()))
+
+    def stop(self, phase: str) -> None:
+        """
+        Stop measuring the time spent in the most recently started phase with
+        the name `phase`, as well as any phases that were started after it.
+        """
+
+        if all(current.name != phase for current in self._stack):
+            return
+
+        now = time.perf_counter()
+        while self._stack:
+            current = self._stack.pop()
+            elapsed = now - current.start
+            self.phases[current.name] = self.phases.get(current.name, 0.0) + \
+                elapsed - current.nested
+            if self._stack:
+                self._stack[-1].nested += elapsed
+            if current.name == phase:
+                return
+
+    def stop_all(self) -> None:
+        """
+        Stop measuring the time of all phases in progress.
+        """
+
+        if self._stack:
+            self.stop(self._stack[0].name)
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """
+    Context manager which measures the time spent in a phase of the current
+    request.
+    """
+
+    timing = RequestTiming.current()
+    timing.start(phase)
+    try:
+        yield
+    finally:
+        timing.stop(phase)
+
+def route_label() -> str:
+    """
+    Retrieve a label for the exposed handler that the current request was
+    dispatched to, or '-' if no such handler was found.
+    """
+
+    request = cherrypy.serving.request
+    handler: Any = request.handler
+    while hasattr(handler, 'oldhandler'):
+        # Tools such as the response encoder wrap the handler
+        handler = handler.oldhandler
+
+    name = getattr(getattr(handler, 'callable', None), '__name__', None)
+    if name is None:
+        return '-'
+
+    return f'{request.script_name}/{name}'
+
+class StructuredAccessFilter(logging.Filter):
+    # pylint: disable=too-few-public-methods
+    """
+    Log filter which only lets through structured access log records and
+    other log records, but not the default access log lines.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not record.name.startswith('cherrypy.access') or \
+            hasattr(record, 'access')
+
+def _build_access(timing: RequestTiming) -> Dict[str, Any]:
+    request = cherrypy.serving.request
+    response = cherrypy.serving.response
+    status: Optional[int] = None
+    if response.output_status is not None:
+        status = int(response.output_status.split(b' ', 1)[0])
+
+    content_length = dict.get(response.headers, 'Content-Length')
+    timings = {
+        phase: round(timing.phases.get(phase, 0.0) * 1000, 3)
+        for phase in PHASES
+    }
+    timings['total'] = round((time.time() - response.time) * 1000, 3)
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'remote': request.remote.name or request.remote.ip,
+        'user': getattr(request, 'login', None),
+        'method': request.method,
+        'path': f'{request.script_name}{request.path_info}',
+        'query': request.query_string,
+        'route': route_label(),
+        'status': status,
+        'bytes': int(content_length) if content_length is not None else None,
+        'referer': request.headers.get('Referer'),
+        'user_agent': request.headers.get('User-Agent'),
+        'host': request.headers.get('Host'),
+        'id': str(request.unique_id),
+        'timings': timings
+    }
+
+def log_access() -> None:
+    """
+    Write a structured access log record with the timing of the phases of
+    the current request.
+    """
+
+    timing = RequestTiming.current()
+    timing.stop('write')
+    access = _build_access(timing)
+    logging.getLogger('cherrypy.access').info(
+        json.dumps(access, separators=(',', ':')), extra={'access': access}
+    )
+
+class TimingTool(cherrypy.Tool):
+    # pylint: disable=too-few-public-methods
+    """
+    Tool which measures the time spent in dispatching, loading and saving the
+    session, authenticating, running the handler and writing the response of
+    a request, which is logged as a structured access log record.
+    """
+
+    def __init__(self) -> None:
+        super().__init__('on_end_request', log_access, priority=100)
+
+    @staticmethod
+    def _start(phase: str) -> None:
+        RequestTiming.current().start(phase)
+
+    @staticmethod
+    def _stop(phase: str) -> None:
+        RequestTiming.current().stop(phase)
+
+    @staticmethod
+    def _write() -> None:
+        timing = RequestTiming.current()
+        timing.stop_all()
+        timing.start('write')
+
+    def _setup(self) -> None:
+        hooks = cherrypy.serving.request.hooks
+
+        # Surround the hooks of session tools, including locking
+        for point, end in (('before_request_body', 61),
+                           ('before_handler', 61), ('before_finalize', 51)):
+            hooks.attach(point, self._start, priority=49, phase='session')
+            hooks.attach(point, self._stop, priority=end, phase='session')
+
+        hooks.attach('before_handler', self._start, priority=100,
+                     phase='handler')
+        hooks.attach('before_finalize', self._stop, priority=1,
+                     phase='handler')
+        hooks.attach('on_end_resource', self._write, priority=100)
+        hooks.attach(self._point, self.callable, priority=self._priority)
+
+cherrypy.tools.timing = TimingTool()
@@ -0,0 +1,303 @@
+"""
+Authentication schemes based on Unix password databases.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor, \
+    TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from configparser import RawConfigParser
+import crypt
+import logging
+import multiprocessing
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, \
+    TYPE_CHECKING
+try:
+    import pwd
+except ImportError:
+    if not TYPE_CHECKING:
+        pwd = None
+try:
+    import spwd
+except ImportError:
+    if not TYPE_CHECKING:
+        spwd = None
+
+from .authentication import Authentication, BackendException, \
+    LoginException, Validation
+
+class UnixDatabase:
+    """
+    Indexed snapshot of a colon-separated Unix user database file, such as
+    `/etc/passwd` or `/etc/shadow`.
+
+    The file is parsed again only when its inode, modification time or size
+    changes. Users that are not in the file, for example because they are
+    provided through other name services, are retrieved using `lookup`.
+    """
+
+    def __init__(self, path: str, lookup: Callable[[str], Sequence[Any]]):
+        self._path = path
+        self._lookup = lookup
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int, int, int]] = None
+        self._entries: Dict[str, Tuple[str, ...]] = {}
+        self._reloads = 0
+
+    @property
+    def reloads(self) -> int:
+        """
+        Retrieve the number of times that the file was parsed.
+        """
+
+        return self._reloads
+
+    def _parse(self) -> Dict[str, Tuple[str, ...]]:
+        entries: Dict[str, Tuple[str, ...]] = {}
+        with open(self._path, 'r', encoding='utf-8',
+                  errors='surrogateescape') as database:
+            for line in database:
+                # Skip comments and NIS compatibility entries
+                if line.startswith(('#', '+', '-')) or ':' not in line:
+                    continue
+
+                fields = tuple(line.rstrip('\n').split(':'))
+                entries.setdefault(fields[0], fields)
+
+        return entries
+
+    def _load(self) -> Dict[str, Tuple[str, ...]]:
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return {}
+
+        signature = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return self._entries
+
+        with self._lock:
+            if signature != self._signature:
+                try:
+                    self._entries = self._parse()
+                except OSError as error:
+                    logging.debug('Cannot read %s: %s', self._path, error)
+                    self._entries = {}
+
+                self._signature = signature
+                self._reloads += 1
+
+            return self._entries
+
+    def get(self, username: str) -> Sequence[Any]:
+        """
+        Retrieve the fields of the entry for the `username`.
+
+        If the user does not exist, then a `KeyError` is raised.
+        """
+
+        entry = self._load().get(username)
+        if entry is not None:
+            return entry
+
+        return self._lookup(username)
+
+def _verify_password(password: str, crypted_password: str) -> bool:
+    return crypt.crypt(password, crypted_password) == crypted_password
+
+class Unix(Authentication):
+    """
+    Authentication based on Unix password databases.
+
+    User entries are read from an indexed snapshot of the `passwd_file`
+    option in the `unix` section of the configuration, `/etc/passwd` by
+    default.
+
+    Password hashes are verified in the request thread by default. If the
+    `processes` option in the `unix` section of the configuration is set, then
+    verification takes place in a pool of that many processes, with at most
+    `queue_size` verifications pending and each taking at most `timeout`
+    seconds.
+    """
+
+    def __init__(self, args: Namespace, config: RawConfigParser):
+        super().__init__(args, config)
+        self._passwd = UnixDatabase(self._get_path('passwd_file', '/etc/passwd'),
+                                    self._lookup_passwd)
+        self._processes = int(self._get_float('unix', 'processes', 0))
+        self._timeout = self._get_float('unix', 'timeout', 5.0)
+        queue_size = int(self._get_float('unix', 'queue_size',
+                                         self._processes * 4))
+        self._queue = threading.BoundedSemaphore(max(1, queue_size))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @staticmethod
+    def _lookup_passwd(username: str) -> Sequence[Any]:
+        # Name service lookup, deferred since pwd is unavailable on some
+        # platforms
+        return pwd.getpwnam(username)
+
+    def _get_path(self, option: str, default: str) -> str:
+        if self.config.has_option('unix', option):
+            return self.config.get('unix', option)
+
+        return default
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # Forking the multi-threaded server may copy locks that other
+                # threads hold, so workers start from a clean process.
+                methods = multiprocessing.get_all_start_methods()
+                method = 'forkserver' if 'forkserver' in methods else 'spawn'
+                context = multiprocessing.get_context(method)
+                self._executor = ProcessPoolExecutor(self._processes,
+                                                     mp_context=context)
+
+            return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor) -> None:
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+
+        executor.shutdown(wait=False)
+
+    def verify_password(self, password: str, crypted_password: str) -> bool:
+        """
+        Check whether the password matches the crypted password.
+
+        If the verification cannot be performed in the process pool, then
+        a `BackendException` is raised.
+        """
+
+        if self._processes <= 0:
+            return _verify_password(password, crypted_password)
+
+        if not self._queue.acquire(blocking=False): # pylint: disable=consider-using-with
+            raise BackendException('Too many pending password verifications')
+
+        executor: Optional[ProcessPoolExecutor] = None
+        try:
+            executor = self._get_executor()
+            future = executor.submit(_verify_password, password,
+                                     crypted_password)
+        except (BrokenProcessPool, OSError) as error:
+            self._queue.release()
+            if executor is not None:
+                self._reset_executor(executor)
+            raise BackendException('Password verification failed') from error
+        except BaseException:
+            self._queue.release()
+            raise
+
+        future.add_done_callback(lambda _: self._queue.release())
+        try:
+            return future.result(timeout=self._timeout)
+        except FutureTimeoutError as error:
+            future.cancel()
+            raise BackendException('Password verification timed out') from error
+        except BrokenProcessPool as error:
+            self._reset_executor(executor)
+            raise BackendException('Password verification failed') from error
+
+    def get_crypted_password(self, username: str) -> str:
+        """
+        Retrieve the crypted password for the username from the database.
+
+        If the password cannot be retrieved, a `LoginException` is raised.
+        """
+
+        raise NotImplementedError('Must be implemented in subclasses')
+
+    def get_display_name(self, username: str) -> str:
+        """
+        Retrieve the display name for the username.
+
+        If the display name is unavailable, then the username is returned.
+        """
+
+        try:
+            display_name = str(self._passwd.get(username)[4]).split(',', 1)[0]
+        except KeyError:
+            return username
+
+        if display_name == '':
+            return username
+
+        return display_name
+
+    def validate(self, username: str, password: str) -> Validation:
+        crypted_password = self.get_crypted_password(username)
+        if crypted_password in ('', 'x', '*', '********'):
+            raise LoginException(f'Password is disabled for {username}')
+
+        if self.verify_password(password, crypted_password):
+            return self.get_display_name(username)
+
+        raise LoginException('Invalid credentials')
+
+    def close(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+@Authentication.register('pwd')
+class UnixPwd(Unix):
+    """
+    Authentication using the `/etc/passwd` database.
+    """
+
+    def __init__(self, args: Namespace, config: RawConfigParser):
+        super().__init__(args, config)
+        if pwd is None:
+            raise ImportError('pwd not available on this platform')
+
+    def get_crypted_password(self, username: str) -> str:
+        try:
+            return str(self._passwd.get(username)[1])
+        except KeyError as error:
+            raise LoginException(f'User {username} does not exist') from error
+
+@Authentication.register('spwd')
+class UnixSpwd(Unix):
+    """
+    Authentication using the `/etc/shadow` privileged database.
+
+    The file that is indexed can be changed with the `shadow_file` option in
+    the `unix` section of the configuration.
+    """
+
+    def __init__(self, args: Namespace, config: RawConfigParser):
+        super().__init__(args, config)
+        if spwd is None:
+            raise ImportError('spwd not available on this platform')
+
+        self._shadow = UnixDatabase(self._get_path('shadow_file', '/etc/shadow'),
+                                    spwd.getspnam)
+
+    def get_crypted_password(self, username: str) -> str:
+        try:
+            return str(self._shadow.get(username)[1])
+        except KeyError as error:
+            raise LoginException(f'User {username} does not exist') from error
@@ -0,0 +1,243 @@
+"""
+Supervision of pre-forked worker processes.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import os
+from pathlib import Path
+import signal
+import threading
+import time
+from types import FrameType
+from typing import Callable, Dict, Optional
+import cherrypy
+from cherrypy._cpwsgi_server import CPWSGIServer
+from cherrypy.process.servers import ServerAdapter
+
+class SharedPortServer(ServerAdapter):
+    """
+    Adapter for an HTTP server which binds to a port that other processes
+    listen on as well.
+
+    Unlike the default adapter, it does not wait for the port to be free.
+    """
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self.interrupt = None
+        thread = threading.Thread(target=self._start_http_thread,
+                                  name='HTTPServer shared')
+        thread.start()
+        self.wait()
+        self.running = True
+        self.bus.log(f'Serving on {self.description}')
+
+def share_port(httpserver: CPWSGIServer) -> None:
+    """
+    Replace the HTTP server of CherryPy with the `httpserver`, which binds its
+    socket with the `SO_REUSEPORT` option, so that the kernel distributes
+    connections between processes that listen on the same port.
+    """
+
+    httpserver.reuse_port = True
+    cherrypy.server.unsubscribe()
+    SharedPortServer(cherrypy.engine, httpserver,
+                     cherrypy.server.bind_addr).subscribe()
+
+class Supervisor:
+    # pylint: disable=too-many-instance-attributes
+    """
+    Supervisor which forks `count` worker processes that each run `target` and
+    restarts workers that stop unexpectedly.
+
+    The supervisor writes its own process ID to the `pidfile`. When it receives
+    a `SIGTERM` or `SIGINT` signal, it sends `SIGTERM` to the workers, waits at
+    most `shutdown_timeout` seconds for them to stop before killing them, and
+    removes the PID file. After a `SIGUSR1` signal, the workers are stopped in
+    the same way and then started again. A `SIGHUP` signal calls `reload` in
+    the supervisor, such that workers started later use a new configuration,
+    and is then passed on to the workers.
+    """
+
+    def __init__(self, count: int, target: Callable[[], None], *,
+                 reload: Optional[Callable[[], None]] = None,
+                 pidfile: Optional[str] = None, shutdown_timeout: float = 30.0,
+                 restart_delay: float = 1.0, poll_interval: float = 0.5):
+        # pylint: disable=too-many-arguments
+        if count < 1:
+            raise ValueError('At least one worker is required')
+
+        self._count = count
+        self._target = target
+        self._reload = reload
+        self._pidfile = pidfile
+        self._shutdown_timeout = shutdown_timeout
+        self._restart_delay = restart_delay
+        self._poll_interval = poll_interval
+
+        self._workers: Dict[int, float] = {}
+        self._stopping = False
+        self._stopped = threading.Event()
+        self.restarts = 0
+
+    @property
+    def workers(self) -> Dict[int, float]:
+        """
+        Retrieve the process IDs of the running workers along with the time at
+        which they were started.
+        """
+
+        return self._workers.copy()
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid != 0:
+            self._workers[pid] = time.monotonic()
+            logging.info('Started worker %d', pid)
+            return
+
+        # Worker process
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP,
+                       signal.SIGUSR1):
+            signal.signal(signum, signal.SIG_DFL)
+
+        code = 1
+        try:
+            self._target()
+            code = 0
+        except SystemExit as error:
+            code = error.code if isinstance(error.code, int) else 1
+        except BaseException: # pylint: disable=broad-exception-caught
+            logging.exception('Worker %d failed', os.getpid())
+        finally:
+            os._exit(code) # pylint: disable=protected-access
+
+    def _signal(self, signum: int) -> None:
+        for pid in self._workers:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _handle_stop(self, signum: int, frame: Optional[FrameType]) -> None:
+        # pylint: disable=unused-argument
+        self.stop()
+
+    def _handle_restart(self, signum: int, frame: Optional[FrameType]) \
+        -> None:
+        # pylint: disable=unused-argument
+        logging.info('Restarting %d workers', len(self._workers))
+        self._signal(signal.SIGTERM)
+
+    def _handle_reload(self, signum: int, frame: Optional[FrameType]) \
+        -> None:
+        # pylint: disable=unused-argument
+        logging.info('Reloading %d workers', len(self._workers))
+        if self._reload is not None:
+            self._reload()
+        self._signal(signal.SIGHUP)
+
+    def stop(self) -> None:
+        """
+        Stop the workers and do not restart them.
+        """
+
+        if not self._stopping:
+            logging.info('Stopping %d workers', len(self._workers))
+            self._stopping = True
+            self._signal(signal.SIGTERM)
+            self._stopped.set()
+
+    def _reap(self, pid: int, status: int) -> None:
+        started = self._workers.pop(pid, None)
+        if started is None or self._stopping:
+            return
+
+        if os.WIFSIGNALED(status):
+            logging.warning('Worker %d stopped by signal %d, restarting',
+                            pid, os.WTERMSIG(status))
+        else:
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else status
+            logging.warning('Worker %d stopped with status %d, restarting',
+                            pid, code)
+        if time.monotonic() - started < self._restart_delay:
+            # Avoid restarting workers that fail at startup in a tight loop.
+            time.sleep(self._restart_delay)
+
+        self.restarts += 1
+        if not self._stopping:
+            self._spawn()
+
+    def _reap_exited(self) -> None:
+        while self._workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._workers.clear()
+                return
+
+            if pid == 0:
+                return
+
+            self._reap(pid, status)
+
+    def _shutdown(self) -> None:
+        deadline = time.monotonic() + self._shutdown_timeout
+        while self._workers and time.monotonic() < deadline:
+            time.sleep(0.1)
+            self._reap_exited()
+
+        if self._workers:
+            logging.warning('Killing %d workers after shutdown timeout',
+                            len(self._workers))
+            self._signal(signal.SIGKILL)
+            while self._workers:
+                self._reap(*os.waitpid(-1, 0))
+
+    def start(self) -> None:
+        """
+        Start the workers and supervise them until the supervisor is stopped.
+        """
+
+        if self._pidfile is not None:
+            Path(self._pidfile).write_text(f'{os.getpid()}\n', encoding='utf-8')
+
+        handlers = {
+            signal.SIGTERM: signal.signal(signal.SIGTERM, self._handle_stop),
+            signal.SIGINT: signal.signal(signal.SIGINT, self._handle_stop),
+            signal.SIGHUP: signal.signal(signal.SIGHUP, self._handle_reload),
+            signal.SIGUSR1: signal.signal(signal.SIGUSR1, self._handle_restart)
+        }
+        try:
+            for _ in range(self._count):
+                self._spawn()
+
+            # Poll for stopped workers until a signal or call stops the wait.
+            while not self._stopping:
+                self._reap_exited()
+                self._stopped.wait(self._poll_interval)
+
+            self._shutdown()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            if self._pidfile is not None:
+                Path(self._pidfile).unlink(missing_ok=True)
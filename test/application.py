@@ -22,11 +22,16 @@ from argparse import Namespace
 from configparser import RawConfigParser
 from datetime import datetime
 from http.cookies import SimpleCookie
-from unittest.mock import patch
+import unittest
+from unittest.mock import MagicMock, patch
 import cherrypy
 from cherrypy.test import helper
-from server.application import Authenticated_Application
-from server.authentication import Open
+from server.application import Authenticated_Application, \
+    register_authentication_metrics
+from server.authentication import BackendException, Open
+from server.breaker import CircuitOpenError
+from server.metrics import Registry
+from server.sessions import CookieSession, read_only_session, session_free
 
 class TestServer(Authenticated_Application):
     """
@@ -47,6 +52,24 @@ class TestServer(Authenticated_Application):
 
         return f"List page for {cherrypy.session['authenticated']}"
 
+    @cherrypy.expose
+    @read_only_session
+    def user(self) -> str:
+        """
+        Page which only reads the session.
+        """
+
+        return str(cherrypy.session.get('authenticated', 'nobody'))
+
+    @cherrypy.expose
+    @session_free
+    def health(self) -> str:
+        """
+        Page which does not use the session.
+        """
+
+        return "OK"
+
 class AuthenticatedApplicationTest(helper.CPWebCase):
     """
     Tests for Web application that requires authentication.
@@ -71,6 +94,30 @@ class AuthenticatedApplicationTest(helper.CPWebCase):
             }
         })
 
+        cherrypy.tree.mount(TestServer(args, config), '/cookie', {
+            '/': {
+                'tools.sessions.on': True,
+                'tools.sessions.storage_class': CookieSession,
+                'tools.sessions.signing_keys': (b'secret',)
+            }
+        })
+
+        cherrypy.tree.mount(TestServer(args, config), '/lazy', {
+            '/': {
+                'tools.lazy_sessions.on': True
+            }
+        })
+
+        limited = Namespace(**vars(args))
+        limited.user_login_rate = 1
+        limited.client_login_rate = 2
+        limited.login_burst = 1
+        cherrypy.tree.mount(TestServer(limited, config), '/limited', {
+            '/': {
+                'tools.sessions.on': True
+            }
+        })
+
     def test_index(self) -> None:
         """
         Test the index page.
@@ -111,6 +158,91 @@ class AuthenticatedApplicationTest(helper.CPWebCase):
             self.assertStatus('200 OK')
             self.assertBody('List page for Test User')
 
+    def test_cookie_session(self) -> None:
+        """
+        Test logging in with a session stored in a signed cookie.
+        """
+
+        with patch.object(Open, 'validate', return_value='Test User'):
+            self.getPage("/cookie/login", method="POST",
+                         body='username=testuser&password=testpass')
+
+        header = self.assertHeader('Set-Cookie')
+        cookie = SimpleCookie()
+        cookie.load(header)
+
+        session_id = cookie["session_id"].value
+        self.assertEqual(cookie["session_id"]["path"], "/")
+        self.getPage("/cookie/list",
+                     headers=[('Cookie', f'session_id={session_id}')])
+        self.assertStatus('200 OK')
+        self.assertBody('List page for Test User')
+
+        self.getPage("/cookie/list",
+                     headers=[('Cookie', f'session_id={session_id[1:]}')])
+        self.assertIn('/index?page=list', self.assertHeader('Location'))
+
+    def test_session_free(self) -> None:
+        """
+        Test a page that does not use the session.
+        """
+
+        self.getPage("/health")
+        self.assertStatus('200 OK')
+        self.assertNoHeader('Set-Cookie')
+
+        self.getPage("/")
+        self.assertHeader('Set-Cookie')
+
+    def test_read_only_session(self) -> None:
+        """
+        Test a page that only reads the session.
+        """
+
+        self.getPage("/user")
+        self.assertBody('nobody')
+
+        self.getPage("/login", method="POST", body='username=foo&password=bar')
+        header = self.assertHeader('Set-Cookie')
+        cookie = SimpleCookie()
+        cookie.load(header)
+
+        session_id = cookie["session_id"].value
+        self.getPage("/user", headers=[('Cookie', f'session_id={session_id}')])
+        self.assertStatus('200 OK')
+        self.assertBody('foo')
+
+        self.getPage("/lazy/user")
+        self.assertBody('nobody')
+
+    def test_lazy_session(self) -> None:
+        """
+        Test loading the session only when it is used.
+        """
+
+        self.getPage("/lazy/")
+        self.assertStatus('200 OK')
+        self.assertNoHeader('Set-Cookie')
+
+        self.getPage("/lazy/login", method="POST",
+                     body='username=foo&password=bar')
+        header = self.assertHeader('Set-Cookie')
+        cookie = SimpleCookie()
+        cookie.load(header)
+
+        session_id = cookie["session_id"].value
+        self.getPage("/lazy/list",
+                     headers=[('Cookie', f'session_id={session_id}')])
+        self.assertStatus('200 OK')
+        self.assertBody('List page for foo')
+
+        self.getPage("/lazy/logout",
+                     headers=[('Cookie', f'session_id={session_id}')])
+        self.assertIn('/index', self.assertHeader('Location'))
+        self.getPage("/lazy/list",
+                     headers=[('Cookie', f'session_id={session_id}')])
+        self.assertIn('/index?page=list', self.assertHeader('Location'))
+
     def test_login(self) -> None:
         """
         Test the login page.
@@ -141,10 +273,49 @@ class AuthenticatedApplicationTest(helper.CPWebCase):
         self.assertStatus('400 Bad Request')
         self.assertInBody('Page must be valid')
 
+        # Methods and properties that are not exposed are no valid pages.
+        for page in ('validate_page', 'authentication'):
+            self.getPage(f"/login?page={page}", method="POST",
+                         body='username=foo&password=bar')
+            self.assertStatus('400 Bad Request')
+
+        with patch.object(Open, 'validate',
+                          side_effect=BackendException('Unavailable')):
+            self.getPage("/login", method="POST",
+                         body='username=foo&password=bar')
+            self.assertStatus('503 Service Unavailable')
+
         self.getPage("/login?username=foo&password=oops", method="GET")
         self.assertStatus('400 Bad Request')
         self.assertInBody('POST only allowed for username and password')
 
+    def test_login_limit(self) -> None:
+        """
+        Test rate limiting login attempts.
+        """
+
+        self.getPage("/limited/login", method="POST",
+                     body='username=foo&password=bar')
+        self.assertStatus('303 See Other')
+
+        with patch.object(Open, 'validate') as validate:
+            self.getPage("/limited/login", method="POST",
+                         body='username=foo&password=bar')
+            self.assertStatus('429 Too Many Requests')
+            self.assertHeader('Retry-After', '30')
+
+            # Another user is limited by the client address.
+            self.getPage("/limited/login", method="POST",
+                         body='username=baz&password=qux')
+            self.assertStatus('429 Too Many Requests')
+            self.assertHeader('Retry-After', '30')
+            validate.assert_not_called()
+
+        # The limited client did not take tokens of the users.
+        limiter = cherrypy.tree.apps['/limited'].root.login_limiters['user']
+        self.assertEqual(limiter.stats['allowed'], 1)
+        self.assertEqual(limiter.stats['rejected'], 0)
+
     def test_logout(self) -> None:
         """
         Test the logout page.
@@ -178,3 +349,194 @@ class AuthenticatedApplicationTest(helper.CPWebCase):
         self.getPage("/nonexistent",
                      headers=[('Cookie', f'session_id={session_id}')])
         self.assertStatus('404 Not Found')
+
+class CredentialCacheTest(unittest.TestCase):
+    """
+    Tests for caching validated credentials in the application.
+    """
+
+    def test_validate_credentials(self) -> None:
+        """
+        Test validating credentials with the cache enabled.
+        """
+
+        args = Namespace()
+        args.auth = 'open'
+        args.debug = True
+
+        config = RawConfigParser()
+        config['auth'] = {'cache_size': '10', 'cache_ttl': '60'}
+        server = TestServer(args, config)
+        if server.credential_cache is None:
+            self.fail('Credential cache must be enabled')
+
+        with patch.object(Open, 'validate',
+                          side_effect=['Test User', False]) as validate:
+            # pylint: disable=protected-access
+            self.assertEqual(server._validate_credentials('foo', 'bar'),
+                             'Test User')
+            self.assertEqual(server._validate_credentials('foo', 'bar'),
+                             'Test User')
+            validate.assert_called_once_with('foo', 'bar')
+
+            self.assertFalse(server._validate_credentials('foo', 'baz'))
+            self.assertEqual(server.credential_cache.stats['open']['hits'], 1)
+
+class CircuitBreakerTest(unittest.TestCase):
+    """
+    Tests for failing fast when the authentication backend is unavailable.
+    """
+
+    def test_validate_credentials(self) -> None:
+        """
+        Test validating credentials with the circuit breaker.
+        """
+
+        args = Namespace()
+        args.auth = 'open'
+        args.debug = True
+
+        config = RawConfigParser()
+        config['auth'] = {'breaker_threshold': '2', 'breaker_cooldown': '60'}
+        server = TestServer(args, config)
+
+        with patch.object(Open, 'validate',
+                          side_effect=BackendException('Unavailable')) \
+            as validate:
+            # pylint: disable=protected-access
+            with self.assertRaises(BackendException):
+                server._validate_credentials('foo', 'bar')
+            with self.assertLogs(level='WARNING'):
+                with self.assertRaises(BackendException):
+                    server._validate_credentials('foo', 'bar')
+            with self.assertRaises(CircuitOpenError):
+                server._validate_credentials('foo', 'bar')
+            self.assertEqual(validate.call_count, 2)
+            self.assertEqual(server.breaker.stats['state'], 'open')
+
+        # Errors in the scheme itself do not open the circuit.
+        server = TestServer(args, config)
+        with patch.object(Open, 'validate', side_effect=KeyError('user')):
+            # pylint: disable=protected-access
+            for _ in range(3):
+                with self.assertRaises(KeyError):
+                    server._validate_credentials('foo', 'bar')
+        self.assertEqual(server.breaker.stats['state'], 'closed')
+        self.assertEqual(server.breaker.stats['failures'], 0)
+
+class ReloadTest(unittest.TestCase):
+    """
+    Tests for replacing the authentication scheme of the application.
+    """
+
+    def test_reload(self) -> None:
+        """
+        Test replacing the authentication scheme.
+        """
+
+        # pylint: disable=protected-access
+        args = Namespace()
+        args.auth = 'open'
+        args.debug = True
+
+        config = RawConfigParser()
+        config['auth'] = {'cache_size': '10'}
+        server = TestServer(args, config)
+        authentication = server.authentication
+        self.assertTrue(server._validate_credentials('foo', 'bar'))
+
+        with patch.object(Open, 'close') as close:
+            with server._use_state() as state:
+                with self.assertLogs(level='INFO'):
+                    server.reload(args, RawConfigParser())
+
+                # Requests in progress finish with the previous scheme.
+                self.assertIs(state.authentication, authentication)
+                close.assert_not_called()
+
+            close.assert_called_once_with()
+
+        self.assertIsNot(server.authentication, authentication)
+        self.assertIsNone(server.credential_cache)
+
+        args.auth = 'nonexistent'
+        with self.assertRaises(RuntimeError):
+            server.reload(args, config)
+        self.assertIsInstance(server.authentication, Open)
+
+    def test_authentication(self) -> None:
+        """
+        Test assigning an authentication scheme.
+        """
+
+        # pylint: disable=protected-access
+        args = Namespace()
+        args.auth = 'open'
+        args.debug = True
+
+        config = RawConfigParser()
+        config['auth'] = {'cache_size': '10'}
+        server = TestServer(args, config)
+        previous = server.authentication
+        cache = server.credential_cache
+        breaker = server.breaker
+        self.assertTrue(server._validate_credentials('foo', 'bar'))
+
+        replacement = Open(args, config)
+        with patch.object(Open, 'close') as close:
+            with server._use_state():
+                server.authentication = replacement
+                close.assert_not_called()
+
+            close.assert_called_once_with()
+
+        self.assertIs(server.authentication, replacement)
+        self.assertIsNot(server.authentication, previous)
+        self.assertIs(server.credential_cache, cache)
+        self.assertIs(server.breaker, breaker)
+        self.assertIsNotNone(cache)
+        if cache is not None:
+            self.assertEqual(cache.invalidate(), 0)
+
+class MetricsTest(unittest.TestCase):
+    """
+    Tests for metrics of components of authenticated applications.
+    """
+
+    def test_register(self) -> None:
+        """
+        Test registering metrics of mounted authenticated applications.
+        """
+
+        # pylint: disable=protected-access
+        args = Namespace()
+        args.auth = 'open'
+        args.debug = True
+        args.user_login_rate = 60
+        args.login_burst = 5
+
+        config = RawConfigParser()
+        config['auth'] = {'cache_size': '10'}
+        server = TestServer(args, config)
+        server._limit_login('foo')
+        self.assertTrue(server._validate_credentials('foo', 'bar'))
+        self.assertTrue(server._validate_credentials('foo', 'bar'))
+
+        registry = Registry()
+        register_authentication_metrics(registry)
+        apps = {'/app': MagicMock(root=server), '': MagicMock(root=object())}
+        with patch.dict(cherrypy.tree.apps, apps, clear=True):
+            output = registry.render()
+
+        for line in (
+            'gros_server_authentication_breaker_state{application="/app",state="closed"} 1',
+            'gros_server_authentication_breaker_state{application="/app",state="open"} 0',
+            'gros_server_authentication_breaker_failures_total{application="/app"} 0',
+            'gros_server_credential_cache_hits_total{application="/app",scheme="open"} 1',
+            'gros_server_credential_cache_hit_ratio{application="/app",scheme="open"} 0.5',
+            'gros_server_login_limiter_allowed_total{application="/app",limiter="user"} 1',
+            '# TYPE gros_server_ldap_pool_created_total counter'
+        ):
+            self.assertIn(line, output.split('\n'))
+
+        self.assertNotIn('gros_server_ldap_pool_created_total{', output)
@@ -19,11 +19,28 @@ limitations under the License.
 """
 
 from argparse import Namespace
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from configparser import RawConfigParser
+import crypt
+from pathlib import Path
+import sys
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock, DEFAULT
-from typing import Any, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
-from server.authentication import Authentication, LDAP, LoginException, Open
+from typing import Any, Dict, List, Optional, Tuple, Type, Union, \
+    TYPE_CHECKING
+import server.authentication
+import server.unix
+from server.authentication import Authentication, BackendException, \
+    LoginException, Open
+from server.directory import LDAP, MembershipIndex
+from server.unix import Unix, UnixDatabase, UnixPwd, UnixSpwd
+try:
+    import spwd
+except ImportError:
+    if not TYPE_CHECKING:
+        spwd = None
 try:
     import ldap
 except ImportError:
@@ -44,9 +61,65 @@ class AuthenticationTest(unittest.TestCase):
         """
 
         self.assertEqual(Authentication.get_type('open'), Open)
+        self.assertEqual(Authentication.get_type('pwd'), UnixPwd)
         with self.assertRaises(RuntimeError):
             Authentication.get_type('nonexistent')
 
+        # Schemes remain importable from the module where they were defined.
+        self.assertEqual(server.authentication.LDAP, LDAP)
+        with self.assertRaises(AttributeError):
+            getattr(server.authentication, 'Nonexistent')
+
+    @patch.dict(Authentication._auth_types) # pylint: disable=protected-access
+    def test_register(self) -> None:
+        """
+        Test registering a scheme by its import path.
+        """
+
+        # Restore the module on the package as well, since importing it again
+        # replaces the attribute that patches of server.unix resolve through.
+        with patch.dict(sys.modules), \
+                patch.object(server, 'unix', server.unix):
+            sys.modules.pop('server.unix', None)
+            Authentication.register('unix', 'server.unix:UnixPwd')
+            self.assertNotIn('server.unix', sys.modules)
+            self.assertIn('unix', Authentication.get_types())
+
+            unix = Authentication.get_type('unix')
+            self.assertIn('server.unix', sys.modules)
+            self.assertEqual(unix.__name__, 'UnixPwd')
+
+        Authentication.register('invalid', 'server.authentication:Validation')
+        with self.assertRaises(RuntimeError):
+            Authentication.get_type('invalid')
+
+    @patch.dict(Authentication._auth_types) # pylint: disable=protected-access
+    @patch.object(Authentication, '_discovered', False)
+    @patch('importlib.metadata.entry_points')
+    def test_discover(self, entry_points: MagicMock) -> None:
+        """
+        Test discovering schemes through entry points.
+        """
+
+        entry = MagicMock()
+        entry.name = 'plugin'
+        entry.value = 'server.authentication:Open'
+        override = MagicMock()
+        override.name = 'open'
+        override.value = 'server.unix:UnixPwd'
+        if sys.version_info >= (3, 10):
+            entry_points.return_value = [entry, override]
+        else:
+            entry_points.return_value = {
+                'gros_server.authentication': [entry, override]
+            }
+
+        self.assertEqual(Authentication.get_type('plugin'), Open)
+        self.assertEqual(Authentication.get_type('open'), Open)
+        self.assertEqual(Authentication.get_types(),
+                         ('open', 'pwd', 'spwd', 'ldap', 'plugin'))
+        entry_points.assert_called_once()
+
     def test_get_types(self) -> None:
         """
         Test retrieving the authentication type names.
@@ -76,11 +149,239 @@ class OpenTest(unittest.TestCase):
         self.assertTrue(auth.validate('foo', 'bar'))
         self.assertFalse(auth.validate('', 'baz'))
 
+class TestUnix(Unix):
+    """
+    Unix authentication with a fixed password database.
+    """
+
+    def get_crypted_password(self, username: str) -> str:
+        if username == 'disabled':
+            return '*'
+        if username != 'testuser':
+            raise LoginException(f'User {username} does not exist')
+
+        return crypt.crypt('testpass', crypt.mksalt(crypt.METHOD_SHA256))
+
+    def get_display_name(self, username: str) -> str:
+        return 'Test User'
+
+class UnixTest(unittest.TestCase):
+    """
+    Tests for authentication based on Unix password databases.
+    """
+
+    def setUp(self) -> None:
+        self.args = Namespace()
+        self.config = RawConfigParser()
+
+    def test_validate(self) -> None:
+        """
+        Test validating the login of a user with a password.
+        """
+
+        auth = TestUnix(self.args, self.config)
+        self.assertEqual(auth.validate('testuser', 'testpass'), 'Test User')
+        with self.assertRaisesRegex(LoginException, 'Invalid credentials'):
+            auth.validate('testuser', 'wrong')
+        with self.assertRaisesRegex(LoginException, 'Password is disabled'):
+            auth.validate('disabled', 'testpass')
+        with self.assertRaisesRegex(LoginException, 'does not exist'):
+            auth.validate('other', 'testpass')
+
+    def test_validate_processes(self) -> None:
+        """
+        Test validating the login with verification in a process pool.
+        """
+
+        self.config['unix'] = {'processes': '1', 'queue_size': '1'}
+        auth = TestUnix(self.args, self.config)
+        try:
+            self.assertEqual(auth.validate('testuser', 'testpass'),
+                             'Test User')
+            with self.assertRaisesRegex(LoginException, 'Invalid'):
+                auth.validate('testuser', 'wrong')
+        finally:
+            auth.close()
+
+    @patch('server.unix.ProcessPoolExecutor')
+    def test_validate_unavailable(self, executor: MagicMock) -> None:
+        """
+        Test verifications that cannot be performed by the process pool.
+        """
+
+        self.config['unix'] = {
+            'processes': '2',
+            'queue_size': '1',
+            'timeout': '0.5'
+        }
+        auth = TestUnix(self.args, self.config)
+        future = executor.return_value.submit.return_value
+
+        # The done callback is not called, so the queue stays full.
+        future.result.side_effect = FutureTimeoutError
+        with self.assertRaisesRegex(BackendException, 'timed out'):
+            auth.validate('testuser', 'testpass')
+        future.result.assert_called_once_with(timeout=0.5)
+        future.cancel.assert_called_once_with()
+        with self.assertRaisesRegex(BackendException, 'Too many pending'):
+            auth.validate('testuser', 'testpass')
+
+        future.add_done_callback.call_args[0][0](future)
+        future.result.side_effect = BrokenProcessPool
+        with self.assertRaisesRegex(BackendException, 'failed'):
+            auth.validate('testuser', 'testpass')
+        executor.return_value.shutdown.assert_called_once_with(wait=False)
+
+        future.add_done_callback.call_args[0][0](future)
+        executor.return_value.submit.side_effect = BrokenProcessPool
+        with self.assertRaisesRegex(BackendException, 'failed'):
+            auth.validate('testuser', 'testpass')
+        self.assertEqual(executor.call_count, 2)
+        self.assertIn(executor.call_args[1]['mp_context'].get_start_method(),
+                      ('forkserver', 'spawn'))
+
+        auth.close()
+        self.assertEqual(executor.return_value.shutdown.call_count, 2)
+
+        # Failing to start the pool does not keep a slot of the queue.
+        executor.side_effect = OSError
+        for _ in range(2):
+            with self.assertRaisesRegex(BackendException, 'failed'):
+                auth.validate('testuser', 'testpass')
+
+        executor.side_effect = None
+        executor.return_value.submit.side_effect = None
+        future.result.side_effect = None
+        future.result.return_value = True
+        self.assertEqual(auth.validate('testuser', 'testpass'), 'Test User')
+        auth.close()
+        executor.return_value.shutdown.assert_called_with(wait=True)
+
+class UnixDatabaseTest(unittest.TestCase):
+    """
+    Tests for indexed snapshot of a Unix user database file.
+    """
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'passwd'
+
+    def test_get(self) -> None:
+        """
+        Test retrieving entries from the database.
+        """
+
+        lookup = MagicMock(side_effect=KeyError)
+        database = UnixDatabase(str(self.path), lookup)
+        with self.assertRaises(KeyError):
+            database.get('root')
+        self.assertEqual(database.reloads, 0)
+
+        self.path.write_text('# comment\n'
+                             'root:x:0:0:root:/root:/bin/bash\n'
+                             '+nis\n'
+                             'user:hash:1000:1000:User,,,:/home/user:/bin/sh\n',
+                             encoding='utf-8')
+        self.assertEqual(database.get('root')[4], 'root')
+        self.assertEqual(database.get('user')[1], 'hash')
+        self.assertEqual(database.reloads, 1)
+
+        # Changes to the file are picked up.
+        self.path.write_text('user:changed:1000:1000::/home/user:/bin/sh\n',
+                             encoding='utf-8')
+        self.assertEqual(database.get('user')[1], 'changed')
+        self.assertEqual(database.reloads, 2)
+
+        # Missing users are looked up through the name service.
+        lookup.side_effect = None
+        lookup.return_value = ('nis', 'x')
+        self.assertEqual(database.get('nis'), ('nis', 'x'))
+        lookup.assert_called_with('nis')
+        self.assertEqual(database.reloads, 2)
+
+    def test_get_unreadable(self) -> None:
+        """
+        Test retrieving entries when the database cannot be read.
+        """
+
+        self.path.mkdir()
+        lookup = MagicMock(return_value=('root', 'x'))
+        database = UnixDatabase(str(self.path), lookup)
+        self.assertEqual(database.get('root'), ('root', 'x'))
+        self.assertEqual(database.reloads, 1)
+
+@unittest.skipIf(spwd is None, 'spwd must be available')
+class UnixFileTest(unittest.TestCase):
+    """
+    Tests for authentication using the Unix password database files.
+    """
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        crypted_password = crypt.crypt('testpass',
+                                       crypt.mksalt(crypt.METHOD_SHA256))
+        passwd = Path(directory.name) / 'passwd'
+        passwd.write_text(f'testuser:{crypted_password}:1000:1000:'
+                          'Test User,,,:/home/testuser:/bin/sh\n'
+                          'nogecos:x:1001:1001::/home/nogecos:/bin/sh\n',
+                          encoding='utf-8')
+        shadow = Path(directory.name) / 'shadow'
+        shadow.write_text(f'nogecos:{crypted_password}:19000:0:99999:7:::\n',
+                          encoding='utf-8')
+
+        self.args = Namespace()
+        self.config = RawConfigParser()
+        self.config['unix'] = {
+            'passwd_file': str(passwd),
+            'shadow_file': str(shadow)
+        }
+
+    @patch('pwd.getpwnam', side_effect=KeyError)
+    def test_pwd(self, getpwnam: MagicMock) -> None:
+        """
+        Test validating the login of a user in the passwd database.
+        """
+
+        auth = UnixPwd(self.args, self.config)
+        self.assertEqual(auth.validate('testuser', 'testpass'), 'Test User')
+        with self.assertRaisesRegex(LoginException, 'Password is disabled'):
+            auth.validate('nogecos', 'testpass')
+        with self.assertRaisesRegex(LoginException, 'does not exist'):
+            auth.validate('other', 'testpass')
+        getpwnam.assert_called_once_with('other')
+
+    @patch('spwd.getspnam', side_effect=KeyError)
+    def test_spwd(self, getspnam: MagicMock) -> None:
+        """
+        Test validating the login of a user in the shadow database.
+        """
+
+        auth = UnixSpwd(self.args, self.config)
+        self.assertEqual(auth.validate('nogecos', 'testpass'), 'nogecos')
+        with self.assertRaisesRegex(LoginException, 'does not exist'):
+            auth.validate('testuser', 'testpass')
+        getspnam.assert_called_once_with('testuser')
+
 class LDAPTest(unittest.TestCase):
     """
     Test for LDAP group-based authentication scheme.
     """
 
+    def setUp(self) -> None:
+        self.args = Namespace()
+        self.config = RawConfigParser()
+        self.config['ldap'] = {}
+        self.config['ldap']['server'] = 'ldap://example.test'
+        self.config['ldap']['root_dn'] = 'dc=example,dc=test'
+        self.config['ldap']['search_filter'] = 'uid={}'
+        self.config['ldap']['manager_dn'] = 'cn=manager,dc=example,dc=test'
+        self.config['ldap']['manager_password'] = 'manpass'
+        self.config['ldap']['group_attr'] = 'memberUid'
+        self.config['ldap']['group_dn'] = 'cn=group'
+        self.config['ldap']['display_name'] = 'cn'
+
     @unittest.skipIf(ldap is None, 'python-ldap must be installed')
     @patch('ldap.initialize')
     def test_validate(self, initialize: MagicMock) -> None:
@@ -88,21 +389,13 @@ class LDAPTest(unittest.TestCase):
         Test validating the login of a user with a password.
         """
 
-        args = Namespace()
-        config = RawConfigParser()
-        config['ldap'] = {}
-        config['ldap']['server'] = 'ldap://example.test'
-        config['ldap']['root_dn'] = 'dc=example,dc=test'
-        config['ldap']['search_filter'] = 'uid={}'
-        config['ldap']['manager_dn'] = 'cn=manager,dc=example,dc=test'
-        config['ldap']['manager_password'] = 'manpass'
-        config['ldap']['group_attr'] = 'memberUid'
-        config['ldap']['group_dn'] = 'cn=group'
-        config['ldap']['display_name'] = 'cn'
+        args = self.args
+        config = self.config
 
         # Set up the authentication scheme with the group search.
         client = initialize.return_value
-        attrs: Dict[str, Optional[Union[_LDAPResult, _SideEffect, bool]]] = {
+        attrs: Dict[str, Optional[Union[_LDAPResult, _SideEffect,
+                                        Type[Exception], bool]]] = {
             'search_s.return_value': [
                 ('group', {'memberUid': [b'testuser', b'other']})
             ]
@@ -120,17 +413,36 @@ class LDAPTest(unittest.TestCase):
 
         self.assertEqual(auth.validate('testuser', 'testpass'), 'Test User')
 
+        self.assertEqual(auth.group_stats['refreshes'], 0)
+        self.assertFalse(auth.group_stats['stale'])
+
         # Test logging in with a user not in the group.
         with self.assertRaisesRegex(LoginException, 'User outside not in group'):
             auth.validate('outside', 'outpass')
 
+        # Connections are reused: one bound as manager, one for user binds.
+        self.assertEqual(initialize.call_count, 2)
+        client.simple_bind_s.assert_called_with('testuser', 'testpass')
+        self.assertEqual(client.simple_bind_s.call_count, 2)
+        self.assertEqual(auth.pool_stats['manager']['reused'], 1)
+        self.assertEqual(auth.stats['manager_pool']['reused'], 1)
+        self.assertEqual(auth.stats['group']['members'],
+                         auth.group_stats['members'])
+
+        # Repeated logins use the cached DN and display name.
+        client.search_s.reset_mock()
+        self.assertEqual(auth.validate('testuser', 'testpass'), 'Test User')
+        client.search_s.assert_not_called()
+        self.assertEqual(auth.user_stats['hits'], 1)
+
         # Test logging in with invalid credentials
         attrs = {
-            'simple_bind_s.side_effect': (DEFAULT, ldap.INVALID_CREDENTIALS)
+            'simple_bind_s.side_effect': ldap.INVALID_CREDENTIALS
         }
         client.configure_mock(**attrs)
         with self.assertRaisesRegex(LoginException, 'Credentials invalid'):
             auth.validate('testuser', 'invalid')
+        self.assertEqual(auth.user_stats['invalidations'], 1)
 
         # Test invalid LDAP response during login.
         attrs = {
@@ -144,3 +456,169 @@ class LDAPTest(unittest.TestCase):
         # Test invalid LDAP response for group query during setup.
         with self.assertRaisesRegex(ValueError, 'Invalid LDAP response'):
             LDAP(args, config)
+
+        # Test reconnecting after a pooled connection is lost.
+        attrs = {
+            'search_s.side_effect': (ldap.SERVER_DOWN, DEFAULT),
+            'search_s.return_value': [
+                ('testuser', {'cn': [b'Test User']})
+            ]
+        }
+        client.configure_mock(**attrs)
+        self.assertEqual(auth.validate('testuser', 'testpass'), 'Test User')
+        self.assertEqual(auth.pool_stats['manager']['discarded'], 1)
+
+        # Test the server being down after reconnecting.
+        for error in (ldap.SERVER_DOWN, ldap.CONNECT_ERROR, ldap.UNAVAILABLE):
+            client.configure_mock(**{'simple_bind_s.side_effect': error})
+            with self.assertRaisesRegex(BackendException, 'unavailable'):
+                auth.validate('testuser', 'testpass')
+        client.configure_mock(**{'simple_bind_s.side_effect': None})
+
+        # Test the manager credentials being rejected.
+        auth.close()
+        attrs = {
+            'search_s.side_effect': None,
+            'simple_bind_s.side_effect': ldap.INVALID_CREDENTIALS
+        }
+        client.configure_mock(**attrs)
+        with self.assertRaisesRegex(ValueError, 'Invalid LDAP response'):
+            LDAP(args, config)
+
+        auth.close()
+
+    @unittest.skipIf(ldap is None, 'python-ldap must be installed')
+    @patch('ldap.initialize')
+    def test_validate_asynchronous(self, initialize: MagicMock) -> None:
+        """
+        Test validating the login using asynchronous operations.
+        """
+
+        self.config['ldap']['asynchronous'] = 'true'
+        self.config['ldap']['operation_timeout'] = '2.5'
+        client = initialize.return_value
+        client.search.return_value = 1
+        client.simple_bind.return_value = 2
+        client.result.return_value = (
+            101, [('group', {'memberUid': [b'testuser']})]
+        )
+        auth = LDAP(self.args, self.config)
+
+        # The user search is pipelined with acquiring the user connection.
+        client.result.side_effect = [
+            (101, [('uid=testuser', {'cn': [b'Test User']})]),
+            (97, [])
+        ]
+        self.assertEqual(auth.validate('testuser', 'testpass'), 'Test User')
+        client.search.assert_called_with('dc=example,dc=test',
+                                         ldap.SCOPE_SUBTREE, 'uid=testuser',
+                                         ['cn'])
+        client.simple_bind.assert_called_once_with('uid=testuser', 'testpass')
+        client.result.assert_called_with(2, all=1, timeout=2.5)
+        self.assertEqual(initialize.call_count, 2)
+
+        # A cached user only needs a bind.
+        client.result.side_effect = [ldap.INVALID_CREDENTIALS]
+        with self.assertRaisesRegex(LoginException, 'Credentials invalid'):
+            auth.validate('testuser', 'wrong')
+        self.assertEqual(client.search.call_count, 2)
+
+        client.result.side_effect = [
+            (101, [('uid=testuser', {'cn': [b'Test User']})]),
+            ldap.INVALID_CREDENTIALS
+        ]
+        with self.assertRaisesRegex(LoginException, 'Credentials invalid'):
+            auth.validate('testuser', 'wrong')
+
+        # Operations that take too long are abandoned.
+        client.result.side_effect = ldap.TIMEOUT
+        with self.assertRaisesRegex(BackendException, 'timed out'):
+            auth.validate('testuser', 'testpass')
+        client.abandon.assert_called_once_with(1)
+
+        # A lost connection results in sequential operations.
+        client.result.side_effect = [
+            ldap.SERVER_DOWN,
+            (101, [('uid=testuser', {'cn': [b'Test User']})]),
+            (97, [])
+        ]
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(auth.validate('testuser', 'testpass'),
+                             'Test User')
+
+        auth.close()
+
+    @unittest.skipIf(ldap is None, 'python-ldap must be installed')
+    @patch('ldap.initialize')
+    def test_group(self, initialize: MagicMock) -> None:
+        """
+        Test indexing the members of multiple and nested groups.
+        """
+
+        self.config['ldap']['group_dn'] = 'cn=group; cn=other'
+        self.config['ldap']['nested_group_attr'] = 'member'
+        self.config['ldap']['whitelist'] = 'Extra, '
+        self.config['ldap']['case_insensitive'] = 'yes'
+        self.config['ldap']['group_ttl'] = '0'
+
+        client = initialize.return_value
+        client.search_s.side_effect = [
+            [
+                ('cn=group,dc=example,dc=test', {
+                    'memberUid': [b'TestUser'],
+                    'member': [b'cn=nested,dc=example,dc=test']
+                }),
+                (None, ['ldap://referral.test'])
+            ],
+            [('cn=other,dc=example,dc=test', {'memberUid': [b'other']})],
+            [
+                ('cn=nested,dc=example,dc=test', {
+                    'memberUid': [b'inner'],
+                    'member': [
+                        b'cn=group,dc=example,dc=test',
+                        b'cn=gone,dc=example,dc=test'
+                    ]
+                })
+            ],
+            [('cn=group,dc=example,dc=test', {'memberUid': [b'TestUser']})],
+            ldap.NO_SUCH_OBJECT
+        ]
+        with self.assertLogs(level='WARNING'):
+            auth = LDAP(self.args, self.config)
+
+        self.assertEqual(auth.group_stats['members'], 4)
+        client.search_s.assert_any_call('cn=nested,dc=example,dc=test',
+                                        ldap.SCOPE_BASE, '(objectClass=*)',
+                                        ['memberUid', 'member'])
+
+        client.search_s.side_effect = None
+        client.search_s.return_value = [('inner', {'cn': [b'Inner User']})]
+        self.assertEqual(auth.validate('INNER', 'pass'), 'Inner User')
+        self.assertEqual(auth.validate('extra', 'pass'), 'Inner User')
+        with self.assertRaisesRegex(LoginException, 'not in group'):
+            auth.validate('', 'pass')
+
+        auth.close()
+
+class MembershipIndexTest(unittest.TestCase):
+    """
+    Tests for hashed index of user names.
+    """
+
+    def test_contains(self) -> None:
+        """
+        Test checking whether a user name is in the index.
+        """
+
+        index = MembershipIndex([' foo', 'Bar', ''])
+        self.assertEqual(len(index), 2)
+        self.assertIn('foo', index)
+        self.assertIn('Bar ', index)
+        self.assertNotIn('bar', index)
+        self.assertNotIn('', index)
+        self.assertNotIn(None, index)
+
+        index = MembershipIndex(['Foo', 'BAR'], case_insensitive=True)
+        self.assertIn('foo', index)
+        self.assertIn('bar', index)
+        self.assertEqual(index.normalize(' Baz'), 'baz')
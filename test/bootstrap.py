@@ -20,11 +20,25 @@ limitations under the License.
 
 from argparse import ArgumentParser
 from configparser import RawConfigParser
+import os
+from pathlib import Path
+import stat
+import tempfile
 from typing import Any, Dict
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+import cherrypy
+from cherrypy.lib.sessions import RamSession
 from gatherer.config import Configuration
+from server.application import Authenticated_Application
 from server.bootstrap import Bootstrap
+from server.metrics import REGISTRY, Metrics_Application
+from server.profiler import PROFILER, Profile_Application
+from server.routes import Routes_Application
+from server.sessions import CookieSession, SQLiteSession
+from server.sockets import ListeningSocketServer
+from server.threadpool import MonitoredThreadPool
+from server.timing import StructuredAccessFilter
 
 class TestSetup(Bootstrap):
     """
@@ -59,6 +73,24 @@ class BootstrapTest(unittest.TestCase):
         self.daemon = daemon_patcher.start()
         self.addCleanup(daemon_patcher.stop)
 
+        instance_patcher = patch.object(cherrypy.server, 'instance', None)
+        instance_patcher.start()
+        self.addCleanup(instance_patcher.stop)
+
+        socket_patcher = patch.object(cherrypy.server, 'socket_file', None)
+        socket_patcher.start()
+        self.addCleanup(socket_patcher.stop)
+
+        if cherrypy.engine.signal_handler is not None:
+            handlers_patcher = \
+                patch.dict(cherrypy.engine.signal_handler.handlers)
+            handlers_patcher.start()
+            self.addCleanup(handlers_patcher.stop)
+
+        monitor_patcher = patch('server.bootstrap.Monitor')
+        self.monitor = monitor_patcher.start()
+        self.addCleanup(monitor_patcher.stop)
+
         config = RawConfigParser()
         config['deploy'] = {}
         config['deploy']['auth'] = 'open'
@@ -84,6 +116,381 @@ class BootstrapTest(unittest.TestCase):
         self.bootstrap.bootstrap()
         args = self.bootstrap.args
         self.assertEqual(args.auth, 'open')
+        self.assertEqual(args.user_login_rate, 0)
+        self.assertEqual(args.login_burst, 5)
+        self.assertEqual(args.session_store, 'ram')
+        self.assertEqual(args.threads, 10)
+        self.assertFalse(args.adaptive_threads)
+
+    def test_session_store(self) -> None:
+        """
+        Test configuring the storage of session data.
+        """
+
+        with patch('sys.argv', new=['test.py', '--session-store', 'cookie']):
+            with self.assertRaises(SystemExit):
+                with patch('sys.stderr'):
+                    self.bootstrap.bootstrap()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'keys'
+            path.write_text('secret\n', encoding='utf-8')
+            with patch('sys.argv', new=['test.py', '--session-store', 'cookie',
+                                        '--session-key-file', str(path)]):
+                with patch.object(TestSetup, 'mount') as mount:
+                    self.bootstrap.bootstrap()
+
+        conf = mount.call_args[0][0]['/']
+        self.assertEqual(conf['tools.sessions.storage_class'], CookieSession)
+        self.assertEqual(conf['tools.sessions.signing_keys'], (b'secret',))
+        self.assertEqual(conf['tools.sessions.timeout'], 12 * 60)
+
+        with patch('sys.argv', new=['test.py', '--session-store', 'sqlite',
+                                    '--expiry', '60']):
+            with patch.object(TestSetup, 'mount') as mount:
+                self.bootstrap.bootstrap()
+
+        conf = mount.call_args[0][0]['/']
+        self.assertEqual(conf['tools.sessions.storage_class'], SQLiteSession)
+        self.assertEqual(conf['tools.sessions.database'],
+                         str(Path('sessions.db').resolve()))
+        self.assertEqual(conf['tools.sessions.timeout'], 60)
+
+    @patch('server.bootstrap.Supervisor')
+    def test_workers(self, supervisor: MagicMock) -> None:
+        """
+        Test starting the server in pre-forked worker processes.
+        """
+
+        with patch('sys.argv', new=['test.py', '--workers', '4', '--cgi']):
+            with self.assertRaises(SystemExit):
+                with patch('sys.stderr'):
+                    self.bootstrap.bootstrap()
+
+        with patch('sys.argv', new=['test.py', '--workers', '4',
+                                    '--pidfile', 'test.pid']):
+            with patch.object(TestSetup, 'mount') as mount:
+                self.bootstrap.bootstrap()
+                supervisor.assert_called_once()
+                self.assertEqual(supervisor.call_args[0][0], 4)
+                self.assertEqual(supervisor.call_args[1]['pidfile'],
+                                 'test.pid')
+                supervisor.return_value.start.assert_called_once_with()
+                mount.assert_not_called()
+                self.daemon.assert_not_called()
+
+                # Workers mount the application and share the port.
+                with patch('server.bootstrap.share_port') as share_port:
+                    supervisor.call_args[0][1]()
+                    share_port.assert_called_once()
+                    httpserver = share_port.call_args[0][0]
+                    self.assertIsInstance(httpserver.requests,
+                                          MonitoredThreadPool)
+                    mount.assert_called_once()
+                    self.daemon.assert_called_once_with()
+
+                # Workers write to their own log files.
+                config = self.logging.call_args[0][0]
+                self.assertEqual(config['handlers']['python']['filename'],
+                                 str(Path(f'python.{os.getpid()}.log').resolve()))
+
+    @patch('os.umask')
+    @patch('server.bootstrap.Daemonizer')
+    @patch('server.bootstrap.Supervisor')
+    def test_daemonize(self, supervisor: MagicMock, daemonizer: MagicMock,
+                       umask: MagicMock) -> None:
+        """
+        Test restricting the file mode creation mask after daemonizing.
+        """
+
+        with patch('sys.argv', new=['test.py', '--daemonize']):
+            with patch.object(cherrypy.engine, 'subscribe') as subscribe:
+                self.bootstrap.bootstrap()
+
+        self.daemon.assert_called_once()
+        self.assertTrue(self.daemon.call_args[1]['daemonize'])
+        start = [
+            call for call in subscribe.call_args_list
+            if call[0][0] == 'start' and call[1] == {'priority': 66}
+        ]
+        self.assertEqual(len(start), 1)
+        umask.assert_not_called()
+        start[0][0][1]()
+        umask.assert_called_once_with(0o027)
+
+        umask.reset_mock()
+        with patch('sys.argv', new=['test.py', '--daemonize',
+                                    '--workers', '2']):
+            self.bootstrap.bootstrap()
+
+        daemonizer.daemonize.assert_called_once_with()
+        umask.assert_called_once_with(0o027)
+        supervisor.return_value.start.assert_called_once_with()
+
+    def test_threads(self) -> None:
+        """
+        Test configuring the thread pool of the HTTP server.
+        """
+
+        with patch('sys.argv', new=['test.py', '--threads', '4',
+                                    '--adaptive-threads']):
+            with self.assertRaises(SystemExit):
+                with patch('sys.stderr'):
+                    self.bootstrap.bootstrap()
+
+        with patch('sys.argv', new=['test.py', '--threads', '4',
+                                    '--max-threads', '8', '--adaptive-threads',
+                                    '--socket-queue', '16']):
+            self.bootstrap.bootstrap()
+
+        self.assertEqual(cherrypy.server.socket_queue_size, 16)
+        pool = cherrypy.server.instance.requests
+        self.assertIsInstance(pool, MonitoredThreadPool)
+        self.assertEqual(pool.min, 4)
+        self.assertEqual(pool.max, 8)
+
+        self.monitor.assert_called_once()
+        self.monitor.return_value.subscribe.assert_called_once_with()
+        with patch.object(MonitoredThreadPool, 'adapt') as adapt:
+            self.monitor.call_args[0][1]()
+            adapt.assert_called_once_with()
+
+    @patch('server.bootstrap.atexit')
+    @patch('server.bootstrap.LogQueue')
+    def test_log_queue(self, log_queue: MagicMock, exit_handler: MagicMock) \
+            -> None:
+        """
+        Test writing logs through a queue.
+        """
+
+        with patch('sys.argv', new=['test.py', '--log-queue', '-1']):
+            with self.assertRaises(SystemExit):
+                with patch('sys.stderr'):
+                    self.bootstrap.bootstrap()
+
+        with patch('sys.argv', new=['test.py', '--log-queue', '100']):
+            with patch.object(cherrypy.engine, 'subscribe') as subscribe:
+                self.bootstrap.bootstrap()
+
+        config = self.logging.call_args[0][0]
+        self.assertEqual(config['handlers']['python']['class'],
+                         'server.log.CompressedRotatingFileHandler')
+        log_queue.assert_called_once_with(size=100)
+        log_queue.return_value.install.assert_called_once_with([
+            '', 'cherrypy.access', 'cherrypy.error'
+        ])
+        self.assertEqual(self.bootstrap.log_queue, log_queue.return_value)
+        subscribe.assert_any_call('exit', log_queue.return_value.stop,
+                                  priority=100)
+        exit_handler.register.assert_called_once_with(
+            log_queue.return_value.stop
+        )
+
+    def test_access_log(self) -> None:
+        """
+        Test configuring the structured access log.
+        """
+
+        with patch.object(TestSetup, 'mount') as mount:
+            self.bootstrap.bootstrap()
+
+        self.assertFalse(mount.call_args[0][0]['/']['tools.timing.on'])
+        config = self.logging.call_args[0][0]
+        self.assertNotIn('filters', config)
+
+        with patch('sys.argv', new=['test.py', '--access-log', 'json']):
+            with patch.object(TestSetup, 'mount') as mount:
+                self.bootstrap.bootstrap()
+
+        self.assertTrue(mount.call_args[0][0]['/']['tools.timing.on'])
+        config = self.logging.call_args[0][0]
+        self.assertEqual(config['filters']['structured_access']['()'],
+                         StructuredAccessFilter)
+        self.assertEqual(config['handlers']['cherrypy_access']['filters'],
+                         ['structured_access'])
+        self.assertNotIn('filters', config['handlers']['python'])
+
+    @patch('cherrypy.tree.mount')
+    def test_metrics(self, mount: MagicMock) -> None:
+        """
+        Test exposing metrics.
+        """
+
+        self.bootstrap.bootstrap()
+        mount.assert_not_called()
+
+        # Admin endpoints are not exposed without trusted clients or token.
+        with patch('sys.argv', new=['test.py', '--metrics',
+                                    '--admin-clients', ' , ']):
+            with self.assertRaises(SystemExit):
+                with patch('sys.stderr'):
+                    self.bootstrap.bootstrap()
+
+        self.addCleanup(REGISTRY.unregister, 'gros_server_sessions_active')
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'token'
+            path.write_text('secret\n', encoding='utf-8')
+            with patch('sys.argv', new=['test.py', '--metrics',
+                                        '--admin-clients', '10.0.0.1, ',
+                                        '--admin-token-file', str(path)]):
+                with patch.object(TestSetup, 'mount') as setup_mount:
+                    self.bootstrap.bootstrap()
+
+        self.assertTrue(setup_mount.call_args[0][0]['/']['tools.metrics.on'])
+        mount.assert_called_once()
+        application = mount.call_args[0][0]
+        self.assertIsInstance(application, Metrics_Application)
+        self.assertEqual(mount.call_args[0][1], '/metrics')
+        with patch.object(cherrypy.serving, 'request') as request, \
+                patch.dict(RamSession.cache, clear=True):
+            request.remote.ip = '10.0.0.1'
+            request.headers = {}
+            self.assertIn('gros_server_thread_pool_utilization',
+                          application.index())
+            self.assertIn('gros_server_sessions_active 0',
+                          application.index())
+            self.assertIn('# TYPE gros_server_authentication_breaker_state gauge',
+                          application.index())
+
+            request.remote.ip = '10.0.0.2'
+            with self.assertRaises(cherrypy.HTTPError):
+                application.index()
+            request.headers = {'Authorization': 'Bearer secret'}
+            self.assertIn('gros_server_login_redirects_total',
+                          application.index())
+
+    @patch('cherrypy.tree.mount')
+    def test_routes(self, mount: MagicMock) -> None:
+        """
+        Test listing the exposed routes of applications.
+        """
+
+        with patch('sys.argv', new=['test.py', '--routes-endpoint',
+                                    '--admin-clients', '10.0.0.1']):
+            self.bootstrap.bootstrap()
+
+        mount.assert_called_once()
+        application = mount.call_args[0][0]
+        self.assertIsInstance(application, Routes_Application)
+        self.assertEqual(mount.call_args[0][1], '/routes')
+        with patch.object(cherrypy.serving, 'request') as request, \
+                patch.dict(cherrypy.tree.apps, clear=True):
+            request.remote.ip = '10.0.0.1'
+            self.assertEqual(application.index(), {})
+
+    @patch('cherrypy.tree.mount')
+    def test_profile(self, mount: MagicMock) -> None:
+        """
+        Test profiling request threads.
+        """
+
+        with patch('sys.argv', new=['test.py', '--profile', '-1']):
+            with self.assertRaises(SystemExit):
+                with patch('sys.stderr'):
+                    self.bootstrap.bootstrap()
+
+        with patch('sys.argv', new=['test.py', '--profile', '60',
+                                    '--profile-threshold', '0.5',
+                                    '--profile-endpoint', '--log-path', 'logs',
+                                    '--admin-clients', '10.0.0.1']):
+            with patch.object(TestSetup, 'mount') as setup_mount:
+                with patch.object(cherrypy.engine, 'subscribe') as subscribe:
+                    self.bootstrap.bootstrap()
+
+        self.assertTrue(setup_mount.call_args[0][0]['/']['tools.profiler.on'])
+        mount.assert_called_once()
+        self.assertIsInstance(mount.call_args[0][0], Profile_Application)
+        self.assertEqual(mount.call_args[0][1], '/profile')
+
+        start = [
+            call for call in subscribe.call_args_list if call[0][0] == 'start'
+        ]
+        self.assertEqual(len(start), 1)
+        self.assertEqual(start[0][1], {'priority': 80})
+
+        # Profiles are written relative to the directory at startup, even if
+        # the working directory changes afterward.
+        path = Path('logs').resolve()
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir('/')
+        with patch.object(PROFILER, 'start') as profiler_start:
+            start[0][0][1]()
+            profiler_start.assert_called_once_with(60.0, threshold=0.5,
+                                                   path=path)
+
+    @patch('server.bootstrap.use_socket')
+    def test_socket_path(self, use_socket: MagicMock) -> None:
+        """
+        Test listening on a Unix domain socket.
+        """
+
+        with patch('sys.argv', new=['test.py', '--socket-mode', '1777']):
+            with self.assertRaises(SystemExit):
+                with patch('sys.stderr'):
+                    self.bootstrap.bootstrap()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / 'server.sock')
+            with patch('sys.argv', new=['test.py', '--socket-path', path,
+                                        '--socket-mode', '600']):
+                self.bootstrap.bootstrap()
+
+            self.assertEqual(cherrypy.server.socket_file, path)
+            self.assertEqual(stat.S_IMODE(Path(path).stat().st_mode), 0o600)
+            self.assertIsNone(cherrypy.server.instance)
+            use_socket.assert_called_once()
+            httpserver = use_socket.call_args[0][0]
+            self.assertIsInstance(httpserver, ListeningSocketServer)
+            self.assertEqual(httpserver.bind_addr, path)
+            httpserver.listener.close()
+
+    def test_reload(self) -> None:
+        """
+        Test reloading the configuration and authentication scheme.
+        """
+
+        self.bootstrap.bootstrap()
+        if cherrypy.engine.signal_handler is not None:
+            self.assertEqual(cherrypy.engine.signal_handler.handlers['SIGHUP'],
+                             self.bootstrap.reload)
+
+        root = MagicMock(spec=Authenticated_Application)
+        app = MagicMock(root=root)
+        other = MagicMock(root=object())
+        with patch.dict(cherrypy.tree.apps, {'/': app, '/other': other}):
+            config = RawConfigParser()
+            config['deploy'] = {'auth': 'pwd'}
+            with patch.object(Configuration, 'get_settings',
+                              return_value=config):
+                with self.assertLogs(level='INFO'):
+                    self.bootstrap.reload()
+
+                self.assertIs(self.bootstrap.config, config)
+                self.assertEqual(self.bootstrap.args.auth, 'pwd')
+                root.reload.assert_called_once_with(self.bootstrap.args,
+                                                    config)
+
+                root.reload.side_effect = RuntimeError('Invalid')
+                with self.assertLogs(level='ERROR'):
+                    self.bootstrap.reload()
+
+    def test_lazy_sessions(self) -> None:
+        """
+        Test configuring sessions that are loaded when they are used.
+        """
+
+        with patch('sys.argv', new=['test.py', '--lazy-sessions']):
+            with patch.object(TestSetup, 'session_free_paths',
+                              new=('/static',)):
+                with patch.object(TestSetup, 'mount') as mount:
+                    self.bootstrap.bootstrap()
+
+        conf = mount.call_args[0][0]
+        self.assertTrue(conf['/']['tools.lazy_sessions.on'])
+        self.assertEqual(conf['/']['tools.lazy_sessions.name'], 'test_session')
+        self.assertEqual(conf['/']['tools.sessions.name'], 'test_session')
+        self.assertNotIn('tools.sessions.on', conf['/'])
+        self.assertFalse(conf['/static']['tools.lazy_sessions.on'])
 
     def test_bootstrap(self) -> None:
         """
@@ -0,0 +1,116 @@
+"""
+Tests for circuit breaker for calls to backends.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+from server.breaker import CircuitBreaker, CircuitOpenError
+
+class CircuitBreakerTest(unittest.TestCase):
+    """
+    Tests for circuit breaker.
+    """
+
+    @patch('time.monotonic')
+    def test_call(self, monotonic: MagicMock) -> None:
+        """
+        Test calling functions through the circuit breaker.
+        """
+
+        with self.assertRaises(ValueError):
+            CircuitBreaker(0)
+
+        monotonic.return_value = 100.0
+        breaker = CircuitBreaker(2, 30, ignore=(KeyError,))
+        failure = MagicMock(side_effect=RuntimeError)
+        ignored = MagicMock(side_effect=KeyError)
+        self.assertEqual(breaker.call(lambda x: x + 1, 1), 2)
+        with self.assertRaises(RuntimeError):
+            breaker.call(failure)
+        with self.assertRaises(KeyError):
+            breaker.call(ignored)
+        with self.assertRaises(RuntimeError):
+            breaker.call(failure)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(RuntimeError):
+                breaker.call(failure)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # Calls fail fast while the circuit is open.
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(failure)
+        self.assertEqual(failure.call_count, 3)
+
+        # A failing probe opens the circuit again.
+        monotonic.return_value = 130.0
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(RuntimeError):
+                breaker.call(failure)
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(failure)
+
+        # A successful probe closes the circuit.
+        monotonic.return_value = 160.0
+        with self.assertLogs(level='INFO'):
+            self.assertEqual(breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(breaker.stats, {
+            'state': CircuitBreaker.CLOSED,
+            'consecutive_failures': 0,
+            'trips': 2,
+            'rejected': 2,
+            'failures': 4
+        })
+
+    def test_probes(self) -> None:
+        """
+        Test limiting concurrent probes while the circuit is half-open.
+        """
+
+        breaker = CircuitBreaker(1, 0)
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(RuntimeError):
+                breaker.call(MagicMock(side_effect=RuntimeError))
+
+        def probe() -> None:
+            with self.assertRaises(CircuitOpenError):
+                breaker.call(MagicMock())
+
+        with self.assertLogs(level='INFO'):
+            breaker.call(probe)
+        self.assertEqual(breaker.stats['rejected'], 1)
+
+    def test_failures(self) -> None:
+        """
+        Test that only exceptions of the failure types open the circuit.
+        """
+
+        breaker = CircuitBreaker(1, 30, failures=(ConnectionError,))
+        for error in (TypeError, KeyError):
+            with self.assertRaises(error):
+                breaker.call(MagicMock(side_effect=error))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats['failures'], 0)
+
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(ConnectionError):
+                breaker.call(MagicMock(side_effect=ConnectionError))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
@@ -0,0 +1,202 @@
+"""
+Tests for caches for authentication results and data retrieved from backends.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from server.cache import CredentialCache, LRUCache, Snapshot
+
+class LRUCacheTest(unittest.TestCase):
+    """
+    Tests for bounded cache with expiring entries.
+    """
+
+    @patch('time.monotonic')
+    def test_get(self, monotonic: MagicMock) -> None:
+        """
+        Test retrieving and storing cached values.
+        """
+
+        monotonic.return_value = 100.0
+        cache: LRUCache[str, int] = LRUCache(2, 10)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        # The least recently used entry is evicted.
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+        monotonic.return_value = 110.0
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats, {
+            'hits': 2,
+            'misses': 3,
+            'evictions': 1,
+            'expirations': 1,
+            'invalidations': 0,
+            'size': 1
+        })
+
+    def test_invalidate(self) -> None:
+        """
+        Test removing cached values.
+        """
+
+        cache: LRUCache[str, int] = LRUCache(3, 10)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertTrue(cache.invalidate('a'))
+        self.assertFalse(cache.invalidate('a'))
+        self.assertIsNone(cache.get('a'))
+
+        cache.clear()
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats['invalidations'], 2)
+
+        disabled: LRUCache[str, int] = LRUCache(0, 10)
+        disabled.put('a', 1)
+        self.assertIsNone(disabled.get('a'))
+
+class CredentialCacheTest(unittest.TestCase):
+    """
+    Tests for cache of validated credentials.
+    """
+
+    def test_get(self) -> None:
+        """
+        Test retrieving and storing validation results.
+        """
+
+        cache = CredentialCache(10, 60)
+        self.assertIsNone(cache.get('ldap', 'foo', 'bar'))
+        cache.put('ldap', 'foo', 'bar', 'Foo Bar')
+        self.assertEqual(cache.get('ldap', 'foo', 'bar'), 'Foo Bar')
+        self.assertIsNone(cache.get('ldap', 'foo', 'baz'))
+        self.assertIsNone(cache.get('ldap', 'foob', 'ar'))
+        self.assertIsNone(cache.get('pwd', 'foo', 'bar'))
+        self.assertEqual(cache.stats, {
+            'ldap': {'hits': 1, 'misses': 3, 'hit_rate': 0.25},
+            'pwd': {'hits': 0, 'misses': 1, 'hit_rate': 0.0}
+        })
+
+        # Credentials are not kept in plain text.
+        self.assertNotIn('bar', repr(vars(cache)))
+
+    def test_invalidate(self) -> None:
+        """
+        Test removing validation results.
+        """
+
+        cache = CredentialCache(10, 60)
+        cache.put('ldap', 'foo', 'bar', True)
+        cache.put('ldap', 'baz', 'qux', True)
+        cache.put('pwd', 'foo', 'bar', True)
+        self.assertEqual(cache.invalidate('foo', scheme='ldap'), 1)
+        self.assertIsNone(cache.get('ldap', 'foo', 'bar'))
+        self.assertTrue(cache.get('pwd', 'foo', 'bar'))
+
+        self.assertEqual(cache.invalidate('foo'), 1)
+        self.assertEqual(cache.invalidate(), 1)
+        self.assertIsNone(cache.get('ldap', 'baz', 'qux'))
+
+class SnapshotTest(unittest.TestCase):
+    """
+    Tests for periodically refreshed value.
+    """
+
+    @patch('time.monotonic')
+    def test_refresh(self, monotonic: MagicMock) -> None:
+        """
+        Test loading the value again.
+        """
+
+        monotonic.return_value = 100.0
+        loader = MagicMock(side_effect=[['a'], ['a', 'b'], RuntimeError])
+        snapshot = Snapshot(loader, 0)
+        self.assertEqual(snapshot.value, ['a'])
+
+        monotonic.return_value = 110.0
+        self.assertTrue(snapshot.refresh())
+        self.assertEqual(snapshot.value, ['a', 'b'])
+
+        monotonic.return_value = 130.0
+        with self.assertLogs(level='ERROR'):
+            self.assertFalse(snapshot.refresh())
+        self.assertEqual(snapshot.value, ['a', 'b'])
+        self.assertEqual(snapshot.stats, {
+            'refreshes': 1,
+            'failures': 1,
+            'consecutive_failures': 1,
+            'age': 20.0,
+            'stale': False
+        })
+
+    def test_background(self) -> None:
+        """
+        Test refreshing the value in a background thread.
+        """
+
+        refreshed = threading.Event()
+        values = iter([1, 2])
+
+        def loader() -> int:
+            try:
+                return next(values)
+            finally:
+                refreshed.set()
+
+        snapshot = Snapshot(loader, 0.01, name='test')
+        refreshed.clear()
+        self.assertEqual(snapshot.value, 1)
+        self.assertTrue(refreshed.wait(5))
+        snapshot.close()
+        self.assertEqual(snapshot.value, 2)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'os.fork must be available')
+    def test_fork(self) -> None:
+        """
+        Test refreshing the value in a process forked after creating it.
+        """
+
+        loader = MagicMock(side_effect=range(1000))
+        snapshot = Snapshot(loader, 0.01, name='test')
+        self.assertEqual(snapshot.value, 0)
+
+        pid = os.fork()
+        if pid == 0: # pragma: no cover
+            # Child process: the value is refreshed by a new thread.
+            value = snapshot.value
+            deadline = time.monotonic() + 5
+            while snapshot.value == value and time.monotonic() < deadline:
+                time.sleep(0.01)
+            os._exit(0 if snapshot.value != value else 1) # pylint: disable=protected-access
+
+        snapshot.close()
+        _, status = os.waitpid(pid, 0)
+        self.assertTrue(os.WIFEXITED(status))
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+
+        with self.assertRaises(RuntimeError):
+            Snapshot(MagicMock(side_effect=RuntimeError), 0.01)
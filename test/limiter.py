@@ -0,0 +1,59 @@
+"""
+Tests for rate limiting of requests.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+from server.limiter import TokenBucketLimiter
+
+class TokenBucketLimiterTest(unittest.TestCase):
+    """
+    Tests for rate limiter with token buckets.
+    """
+
+    @patch('time.monotonic')
+    def test_acquire(self, monotonic: MagicMock) -> None:
+        """
+        Test taking tokens from buckets.
+        """
+
+        with self.assertRaises(ValueError):
+            TokenBucketLimiter(0, 1)
+
+        monotonic.return_value = 100.0
+        limiter = TokenBucketLimiter(0.5, 2, size=2)
+        self.assertEqual(limiter.acquire('a'), 0.0)
+        self.assertEqual(limiter.acquire('a'), 0.0)
+        self.assertEqual(limiter.acquire('a'), 2.0)
+        self.assertEqual(limiter.acquire('b'), 0.0)
+
+        # Tokens are refilled over time.
+        monotonic.return_value = 101.0
+        self.assertEqual(limiter.acquire('a'), 1.0)
+        monotonic.return_value = 102.0
+        self.assertEqual(limiter.acquire('a'), 0.0)
+
+        # The least recently used bucket is evicted.
+        self.assertEqual(limiter.acquire('c'), 0.0)
+        self.assertEqual(limiter.stats, {
+            'allowed': 5,
+            'rejected': 2,
+            'evictions': 1,
+            'size': 2
+        })
@@ -0,0 +1,191 @@
+"""
+Tests for queued logging and compressed log rotation.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gzip
+import importlib.util
+import logging
+import os
+from pathlib import Path
+import tempfile
+import threading
+from typing import List
+import unittest
+from unittest.mock import patch
+import weakref
+from server.log import CompressedRotatingFileHandler, LogQueue
+
+class RecordingHandler(logging.Handler):
+    """
+    Log handler which keeps the records.
+    """
+
+    def __init__(self, level: int = logging.NOTSET):
+        super().__init__(level)
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+class CompressedRotatingFileHandlerTest(unittest.TestCase):
+    """
+    Tests for rotating file handler which compresses rotated files.
+    """
+
+    def test_rotate(self) -> None:
+        """
+        Test compressing rotated files in the background.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'test.log'
+            handler = CompressedRotatingFileHandler(str(path), maxBytes=100,
+                                                    backupCount=2)
+            for index in range(4):
+                record = logging.makeLogRecord({'msg': f'{index}' * 80})
+                handler.handle(record)
+            handler.close()
+
+            self.assertEqual(path.read_text('utf-8'), f'{"3" * 80}\n')
+            self.assertFalse(Path(f'{path}.1').exists())
+            with gzip.open(f'{path}.1.gz', 'rt') as rotated_file:
+                self.assertEqual(rotated_file.read(), f'{"2" * 80}\n')
+            with gzip.open(f'{path}.2.gz', 'rt') as rotated_file:
+                self.assertEqual(rotated_file.read(), f'{"1" * 80}\n')
+            self.assertFalse(Path(f'{path}.3.gz').exists())
+
+class LogQueueTest(unittest.TestCase):
+    """
+    Tests for bounded queue of log records.
+    """
+
+    def setUp(self) -> None:
+        self.logger = logging.getLogger('test.log')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.addCleanup(setattr, self.logger, 'propagate', True)
+
+        self.root = logging.getLogger()
+        self.root_handlers = list(self.root.handlers)
+
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+        self.root_handler = RecordingHandler(logging.WARNING)
+        self.root.addHandler(self.root_handler)
+
+        self.queue = LogQueue(size=2, batch_size=10)
+        self.addCleanup(self.queue.stop)
+        self.addCleanup(self._restore)
+
+    def _restore(self) -> None:
+        self.logger.handlers = []
+        self.root.handlers = self.root_handlers
+
+    def test_install(self) -> None:
+        """
+        Test writing records through the queue.
+        """
+
+        self.queue.install(['', 'test.log'])
+        self.assertNotIn(self.handler, self.logger.handlers)
+        self.assertEqual(len(self.logger.handlers), 1)
+
+        self.logger.info('Message %d', 1)
+        self.logger.debug('Ignored')
+        self.queue.stop()
+        self.assertEqual([record.getMessage() for record in self.handler.records],
+                         ['Message 1'])
+        self.assertEqual(self.handler.records[0].name, 'test.log')
+        self.assertEqual(self.queue.stats,
+                         {'queued': 0, 'written': 1, 'dropped': 0})
+
+        # Records are written directly after stopping.
+        self.logger.info('Message %d', 2)
+        self.assertEqual(self.handler.records[-1].getMessage(), 'Message 2')
+
+    def test_dropped(self) -> None:
+        """
+        Test dropping records when the queue is full.
+        """
+
+        self.queue.install(['', 'test.log'])
+
+        # Keep the thread busy with the first record.
+        block = threading.Event()
+        started = threading.Event()
+        emit = self.handler.emit
+        def block_emit(record: logging.LogRecord) -> None:
+            started.set()
+            block.wait(5)
+            emit(record)
+
+        self.handler.emit = block_emit # type: ignore[method-assign]
+        self.logger.info('Busy')
+        self.assertTrue(started.wait(5))
+        for index in range(5):
+            self.logger.info('Message %d', index)
+        self.assertEqual(self.queue.stats['dropped'], 3)
+        block.set()
+        self.queue.stop()
+
+        self.assertEqual([record.getMessage() for record in self.handler.records],
+                         ['Busy', 'Message 0', 'Message 1'])
+        self.assertEqual([record.getMessage() for record in self.root_handler.records],
+                         ['Dropped 3 log records of test.log logger'])
+        self.assertEqual(self.queue.stats,
+                         {'queued': 0, 'written': 3, 'dropped': 3})
+
+    def test_fork(self) -> None:
+        """
+        Test restarting the writer of the queue in a forked process.
+        """
+
+        self.queue.install(['', 'test.log'])
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self.logger.info('Child')
+                self.queue.stop()
+                messages = [record.getMessage() for record in self.handler.records]
+                code = 0 if messages == ['Child'] else 2
+            finally:
+                os._exit(code) # pylint: disable=protected-access
+
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+
+        # Queues that are no longer used are not kept for the fork hook.
+        reference = weakref.ref(LogQueue())
+        self.assertIsNone(reference())
+
+    def test_import(self) -> None:
+        """
+        Test importing the module on platforms without fork hooks.
+        """
+
+        spec = importlib.util.find_spec('server.log')
+        if spec is None or spec.loader is None:
+            self.fail('Module must be found')
+
+        with patch.dict(vars(os)):
+            del vars(os)['register_at_fork']
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+
+        self.assertTrue(hasattr(module, 'LogQueue'))
@@ -0,0 +1,233 @@
+"""
+Tests for metrics in Prometheus text format.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from argparse import Namespace
+from configparser import RawConfigParser
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import cherrypy
+from cherrypy.test import helper
+from server.application import Authenticated_Application
+from server.metrics import AUTHENTICATION_DURATION, LOGIN_REDIRECTS, \
+    REQUEST_DURATION, Callback, Counter, Histogram, Metrics_Application, \
+    Registry, record_request
+
+class MetricsServer(Authenticated_Application):
+    """
+    Test server.
+    """
+
+    @cherrypy.expose
+    def index(self, page: str = 'list', params: str = '') -> str:
+        return "Index page"
+
+    @cherrypy.expose
+    def list(self) -> str:
+        """
+        Authenticated target page after login.
+        """
+
+        self.validate_login()
+
+        return "List page"
+
+class MetricTest(unittest.TestCase):
+    """
+    Tests for metrics with values per thread.
+    """
+
+    def test_counter(self) -> None:
+        """
+        Test counting events in multiple threads.
+        """
+
+        counter = Counter('test_total', 'Test events.', labels=('kind',))
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+        counter.inc('main')
+        threads = [
+            threading.Thread(target=counter.inc, args=('thread',),
+                             kwargs={'amount': 2.0})
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(counter.collect(), {
+            ('main',): [1.0],
+            ('thread',): [6.0]
+        })
+        counter.inc('thread')
+        self.assertEqual(counter.collect()[('thread',)], [7.0])
+        self.assertEqual(list(counter.render()), [
+            '# HELP test_total Test events.',
+            '# TYPE test_total counter',
+            'test_total{kind="main"} 1',
+            'test_total{kind="thread"} 7'
+        ])
+
+    def test_histogram(self) -> None:
+        """
+        Test counting observations in buckets.
+        """
+
+        histogram = Histogram('test_seconds', 'Test durations.',
+                              labels=('route',), buckets=(0.5, 0.1))
+        for value in (0.05, 0.1, 0.3, 2.0):
+            histogram.observe(value, '/a"b')
+
+        self.assertEqual(list(histogram.render()), [
+            '# HELP test_seconds Test durations.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{route="/a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{route="/a\\"b",le="0.5"} 3',
+            'test_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{route="/a\\"b"} 2.45',
+            'test_seconds_count{route="/a\\"b"} 4'
+        ])
+
+    def test_record_request(self) -> None:
+        """
+        Test observing requests with unknown methods and malformed statuses.
+        """
+
+        with patch.object(cherrypy.serving, 'request') as request, \
+                patch.object(cherrypy.serving, 'response') as response:
+            request.handler = None
+            response.time = time.time()
+            for method, status in (('PROPFIND', b'207 Multi-Status'),
+                                   ('GET', b'abc Invalid'),
+                                   ('GET', b'9999')):
+                request.method = method
+                response.output_status = status
+                record_request()
+
+        labels = REQUEST_DURATION.collect()
+        self.assertIn(('-', 'other', '207'), labels)
+        self.assertIn(('-', 'GET', 'other'), labels)
+        self.assertNotIn(('-', 'PROPFIND', '207'), labels)
+
+class RegistryTest(unittest.TestCase):
+    """
+    Tests for collection of metrics.
+    """
+
+    def test_render(self) -> None:
+        """
+        Test formatting metrics.
+        """
+
+        registry = Registry()
+        registry.register(Counter('test_total', 'Test events.'))
+        registry.register(Callback('test_threads', 'Test threads.',
+                                   lambda: 0.5))
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP test_total Test events.',
+            '# TYPE test_total counter',
+            '# HELP test_threads Test threads.',
+            '# TYPE test_threads gauge',
+            'test_threads 0.5',
+            ''
+        ]))
+
+        registry.unregister('test_total')
+        registry.unregister('missing')
+        self.assertNotIn('test_total', registry.render())
+
+class MetricsApplicationTest(helper.CPWebCase):
+    """
+    Tests for Web application which exposes metrics.
+    """
+
+    @staticmethod
+    def setup_server() -> None:
+        """"
+        Set up the application server.
+        """
+
+        args = Namespace()
+        args.auth = 'open'
+        args.debug = True
+
+        cherrypy.tree.mount(MetricsServer(args, RawConfigParser()), '/app', {
+            '/': {
+                'tools.sessions.on': True,
+                'tools.metrics.on': True
+            }
+        })
+        cherrypy.tree.mount(Metrics_Application(clients=('127.0.0.1', '::1')),
+                            '/metrics')
+        cherrypy.tree.mount(Metrics_Application(clients=(), token='secret'),
+                            '/token')
+
+    def test_index(self) -> None:
+        """
+        Test retrieving the metrics.
+        """
+
+        rejected = LOGIN_REDIRECTS.collect().get(('rejected',), [0.0])[0]
+        unauthenticated = \
+            LOGIN_REDIRECTS.collect().get(('unauthenticated',), [0.0])[0]
+
+        self.getPage('/app/list')
+        self.assertStatus('303 See Other')
+        self.getPage('/app/login', method='POST',
+                     body='username=&password=')
+        self.getPage('/app/login', method='POST',
+                     body='username=admin&password=admin')
+
+        self.getPage('/metrics')
+        self.assertStatus('200 OK')
+        self.assertHeader('Content-Type',
+                          'text/plain;version=0.0.4;charset=utf-8')
+        self.assertInBody('gros_server_http_request_duration_seconds_count'
+                          '{route="/app/list",method="GET",status="303"}')
+        self.assertInBody('gros_server_authentication_duration_seconds_count'
+                          '{scheme="open",outcome="success"}')
+        self.assertEqual(LOGIN_REDIRECTS.collect()[('rejected',)][0],
+                         rejected + 1)
+        self.assertEqual(LOGIN_REDIRECTS.collect()[('unauthenticated',)][0],
+                         unauthenticated + 1)
+        self.assertIn(('/app/login', 'POST', '303'),
+                      REQUEST_DURATION.collect())
+        self.assertIn(('open', 'rejected'), AUTHENTICATION_DURATION.collect())
+
+        # Methods from clients do not create arbitrary series
+        self.getPage('/app/list', method='FOO')
+        labels = [label[1] for label in REQUEST_DURATION.collect()]
+        self.assertIn('other', labels)
+        self.assertNotIn('FOO', labels)
+
+        # Requests for metrics are not observed
+        self.assertNotIn(('/metrics/index', 'GET', '200'),
+                         REQUEST_DURATION.collect())
+
+        self.getPage('/token')
+        self.assertStatus('403 Forbidden')
+        self.getPage('/token', headers=[('Authorization', 'Bearer wrong')])
+        self.assertStatus('403 Forbidden')
+        self.getPage('/token', headers=[('Authorization', 'Bearer secret')])
+        self.assertStatus('200 OK')
+        self.assertInBody('# TYPE gros_server_login_redirects_total counter')
@@ -0,0 +1,188 @@
+"""
+Tests for bounded pool of reusable connections.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from server.pool import ConnectionPool, PoolTimeout
+
+class ConnectionPoolTest(unittest.TestCase):
+    """
+    Tests for thread-safe pool of connections.
+    """
+
+    def setUp(self) -> None:
+        self.factory = MagicMock(side_effect=object)
+        self.close = MagicMock()
+
+    def test_acquire(self) -> None:
+        """
+        Test retrieving and releasing connections.
+        """
+
+        with self.assertRaises(ValueError):
+            ConnectionPool(self.factory, self.close, size=0)
+
+        pool = ConnectionPool(self.factory, self.close, size=2, timeout=0.01)
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertIsNot(first, second)
+        self.assertEqual(self.factory.call_count, 2)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(pool.stats, {
+            'created': 2,
+            'reused': 1,
+            'discarded': 0,
+            'expired': 0,
+            'timeouts': 1,
+            'open': 2,
+            'idle': 0
+        })
+
+        pool.release(second, discard=True)
+        self.close.assert_called_once_with(second)
+        self.assertIsNot(pool.acquire(), second)
+
+    def test_acquire_wait(self) -> None:
+        """
+        Test waiting for a connection to be released by another thread.
+        """
+
+        pool = ConnectionPool(self.factory, self.close, size=1, timeout=5)
+        connection = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, args=(connection,))
+        timer.start()
+        self.assertIs(pool.acquire(), connection)
+        timer.join()
+
+    def test_acquire_factory_error(self) -> None:
+        """
+        Test that a failing factory does not take up room in the pool.
+        """
+
+        self.factory.side_effect = ConnectionError
+        pool = ConnectionPool(self.factory, self.close, size=1, timeout=0.01)
+        with self.assertRaises(ConnectionError):
+            pool.acquire()
+
+        self.assertEqual(pool.stats['open'], 0)
+
+    @patch('time.monotonic')
+    def test_idle_timeout(self, monotonic: MagicMock) -> None:
+        """
+        Test closing connections that have been idle for too long.
+        """
+
+        monotonic.return_value = 100.0
+        pool = ConnectionPool(self.factory, self.close, idle_timeout=10)
+        connection = pool.acquire()
+        pool.release(connection)
+
+        monotonic.return_value = 111.0
+        self.assertIsNot(pool.acquire(), connection)
+        self.close.assert_called_once_with(connection)
+        self.assertEqual(pool.stats['expired'], 1)
+
+        # Older idle connections expire while recent ones are reused.
+        self.close.reset_mock()
+        old = pool.acquire()
+        recent = pool.acquire()
+        pool.release(old)
+        monotonic.return_value = 118.0
+        pool.release(recent)
+        for _ in range(3):
+            monotonic.return_value += 2.0
+            self.assertIs(pool.acquire(), recent)
+            pool.release(recent)
+
+        self.close.assert_called_once_with(old)
+        self.assertEqual(pool.stats['expired'], 2)
+        self.assertEqual(pool.stats['idle'], 1)
+
+    @patch('time.monotonic')
+    def test_check(self, monotonic: MagicMock) -> None:
+        """
+        Test health checks of idle connections.
+        """
+
+        monotonic.return_value = 100.0
+        check = MagicMock(return_value=True)
+        pool = ConnectionPool(self.factory, self.close, check=check,
+                              check_interval=30)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+        check.assert_not_called()
+        pool.release(connection)
+
+        monotonic.return_value = 140.0
+        self.assertIs(pool.acquire(), connection)
+        check.assert_called_once_with(connection)
+        pool.release(connection)
+
+        monotonic.return_value = 180.0
+        check.side_effect = ConnectionError
+        self.assertIsNot(pool.acquire(), connection)
+        self.close.assert_called_once_with(connection)
+
+    def test_connection(self) -> None:
+        """
+        Test the context manager for pooled connections.
+        """
+
+        pool = ConnectionPool(self.factory, self.close,
+                              discard_on=(ConnectionError,))
+        with pool.connection() as connection:
+            pass
+        with pool.connection() as reused:
+            self.assertIs(reused, connection)
+
+        with self.assertRaises(KeyError):
+            with pool.connection() as reused:
+                raise KeyError('kept')
+        self.close.assert_not_called()
+
+        with self.assertRaises(ConnectionError):
+            with pool.connection() as reused:
+                raise ConnectionError('discarded')
+        self.close.assert_called_once_with(connection)
+
+    def test_close(self) -> None:
+        """
+        Test closing the pool.
+        """
+
+        self.close.side_effect = ConnectionError
+        pool = ConnectionPool(self.factory, self.close)
+        idle = pool.acquire()
+        busy = pool.acquire()
+        pool.release(idle)
+        pool.close()
+        self.close.assert_called_once_with(idle)
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+
+        pool.release(busy)
+        self.close.assert_called_with(busy)
+        self.assertEqual(pool.stats['open'], 0)
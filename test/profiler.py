@@ -0,0 +1,175 @@
+"""
+Tests for sampling profiler of request threads.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from pathlib import Path
+import tempfile
+import threading
+import time
+import unittest
+import cherrypy
+from cherrypy.test import helper
+from server.profiler import PROFILER, Profile_Application, SamplingProfiler
+
+def slow_request(profiler: SamplingProfiler, seconds: float) -> None:
+    """
+    Pretend to handle a request in the current thread.
+    """
+
+    profiler.begin_request()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.005)
+    profiler.end_request()
+
+class SamplingProfilerTest(unittest.TestCase):
+    """
+    Tests for profiler which samples stacks of request threads.
+    """
+
+    def _request(self, profiler: SamplingProfiler, seconds: float) -> None:
+        thread = threading.Thread(target=slow_request,
+                                  args=(profiler, seconds))
+        thread.start()
+        thread.join()
+
+    def test_start(self) -> None:
+        """
+        Test sampling request threads.
+        """
+
+        profiler = SamplingProfiler(interval=0.005)
+        self.assertFalse(profiler.running)
+        self.assertIsNone(profiler.result)
+
+        # Requests are not sampled while the profiler is not running
+        profiler.begin_request()
+        profiler.end_request()
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertTrue(profiler.start(10, path=directory))
+            self.assertTrue(profiler.running)
+            self.assertFalse(profiler.start(10))
+            self._request(profiler, 0.1)
+            profiler.stop()
+            self.assertFalse(profiler.running)
+
+            self.assertIsNotNone(profiler.result)
+            lines = str(profiler.result).splitlines()
+            self.assertNotEqual(lines, [])
+            for line in lines:
+                stack, count = line.rsplit(' ', 1)
+                self.assertTrue(stack.startswith('-;'))
+                self.assertIn(';test.profiler:slow_request', stack)
+                self.assertGreater(int(count), 0)
+
+            paths = list(Path(directory).glob('profile-*.folded'))
+            self.assertEqual(len(paths), 1)
+            self.assertEqual(paths[0].read_text(encoding='utf-8'),
+                             profiler.result)
+
+    def test_threshold(self) -> None:
+        """
+        Test only keeping samples of slow requests.
+        """
+
+        profiler = SamplingProfiler(interval=0.005)
+        profiler.start(10, threshold=0.15)
+        self._request(profiler, 0.05)
+        profiler.stop()
+        self.assertEqual(profiler.result, '')
+
+        profiler.start(10, threshold=0.05)
+        self._request(profiler, 0.1)
+        profiler.stop()
+        self.assertNotEqual(profiler.result, '')
+
+        # Requests in progress when the duration ends are kept if slow enough
+        profiler.start(0.1)
+        thread = threading.Thread(target=slow_request, args=(profiler, 0.3))
+        thread.start()
+        time.sleep(0.2)
+        self.assertFalse(profiler.running)
+        thread.join()
+        self.assertNotEqual(profiler.result, '')
+
+class ProfileApplicationTest(helper.CPWebCase):
+    """
+    Tests for Web application which starts the profiler.
+    """
+
+    @staticmethod
+    def setup_server() -> None:
+        """"
+        Set up the application server.
+        """
+
+        class Root:
+            # pylint: disable=too-few-public-methods
+            """
+            Application with a slow page.
+            """
+
+            @cherrypy.expose
+            def index(self) -> str:
+                """
+                Slow page.
+                """
+
+                time.sleep(0.1)
+                return 'Slow'
+
+        cherrypy.tree.mount(Root(), '/slow', {
+            '/': {
+                'tools.profiler.on': True
+            }
+        })
+        cherrypy.tree.mount(Profile_Application(clients=('127.0.0.1', '::1')),
+                            '/profile')
+
+    def setUp(self) -> None:
+        self.addCleanup(PROFILER.stop)
+
+    def test_start(self) -> None:
+        """
+        Test starting the profiler and retrieving the result.
+        """
+
+        self.getPage('/profile/start?duration=5')
+        self.assertStatus('405 Method Not Allowed')
+        self.getPage('/profile/start?duration=-1', method='POST')
+        self.assertStatus('400 Bad Request')
+        self.getPage('/profile/start?duration=soon', method='POST')
+        self.assertStatus('400 Bad Request')
+
+        self.getPage('/profile/start?duration=5', method='POST')
+        self.assertStatus('202 Accepted')
+        self.getPage('/profile/start?duration=5', method='POST')
+        self.assertStatus('409 Conflict')
+        self.getPage('/profile')
+        self.assertStatus('409 Conflict')
+
+        self.getPage('/slow/')
+        self.assertBody('Slow')
+        PROFILER.stop()
+
+        self.getPage('/profile')
+        self.assertStatus('200 OK')
+        self.assertInBody('/slow/index;')
+        self.assertMatchesBody(r'test\.profiler:\S*index \d+')
@@ -0,0 +1,192 @@
+"""
+Tests for the table of exposed routes of Web applications.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from argparse import Namespace
+from configparser import RawConfigParser
+import json
+from typing import Any, Dict
+import unittest
+import cherrypy
+from cherrypy.test import helper
+from server.application import Authenticated_Application
+from server.routes import Route, Routes_Application, build_routes, \
+    get_routes
+from server.sessions import read_only_session, session_free
+
+class Child:
+    # pylint: disable=too-few-public-methods
+    """
+    Exposed child object.
+    """
+
+    exposed = True
+
+class Root:
+    """
+    Application with routes of various kinds.
+    """
+
+    child = Child()
+
+    def __init__(self) -> None:
+        self.hidden_child = Child()
+        self.hidden_child.exposed = False
+
+    @property
+    def broken(self) -> str:
+        """
+        Property which must not be evaluated.
+        """
+
+        raise AssertionError('Property was evaluated')
+
+    @cherrypy.expose
+    def index(self) -> str:
+        """
+        Index page.
+        """
+
+        return 'Index'
+
+    @cherrypy.expose
+    @session_free
+    def health(self) -> str:
+        """
+        Page which does not use the session.
+        """
+
+        return 'OK'
+
+    @cherrypy.expose
+    @read_only_session
+    def user(self) -> str:
+        """
+        Page which only reads the session.
+        """
+
+        return 'User'
+
+    @cherrypy.expose
+    @cherrypy.tools.allow(methods=['POST'])
+    def submit(self) -> str:
+        """
+        Page which only allows POST requests.
+        """
+
+        return 'Submitted'
+
+    def internal(self) -> str:
+        """
+        Method which is not exposed.
+        """
+
+        return 'Internal'
+
+class TestServer(Authenticated_Application):
+    """
+    Test server.
+    """
+
+    @cherrypy.expose
+    def index(self, page: str = 'list', params: str = '') -> str:
+        return "Index page"
+
+class RoutesTest(unittest.TestCase):
+    """
+    Tests for the table of exposed routes.
+    """
+
+    def test_build_routes(self) -> None:
+        """
+        Test building the table of exposed routes.
+        """
+
+        root = Root()
+        routes = build_routes(root)
+        self.assertEqual(sorted(routes),
+                         ['child', 'health', 'index', 'submit', 'user'])
+        self.assertEqual(routes['index'],
+                         Route('index', root.index, None, 'locked'))
+        self.assertIs(routes['child'].handler, Root.child)
+        self.assertEqual(routes['health'].session, 'none')
+        self.assertEqual(routes['user'].session, 'read_only')
+        self.assertEqual(routes['submit'].methods, frozenset(['POST']))
+        self.assertEqual(routes['submit'].as_dict(), {
+            'name': 'submit',
+            'methods': ['POST'],
+            'session': 'locked'
+        })
+
+        with self.assertRaises(TypeError):
+            routes['internal'] = routes['index'] # type: ignore[index]
+
+    def test_get_routes(self) -> None:
+        """
+        Test retrieving the table of exposed routes.
+        """
+
+        args = Namespace()
+        args.auth = 'open'
+        args.debug = True
+        server = TestServer(args, RawConfigParser())
+        routes = get_routes(server)
+        self.assertIs(routes, server.routes)
+        self.assertEqual(sorted(routes),
+                         ['default', 'index', 'login', 'logout'])
+
+        self.assertEqual(sorted(get_routes(Root())),
+                         ['child', 'health', 'index', 'submit', 'user'])
+
+class RoutesApplicationTest(helper.CPWebCase):
+    """
+    Tests for Web application which lists exposed routes.
+    """
+
+    @staticmethod
+    def setup_server() -> None:
+        """"
+        Set up the application server.
+        """
+
+        cherrypy.tree.mount(Root(), '/app')
+        cherrypy.tree.mount(Routes_Application(clients=('127.0.0.1', '::1')),
+                            '/routes')
+        cherrypy.tree.mount(Routes_Application(), '/denied')
+
+    def test_index(self) -> None:
+        """
+        Test listing the exposed routes.
+        """
+
+        self.getPage('/routes')
+        self.assertStatus('200 OK')
+        self.assertHeader('Content-Type', 'application/json')
+        listing: Dict[str, Any] = json.loads(self.body)
+        self.assertEqual([route['name'] for route in listing['/app']],
+                         ['child', 'health', 'index', 'submit', 'user'])
+        self.assertEqual(listing['/routes'], [
+            {'name': 'index', 'methods': None, 'session': 'none'}
+        ])
+
+        self.getPage('/denied')
+        self.assertStatus('403 Forbidden')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,335 @@
+"""
+Tests for session storage backends.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from datetime import datetime, timedelta
+import os
+from pathlib import Path
+import stat
+import tempfile
+import threading
+import unittest
+import cherrypy
+from cherrypy.lib.sessions import RamSession
+from server.sessions import CookieSession, ReadOnlySession, SQLiteSession, \
+    StripedLock, read_only_session, read_session_keys, session_free, \
+    snapshot_session
+
+class SessionFreeTest(unittest.TestCase):
+    """
+    Tests for marking handlers as not using the session.
+    """
+
+    def test_session_free(self) -> None:
+        """
+        Test disabling the session tools for a handler.
+        """
+
+        def handler() -> str:
+            return 'OK'
+
+        setattr(handler, '_cp_config', {'tools.json_out.on': True})
+        self.assertIs(session_free(handler), handler)
+        self.assertEqual(getattr(handler, '_cp_config'), {
+            'tools.json_out.on': True,
+            'tools.sessions.on': False,
+            'tools.lazy_sessions.on': False
+        })
+
+class ReadOnlySessionTest(unittest.TestCase):
+    """
+    Tests for read-only snapshot of a session.
+    """
+
+    def setUp(self) -> None:
+        self.session = RamSession(clean_freq=0)
+        self.session['authenticated'] = 'foo'
+        self.session.save()
+        self.session = RamSession(self.session.id, clean_freq=0)
+        self.addCleanup(vars(cherrypy.serving).pop, 'session', None)
+
+    def test_read_only_session(self) -> None:
+        """
+        Test marking a handler as only reading the session.
+        """
+
+        def handler() -> str:
+            return 'OK'
+
+        self.assertIs(read_only_session(handler), handler)
+        self.assertEqual(getattr(handler, '_cp_config'), {
+            'tools.sessions.locking': 'explicit',
+            'tools.lazy_sessions.locking': 'explicit',
+            'tools.read_only_session.on': True
+        })
+
+    def test_snapshot(self) -> None:
+        """
+        Test releasing the lock of the session after copying its data.
+        """
+
+        self.session.acquire_lock()
+        cherrypy.serving.session = self.session
+        snapshot_session()
+        snapshot = cherrypy.serving.session
+        self.assertIsInstance(snapshot, ReadOnlySession)
+        self.assertFalse(self.session.locked)
+        self.assertEqual(snapshot['authenticated'], 'foo')
+        self.assertEqual(snapshot.get('missing', 'default'), 'default')
+        self.assertEqual(list(snapshot.keys()), ['authenticated'])
+        self.assertEqual(snapshot.id, self.session.id)
+        snapshot.save()
+        self.assertFalse(self.session.locked)
+
+    def test_upgrade(self) -> None:
+        """
+        Test writing to the session through the snapshot.
+        """
+
+        snapshot = ReadOnlySession(self.session)
+        cherrypy.serving.session = snapshot
+        self.assertIn('authenticated', snapshot)
+        self.assertFalse(self.session.locked)
+
+        # Changes by other requests are loaded before writing.
+        other = RamSession(self.session.id, clean_freq=0)
+        other['page'] = 'list'
+        other.save()
+
+        snapshot['authenticated'] = 'bar'
+        self.assertIs(cherrypy.serving.session, self.session)
+        self.assertTrue(self.session.locked)
+        self.assertEqual(self.session['page'], 'list')
+        self.session.save()
+        self.assertFalse(self.session.locked)
+
+    def test_upgrade_methods(self) -> None:
+        """
+        Test changing the session with its methods through the snapshot.
+        """
+
+        snapshot = ReadOnlySession(self.session)
+        cherrypy.serving.session = snapshot
+        self.assertEqual(snapshot.timeout, self.session.timeout)
+        self.assertFalse(self.session.locked)
+
+        snapshot.update({'page': 'list'})
+        self.assertIs(cherrypy.serving.session, self.session)
+        self.assertTrue(self.session.locked)
+        self.session.save()
+
+        snapshot = ReadOnlySession(RamSession(self.session.id, clean_freq=0))
+        cherrypy.serving.session = snapshot
+        self.assertEqual(snapshot.setdefault('params', 'id=1'), 'id=1')
+        session = cherrypy.serving.session
+        self.assertIsInstance(session, RamSession)
+        self.assertTrue(session.locked)
+        session.save()
+
+        stored = RamSession(self.session.id, clean_freq=0)
+        self.assertEqual(stored['page'], 'list')
+        self.assertEqual(stored['params'], 'id=1')
+
+class ReadSessionKeysTest(unittest.TestCase):
+    """
+    Tests for reading session signing keys.
+    """
+
+    def test_read_session_keys(self) -> None:
+        """
+        Test reading keys from a file.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'keys'
+            path.write_text('new\n\nold\n', encoding='utf-8')
+            self.assertEqual(read_session_keys(path), (b'new', b'old'))
+
+            path.write_text('\n', encoding='utf-8')
+            with self.assertRaises(ValueError):
+                read_session_keys(path)
+
+class CookieSessionTest(unittest.TestCase):
+    """
+    Tests for session stored in a signed cookie.
+    """
+
+    def test_save(self) -> None:
+        """
+        Test storing session data in the session ID.
+        """
+
+        session = CookieSession(signing_keys=(b'new',), clean_freq=0)
+        self.assertFalse(session.missing)
+        session['authenticated'] = 'foo'
+        session.save()
+        token = session.id
+        self.assertIsNotNone(token)
+        self.assertNotIn('new', str(token))
+
+        loaded = CookieSession(token, signing_keys=(b'new',),
+                               clean_freq=0)
+        self.assertEqual(loaded.id, token)
+        self.assertEqual(loaded['authenticated'], 'foo')
+
+        # Cookies signed by an old key are accepted after rotation.
+        rotated = CookieSession(token, signing_keys=(b'newer', b'new'),
+                                clean_freq=0)
+        self.assertEqual(rotated['authenticated'], 'foo')
+        rotated.save()
+        self.assertNotEqual(rotated.id, token)
+
+        unknown = CookieSession(token, signing_keys=(b'other',),
+                                clean_freq=0)
+        self.assertTrue(unknown.missing)
+        self.assertIsNone(unknown.get('authenticated'))
+
+    def test_verify(self) -> None:
+        """
+        Test rejecting tampered or expired session cookies.
+        """
+
+        session = CookieSession(signing_keys=(b'key',), clean_freq=0)
+        session['authenticated'] = 'foo'
+        session.save()
+        token = str(session.id)
+        payload, signature = token.split('.')
+
+        for invalid in ('', 'foo', f'{payload}x.{signature}',
+                        f'{payload}.!!', f'{signature}.{signature}'):
+            with self.subTest(invalid=invalid):
+                tampered = CookieSession(invalid, signing_keys=(b'key',),
+                                         clean_freq=0)
+                self.assertTrue(tampered.missing)
+
+        # pylint: disable=protected-access
+        session._save(datetime.now() - timedelta(minutes=1))
+        expired = CookieSession(session.id, signing_keys=(b'key',),
+                                clean_freq=0)
+        self.assertTrue(expired.missing)
+
+        unsigned = CookieSession(clean_freq=0)
+        unsigned['authenticated'] = 'foo'
+        with self.assertRaises(ValueError):
+            unsigned.save()
+
+class StripedLockTest(unittest.TestCase):
+    """
+    Tests for locks shared between threads and processes.
+    """
+
+    def test_acquire(self) -> None:
+        """
+        Test acquiring and releasing stripes.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            lock = StripedLock(str(Path(directory) / 'lock'), 4)
+            stripe = lock.stripe('foo')
+            self.assertEqual(stripe, lock.stripe('foo'))
+            self.assertLess(stripe, 4)
+
+            acquired = threading.Event()
+            def acquire() -> None:
+                lock.acquire(stripe)
+                acquired.set()
+
+            lock.acquire(stripe)
+            thread = threading.Thread(target=acquire)
+            thread.start()
+            self.assertFalse(acquired.wait(0.1))
+            lock.release(stripe)
+            self.assertTrue(acquired.wait(5))
+            thread.join()
+            lock.release(stripe)
+
+class SQLiteSessionTest(unittest.TestCase):
+    """
+    Tests for session stored in an SQLite database.
+    """
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = str(Path(directory.name) / 'sessions.db')
+
+    def test_save(self) -> None:
+        """
+        Test storing and loading session data.
+        """
+
+        session = SQLiteSession(database=self.database, clean_freq=0)
+        session.acquire_lock()
+        self.assertTrue(session.locked)
+        session['authenticated'] = 'foo'
+        session.save()
+        self.assertFalse(session.locked)
+        self.assertEqual(len(session), 1)
+
+        # Another thread has its own connection to the database.
+        data = {}
+        def load() -> None:
+            loaded = SQLiteSession(session.id, database=self.database,
+                                   clean_freq=0)
+            data['authenticated'] = loaded['authenticated']
+            loaded.delete()
+
+        thread = threading.Thread(target=load)
+        thread.start()
+        thread.join()
+        self.assertEqual(data, {'authenticated': 'foo'})
+        self.assertTrue(SQLiteSession(session.id, database=self.database,
+                                      clean_freq=0).missing)
+
+    def test_permissions(self) -> None:
+        """
+        Test creating the database files readable only by the user.
+        """
+
+        umask = os.umask(0)
+        try:
+            session = SQLiteSession(database=self.database, clean_freq=0)
+            session.acquire_lock()
+            session['authenticated'] = 'foo'
+            session.save()
+        finally:
+            os.umask(umask)
+
+        for suffix in ('', '-wal', '-shm', '.lock'):
+            with self.subTest(suffix=suffix):
+                path = Path(f'{self.database}{suffix}')
+                self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o600)
+
+    def test_clean_up(self) -> None:
+        """
+        Test removing expired sessions in batches.
+        """
+
+        for minutes in (-2, -1, -1, 1):
+            session = SQLiteSession(database=self.database, clean_freq=0,
+                                    batch_size=2)
+            session['authenticated'] = 'foo'
+            # pylint: disable=protected-access
+            session._save(datetime.now() + timedelta(minutes=minutes))
+
+        self.assertEqual(len(session), 4)
+        session.clean_up()
+        self.assertEqual(len(session), 1)
+        self.assertEqual(session['authenticated'], 'foo')
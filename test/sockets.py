@@ -0,0 +1,134 @@
+"""
+Tests for listening sockets inherited from systemd or bound before starting workers.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+from pathlib import Path
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+import cherrypy
+from server.sockets import ListeningSocketServer, bind_unix_socket, \
+    inherit_sockets, open_listener
+
+class SocketsTest(unittest.TestCase):
+    """
+    Tests for listening sockets.
+    """
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / 'server.sock')
+
+    def test_inherit_sockets(self) -> None:
+        """
+        Test retrieving sockets passed through systemd socket activation.
+        """
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        self.addCleanup(listener.close)
+        descriptor = os.dup(listener.fileno())
+
+        environ = {'LISTEN_PID': '1', 'LISTEN_FDS': '1'}
+        with patch.dict('os.environ', environ):
+            self.assertEqual(inherit_sockets(), [])
+            self.assertNotIn('LISTEN_PID', os.environ)
+
+        environ = {'LISTEN_PID': str(os.getpid()), 'LISTEN_FDS': '1'}
+        with patch.dict('os.environ', environ):
+            with patch('server.sockets.SD_LISTEN_FDS_START', new=descriptor):
+                inherited = inherit_sockets()
+                self.assertEqual(len(inherited), 1)
+                self.assertEqual(inherited[0].family, socket.AF_INET)
+                self.assertEqual(inherited[0].getsockname(),
+                                 listener.getsockname())
+                inherited[0].close()
+            self.assertNotIn('LISTEN_FDS', os.environ)
+
+        self.assertEqual(inherit_sockets(), [])
+
+    def test_bind_unix_socket(self) -> None:
+        """
+        Test creating a listening Unix domain socket.
+        """
+
+        listener = bind_unix_socket(self.path)
+        listener.close()
+        self.assertTrue(Path(self.path).is_socket())
+        self.assertEqual(stat.S_IMODE(Path(self.path).stat().st_mode),
+                         0o660)
+
+        # A stale socket file is replaced.
+        listener = bind_unix_socket(self.path, mode=0o600)
+        self.addCleanup(listener.close)
+        self.assertEqual(listener.getsockname(), self.path)
+        self.assertEqual(stat.S_IMODE(Path(self.path).stat().st_mode),
+                         0o600)
+
+        # Other files are not replaced.
+        other = Path(self.path).with_name('file')
+        other.touch()
+        with self.assertRaises(OSError):
+            bind_unix_socket(str(other))
+
+    def test_open_listener(self) -> None:
+        """
+        Test retrieving an inherited socket or binding a Unix domain socket.
+        """
+
+        self.assertIsNone(open_listener())
+        listener = open_listener(self.path)
+        if listener is None:
+            self.fail('Listener must be bound')
+
+        self.addCleanup(listener.close)
+        self.assertEqual(listener.family, socket.AF_UNIX)
+
+    def test_listening_socket_server(self) -> None:
+        """
+        Test accepting HTTP connections on a socket that is already listening.
+        """
+
+        listener = bind_unix_socket(self.path)
+        self.addCleanup(listener.close)
+        httpserver = ListeningSocketServer(cherrypy.server, listener)
+        self.assertEqual(httpserver.bind_addr, self.path)
+        httpserver.prepare()
+        thread = threading.Thread(target=httpserver.serve)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(httpserver.stop)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(5)
+            client.connect(self.path)
+            client.sendall(b'GET / HTTP/1.0\r\n\r\n')
+            self.assertTrue(client.recv(1024).startswith(b'HTTP/1.1 '))
+
+        # The listener stays open after the server stops.
+        httpserver.stop()
+        self.assertNotEqual(listener.fileno(), -1)
+        self.assertEqual(listener.getsockname(), self.path)
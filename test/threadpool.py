@@ -0,0 +1,119 @@
+"""
+Tests for monitored thread pool of the HTTP server.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from http.client import HTTPConnection
+import threading
+import time
+from typing import Callable, Iterable, List
+import unittest
+from cheroot.wsgi import Server
+from server.threadpool import MonitoredThreadPool
+
+class MonitoredThreadPoolTest(unittest.TestCase):
+    """
+    Tests for thread pool of the HTTP server with saturation metrics.
+    """
+
+    def setUp(self) -> None:
+        self.release = threading.Event()
+        self.httpserver = Server(('127.0.0.1', 0), self._app, numthreads=1,
+                                 max=3)
+        self.pool = MonitoredThreadPool.replace(self.httpserver)
+        self.httpserver.prepare()
+        thread = threading.Thread(target=self.httpserver.serve)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.httpserver.stop)
+        self.addCleanup(self.release.set)
+
+    def _app(self, environ: dict, start_response: Callable[..., None]) \
+        -> Iterable[bytes]:
+        # pylint: disable=unused-argument
+        self.release.wait(5)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'OK']
+
+    def _request(self, statuses: List[int]) -> None:
+        port = self.httpserver.bind_addr[1]
+        connection = HTTPConnection('127.0.0.1', port, timeout=5)
+        connection.request('GET', '/')
+        statuses.append(connection.getresponse().status)
+        connection.close()
+
+    def _wait(self, condition: Callable[[], bool]) -> None:
+        for _ in range(50):
+            if condition():
+                return
+            time.sleep(0.1)
+
+        self.fail('Condition not met')
+
+    def test_replace(self) -> None:
+        """
+        Test replacing the thread pool of an HTTP server.
+        """
+
+        self.assertIs(self.httpserver.requests, self.pool)
+        self.assertEqual(self.pool.min, 1)
+        self.assertEqual(self.pool.max, 3)
+
+    def test_adapt(self) -> None:
+        """
+        Test tracking and adapting to queued connections.
+        """
+
+        self._wait(lambda: self.pool.stats['threads'] == 1)
+        self.assertEqual(self.pool.stats['utilization'], 0.0)
+
+        statuses: List[int] = []
+        clients = [
+            threading.Thread(target=self._request, args=(statuses,))
+            for _ in range(3)
+        ]
+        for client in clients:
+            client.start()
+
+        # One thread is busy while the other connections wait in the queue.
+        self._wait(lambda: self.pool.stats['queue'] == 2 and
+                   self.pool.stats['idle'] == 0)
+        self.assertEqual(self.pool.stats['utilization'], 1.0)
+
+        with self.assertLogs(level='INFO'):
+            self.pool.adapt()
+        self._wait(lambda: self.pool.stats['queue'] == 0)
+        self.assertEqual(self.pool.stats['threads'], 3)
+
+        self.release.set()
+        for client in clients:
+            client.join()
+
+        self.assertEqual(statuses, [200, 200, 200])
+        stats = self.pool.stats
+        self.assertGreaterEqual(stats['queued'], 3)
+        self.assertGreater(stats['queue_wait'], 0.0)
+        self.assertGreaterEqual(stats['queue_wait'], stats['queue_wait_max'])
+
+        # Idle threads are removed after some time.
+        self._wait(lambda: self.pool.stats['idle'] == 3)
+        self.pool.adapt(shrink_after=2)
+        self.assertEqual(self.pool.stats['threads'], 3)
+        with self.assertLogs(level='INFO'):
+            self.pool.adapt(shrink_after=2)
+        self._wait(lambda: self.pool.stats['threads'] == 2)
@@ -0,0 +1,217 @@
+"""
+Tests for timing of request phases and structured access logging.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from argparse import Namespace
+from configparser import RawConfigParser
+import json
+import logging
+import time
+from typing import List
+import unittest
+from unittest.mock import patch
+import cherrypy
+from cherrypy.test import helper
+from server.application import Authenticated_Application
+from server.dispatcher import HostDispatcher
+from server.timing import RequestTiming, StructuredAccessFilter, timed, \
+    route_label
+
+class TimingServer(Authenticated_Application):
+    """
+    Test server.
+    """
+
+    @cherrypy.expose
+    def index(self, page: str = 'list', params: str = '') -> str:
+        return "Index page"
+
+class AccessHandler(logging.Handler):
+    """
+    Log handler which keeps structured access records.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.addFilter(StructuredAccessFilter())
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+class RequestTimingTest(unittest.TestCase):
+    """
+    Tests for wall time spent in phases of a request.
+    """
+
+    def test_stop(self) -> None:
+        """
+        Test measuring the time of nested phases.
+        """
+
+        timing = RequestTiming()
+        with patch('time.perf_counter', side_effect=[1.0, 2.0, 4.0, 7.0]):
+            timing.start('handler')
+            timing.start('authentication')
+            timing.stop('authentication')
+            timing.stop('dispatch')
+            timing.stop('handler')
+
+        self.assertEqual(timing.phases, {'authentication': 2.0, 'handler': 4.0})
+
+        with patch('time.perf_counter', side_effect=[10.0, 11.0, 13.0]):
+            timing.start('handler')
+            timing.start('session')
+            timing.stop_all()
+
+        self.assertEqual(timing.phases, {
+            'authentication': 2.0,
+            'handler': 5.0,
+            'session': 2.0
+        })
+
+    def test_timed(self) -> None:
+        """
+        Test measuring the time of a phase of the current request.
+        """
+
+        request = cherrypy.serving.request
+        self.addCleanup(delattr, request, 'timing')
+        with self.assertRaises(ValueError):
+            with timed('dispatch'):
+                raise ValueError('Dispatch failed')
+
+        self.assertIs(RequestTiming.current(), getattr(request, 'timing'))
+        self.assertIn('dispatch', RequestTiming.current().phases)
+
+    def test_route_label(self) -> None:
+        """
+        Test retrieving a label for the handler of a request.
+        """
+
+        # The handler may be wrapped by tools
+        handler = Namespace(callable=TimingServer.index)
+        request = Namespace(script_name='/app',
+                            handler=Namespace(oldhandler=handler))
+        with patch.object(cherrypy.serving, 'request', request):
+            self.assertEqual(route_label(), '/app/index')
+            request.handler = cherrypy.NotFound('/app/missing')
+            self.assertEqual(route_label(), '-')
+
+class StructuredAccessFilterTest(unittest.TestCase):
+    """
+    Tests for filter of default access log lines.
+    """
+
+    def test_filter(self) -> None:
+        """
+        Test filtering log records.
+        """
+
+        log_filter = StructuredAccessFilter()
+        self.assertFalse(log_filter.filter(logging.makeLogRecord({
+            'name': 'cherrypy.access.1234'
+        })))
+        self.assertTrue(log_filter.filter(logging.makeLogRecord({
+            'name': 'cherrypy.access',
+            'access': {}
+        })))
+        self.assertTrue(log_filter.filter(logging.makeLogRecord({
+            'name': 'cherrypy.error'
+        })))
+
+class TimingToolTest(helper.CPWebCase):
+    """
+    Tests for tool which logs structured access records with timings.
+    """
+
+    @staticmethod
+    def setup_server() -> None:
+        """"
+        Set up the application server.
+        """
+
+        args = Namespace()
+        args.auth = 'open'
+        args.debug = True
+
+        cherrypy.tree.mount(TimingServer(args, RawConfigParser()), '/timing', {
+            '/': {
+                'request.dispatch': HostDispatcher(),
+                'tools.sessions.on': True,
+                'tools.timing.on': True
+            }
+        })
+
+    def setUp(self) -> None:
+        self.handler = AccessHandler()
+        logger = logging.getLogger('cherrypy.access')
+        logger.addHandler(self.handler)
+        self.addCleanup(logger.removeHandler, self.handler)
+
+    def _get_access(self) -> List[logging.LogRecord]:
+        deadline = time.monotonic() + 5
+        while not self.handler.records and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        records = self.handler.records
+        self.handler.records = []
+        return records
+
+    def test_timing(self) -> None:
+        """
+        Test logging structured access records with timings.
+        """
+
+        self.getPage('/timing/index')
+        self.assertStatus('200 OK')
+        records = self._get_access()
+        self.assertEqual(len(records), 1)
+        access = json.loads(records[0].getMessage())
+        self.assertEqual(access, getattr(records[0], 'access'))
+        self.assertEqual(access['method'], 'GET')
+        self.assertEqual(access['path'], '/timing/index')
+        self.assertEqual(access['route'], '/timing/index')
+        self.assertEqual(access['status'], 200)
+        self.assertEqual(access['bytes'], len('Index page'))
+        self.assertEqual(set(access['timings']), {
+            'dispatch', 'session', 'authentication', 'handler', 'write',
+            'total'
+        })
+        self.assertGreater(access['timings']['dispatch'], 0.0)
+        self.assertGreater(access['timings']['handler'], 0.0)
+        self.assertEqual(access['timings']['authentication'], 0.0)
+        self.assertIsNone(access['user'])
+        self.assertGreaterEqual(access['timings']['total'],
+                                sum(access['timings'].values()) -
+                                access['timings']['total'])
+
+        self.getPage('/timing/login', method='POST',
+                     body='username=admin&password=admin')
+        access = getattr(self._get_access()[0], 'access')
+        self.assertEqual(access['route'], '/timing/login')
+        self.assertEqual(access['user'], 'admin')
+        self.assertGreater(access['timings']['authentication'], 0.0)
+
+        self.getPage('/timing/missing/page')
+        self.assertStatus('303 See Other')
+        access = getattr(self._get_access()[0], 'access')
+        self.assertEqual(access['path'], '/timing/missing/page')
+        self.assertEqual(access['route'], '/timing/default')
+        self.assertEqual(access['status'], 303)
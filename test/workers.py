@@ -0,0 +1,168 @@
+"""
+Tests for supervision of pre-forked worker processes.
+
+Copyright 2017-2020 ICTU
+Copyright 2017-2022 Leiden University
+Copyright 2017-2024 Leon Helwerda
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+from pathlib import Path
+import signal
+import tempfile
+import threading
+import time
+from typing import Callable, List
+import unittest
+from unittest.mock import MagicMock
+from server.workers import Supervisor
+
+class SupervisorTest(unittest.TestCase):
+    """
+    Tests for supervisor of pre-forked worker processes.
+    """
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name)
+
+    def _stop_after(self, supervisor: Supervisor,
+                    condition: Callable[[], bool]) -> threading.Thread:
+        def stop() -> None:
+            deadline = time.monotonic() + 10
+            while not condition() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            supervisor.stop()
+
+        thread = threading.Thread(target=stop)
+        thread.start()
+        return thread
+
+    def test_start(self) -> None:
+        """
+        Test starting, restarting and stopping workers.
+        """
+
+        with self.assertRaises(ValueError):
+            Supervisor(0, lambda: None)
+
+        marker = self.path / 'crashed'
+        pidfile = self.path / 'pid'
+
+        def target() -> None:
+            (self.path / str(os.getpid())).touch()
+            if not marker.exists():
+                marker.touch()
+                raise SystemExit(3)
+            time.sleep(30)
+
+        handler = signal.getsignal(signal.SIGTERM)
+        supervisor = Supervisor(2, target, pidfile=str(pidfile),
+                                restart_delay=0)
+        thread = self._stop_after(supervisor, lambda: len([
+            path for path in self.path.iterdir() if path.name.isdigit()
+        ]) == 3)
+        with self.assertLogs(level='WARNING') as logs:
+            supervisor.start()
+        thread.join()
+
+        self.assertIn('stopped with status 3', logs.output[0])
+        self.assertEqual(supervisor.restarts, 1)
+        self.assertEqual(supervisor.workers, {})
+        self.assertFalse(pidfile.exists())
+        self.assertEqual(signal.getsignal(signal.SIGTERM), handler)
+
+    def test_crash(self) -> None:
+        """
+        Test restarting a worker that is killed by a signal.
+        """
+
+        marker = self.path / 'crashed'
+        started = self.path / 'started'
+
+        def target() -> None:
+            if not marker.exists():
+                marker.touch()
+                os.kill(os.getpid(), signal.SIGKILL)
+            started.touch()
+            time.sleep(30)
+
+        supervisor = Supervisor(1, target, restart_delay=0)
+        thread = self._stop_after(supervisor, started.exists)
+        with self.assertLogs(level='WARNING') as logs:
+            supervisor.start()
+        thread.join()
+
+        self.assertIn(f'stopped by signal {signal.SIGKILL:d}',
+                      logs.output[0])
+        self.assertEqual(supervisor.restarts, 1)
+        self.assertEqual(supervisor.workers, {})
+
+    def test_shutdown_timeout(self) -> None:
+        """
+        Test killing workers that do not stop in time.
+        """
+
+        started = self.path / 'started'
+
+        def target() -> None:
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            started.touch()
+            time.sleep(30)
+
+        supervisor = Supervisor(1, target, shutdown_timeout=0.2)
+        thread = self._stop_after(supervisor, started.exists)
+        start = time.monotonic()
+        with self.assertLogs(level='WARNING') as logs:
+            supervisor.start()
+        thread.join()
+
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertIn('Killing 1 workers', logs.output[0])
+        self.assertEqual(supervisor.workers, {})
+
+    def test_reload(self) -> None:
+        """
+        Test reloading the supervisor and workers.
+        """
+
+        started = self.path / 'started'
+        reloaded = self.path / 'reloaded'
+
+        def target() -> None:
+            signal.signal(signal.SIGHUP,
+                          lambda signum, frame: reloaded.touch())
+            started.touch()
+            time.sleep(30)
+
+        reload = MagicMock()
+        supervisor = Supervisor(1, target, reload=reload)
+        sent: List[bool] = []
+
+        def send_reload() -> bool:
+            if started.exists() and not sent:
+                sent.append(True)
+                os.kill(os.getpid(), signal.SIGHUP)
+            return reloaded.exists()
+
+        thread = self._stop_after(supervisor, send_reload)
+        supervisor.start()
+        thread.join()
+
+        reload.assert_called_once_with()
+        self.assertTrue(reloaded.exists())
+        self.assertEqual(supervisor.restarts, 0)
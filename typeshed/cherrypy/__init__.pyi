@@ -1,19 +1,35 @@
 from typing import Any, Callable, Dict, List, Optional, TextIO, TypeVar, Union
 from . import dispatch, lib
-from . import _cptree
+from . import _cpserver, _cptools, _cptree, process
+from ._cptools import Tool as Tool
 
 __version__: str
 
 class HTTPError(Exception):
+    status: int = ...
+    def __init__(self, status: int = ..., message: Optional[str] = ...) -> None: ...
     def __call__(self) -> 'ResponseBody': ...
+    def set_response(self) -> None: ...
 
 class HTTPRedirect(HTTPError):
-    pass
+    def __init__(self, urls: Union[str, List[str]], status: Optional[int] = ...) -> None: ...
 
 class NotFound(HTTPError):
-    pass
+    def __init__(self, path: Optional[str] = ...) -> None: ...
+
+class Remote:
+    ip: str = ...
+    port: int = ...
+    name: str = ...
+
+class HookMap:
+    def attach(self, point: str, callback: Callable[..., Any], failsafe: Optional[bool] = ..., priority: Optional[int] = ..., **kwargs: Any) -> None: ...
 
 class Request:
+    remote: Remote = ...
+    hooks: HookMap = ...
+    script_name: str = ...
+    unique_id: Any = ...
     headers: Dict[str, str] = ...
     config: Dict[str, Any] = ...
     handler: Optional[Callable[[], 'ResponseBody']] = ...
@@ -21,6 +37,7 @@ class Request:
     show_tracebacks: bool = ...
     path_info: str = ...
     query_string: str = ...
+    login: Optional[str] = ...
 
 class ResponseBody:
     pass
@@ -28,19 +45,27 @@ class ResponseBody:
 class Response:
     body: ResponseBody = ...
     status: int = ...
+    output_status: Optional[bytes] = ...
+    time: float = ...
     headers: Dict[str, str] = ...
 
 class Serving:
     request: Request = ...
     response: Response = ...
+    session: Any = ...
+
+class _ThreadLocalProxy:
+    def __init__(self, attrname: str) -> None: ...
 
 serving: Serving = ...
 request: Request = ...
 response: Response = ...
-session: Dict[str, str] = ...
+session: Any = ...
 config: Dict[str, Any] = ...
 
 tree: _cptree.Tree = ...
+engine: process.wspbus.Bus = ...
+server: _cpserver.Server = ...
 
 Application = TypeVar('Application', bound=object, covariant=True)
 ExposedFunction = Callable[[Application], str]
@@ -51,7 +76,9 @@ def expose(func: ExposedFunction, alias: Optional[str] = ...) -> ExposedFunction
 class Toolbox:
     @staticmethod
     def json_out() -> Callable[[JSONFunction], ExposedFunction]: ...
+    def __getattr__(self, name: str) -> _cptools.Tool: ...
+    def __setattr__(self, name: str, value: _cptools.Tool) -> None: ...
 
-tools = Toolbox
+tools: Toolbox = ...
 
 def quickstart(root: Optional[Application] = ..., script_name: str = ..., config: Optional[Union[TextIO, Dict[str, Any]]] = ...) -> None: ...
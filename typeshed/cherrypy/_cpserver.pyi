@@ -0,0 +1,11 @@
+from typing import Any, Optional, Tuple, Union
+from .process.servers import ServerAdapter
+
+class Server(ServerAdapter):
+    socket_port: int = ...
+    socket_host: str = ...
+    socket_file: Optional[str] = ...
+    socket_queue_size: int = ...
+    thread_pool: int = ...
+    thread_pool_max: int = ...
+    instance: Any = ...
@@ -0,0 +1,15 @@
+from typing import Any, Callable, Optional, TypeVar
+
+_Handler = TypeVar('_Handler', bound=Callable[..., Any])
+
+class Tool:
+    callable: Callable[..., Any] = ...
+    _point: str = ...
+    _priority: int = ...
+    def __init__(self, point: str, callable: Callable[..., Any], name: Optional[str] = ..., priority: int = ...) -> None: ...
+    def _setup(self) -> None: ...
+    def __call__(self, *args: Any, **kwargs: Any) -> Callable[[_Handler], _Handler]: ...
+
+class SessionTool(Tool):
+    def __init__(self) -> None: ...
+    def regenerate(self) -> None: ...
@@ -1,5 +1,10 @@
 from typing import Any, Dict, Optional
 
+class Application:
+    root: Any = ...
+    script_name: str = ...
+
 class Tree:
+    apps: Dict[str, Application] = ...
     def __init__(self): ...
     def mount(self, root: object, script_name: str = '', config: Optional[Dict[str, Dict[str, Any]]] = None) -> None: ...
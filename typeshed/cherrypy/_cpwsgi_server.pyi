@@ -0,0 +1,15 @@
+from typing import Any
+from ._cpserver import Server
+
+class CPWSGIServer:
+    reuse_port: bool = ...
+    requests: Any = ...
+    bind_addr: Any = ...
+    socket: Any = ...
+    ready: bool = ...
+    def __init__(self, server_adapter: Server = ...) -> None: ...
+    def bind(self, family: int, type: int, proto: int = ...) -> None: ...
+    def bind_unix_socket(self, bind_addr: Any) -> None: ...
+    def prepare(self) -> None: ...
+    def serve(self) -> None: ...
+    def stop(self) -> None: ...
@@ -1 +1,36 @@
+import datetime
+from typing import Any, Dict, Optional
+
+class Session:
+    id: Optional[str] = ...
+    timeout: int = ...
+    locked: bool = ...
+    loaded: bool = ...
+    missing: bool = ...
+    clean_freq: int = ...
+    debug: bool = ...
+    _data: Dict[str, Any] = ...
+    def __init__(self, id: Optional[str] = ..., **kwargs: Any) -> None: ...
+    def now(self) -> datetime.datetime: ...
+    def generate_id(self) -> str: ...
+    def save(self) -> None: ...
+    def load(self) -> None: ...
+    def delete(self) -> None: ...
+    def acquire_lock(self) -> None: ...
+    def release_lock(self) -> None: ...
+    def __getitem__(self, key: str) -> Any: ...
+    def __setitem__(self, key: str, value: Any) -> None: ...
+    def __delitem__(self, key: str) -> None: ...
+    def __contains__(self, key: str) -> bool: ...
+    def get(self, key: str, default: Any = ...) -> Any: ...
+    def keys(self) -> Any: ...
+    def values(self) -> Any: ...
+    def items(self) -> Any: ...
+    def pop(self, key: str, default: Any = ...) -> Any: ...
+    def __len__(self) -> int: ...
+
+class RamSession(Session):
+    cache: Dict[str, Any] = ...
+
+def init(**kwargs: Any) -> None: ...
 def expire() -> None: ...
@@ -0,0 +1 @@
+from . import plugins, servers, wspbus
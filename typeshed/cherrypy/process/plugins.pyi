@@ -0,0 +1,27 @@
+from typing import Callable, Dict, Optional
+from .wspbus import Bus
+
+class Daemonizer:
+    @staticmethod
+    def daemonize(stdin: str = ..., stdout: str = ..., stderr: str = ...,
+                  logger: Callable[[str], None] = ...) -> None: ...
+
+class SimplePlugin:
+    bus: Bus = ...
+    def __init__(self, bus: Bus) -> None: ...
+    def subscribe(self) -> None: ...
+    def unsubscribe(self) -> None: ...
+
+class Monitor(SimplePlugin):
+    callback: Callable[[], None] = ...
+    frequency: float = ...
+    def __init__(self, bus: Bus, callback: Callable[[], None],
+                 frequency: float = ..., name: Optional[str] = ...) -> None: ...
+    def start(self) -> None: ...
+    def stop(self) -> None: ...
+
+class SignalHandler:
+    handlers: Dict[str, Callable[[], None]] = ...
+    def __init__(self, bus: Bus) -> None: ...
+    def subscribe(self) -> None: ...
+    def unsubscribe(self) -> None: ...
@@ -0,0 +1,17 @@
+from typing import Any, Optional, Tuple, Union
+from .wspbus import Bus
+
+class ServerAdapter:
+    bus: Bus = ...
+    httpserver: Any = ...
+    bind_addr: Union[str, Tuple[str, int]] = ...
+    running: bool = ...
+    interrupt: Optional[BaseException] = ...
+    description: str = ...
+    def __init__(self, bus: Bus, httpserver: Any = ..., bind_addr: Union[str, Tuple[str, int], None] = ...) -> None: ...
+    def subscribe(self) -> None: ...
+    def unsubscribe(self) -> None: ...
+    def start(self) -> None: ...
+    def stop(self) -> None: ...
+    def wait(self) -> None: ...
+    def _start_http_thread(self) -> None: ...
@@ -0,0 +1,9 @@
+from typing import Any, Callable, Optional
+from .plugins import SignalHandler
+
+class Bus:
+    signal_handler: Optional[SignalHandler] = ...
+    def log(self, msg: str = ..., level: int = ..., traceback: bool = ...) -> None: ...
+    def subscribe(self, channel: str, callback: Callable[..., Any], priority: Optional[int] = ...) -> None: ...
+    def unsubscribe(self, channel: str, callback: Callable[..., Any]) -> None: ...
+    def publish(self, channel: str, *args: Any, **kwargs: Any) -> Any: ...
@@ -5,9 +5,12 @@ _Headers = List[Tuple[str, str]]
 _InBody = Union[str, bytes]
 
 class CPWebCase(unittest.TestCase):
+    body: bytes = ...
     def getPage(self, url: str, headers: Optional[_Headers] = None, method: str = 'GET', body: Optional[_InBody] = None, protocol: Optional[str] = None, raise_subcls: Tuple[Type[Exception], ...] = ()) -> Tuple[str, _Headers, bytes]: ...
     def assertStatus(self, status: str, msg: Optional[str] = None) -> None: ...
     def assertHeader(self, key: str, value: Optional[str] = None, msg: Optional[str] = None) -> str: ...
+    def assertNoHeader(self, key: str, msg: Optional[str] = None) -> None: ...
     def assertBody(self, value: _InBody, msg: Optional[str] = None) -> None: ...
     def assertInBody(self, value: _InBody, msg: Optional[str] = None) -> None: ...
     def assertNotInBody(self, value: _InBody, msg: Optional[str] = None) -> None: ...
+    def assertMatchesBody(self, pattern: _InBody, msg: Optional[str] = None, flags: int = 0) -> None: ...
@@ -1,13 +1,28 @@
 from .ldapobject import LDAPObject
 
+SCOPE_BASE: int = ...
 SCOPE_SUBTREE: int = ...
 OPT_REFERRALS: int = ...
+OPT_NETWORK_TIMEOUT: int = ...
+OPT_TIMEOUT: int = ...
 
-class Error(Exception):
+class LDAPError(Exception):
     pass
-class INVALID_CREDENTIALS(Error):
+class Error(LDAPError):
     pass
-class UNWILLING_TO_PERFORM(Error):
+class INVALID_CREDENTIALS(LDAPError):
+    pass
+class UNWILLING_TO_PERFORM(LDAPError):
+    pass
+class SERVER_DOWN(LDAPError):
+    pass
+class TIMEOUT(LDAPError):
+    pass
+class CONNECT_ERROR(LDAPError):
+    pass
+class UNAVAILABLE(LDAPError):
+    pass
+class NO_SUCH_OBJECT(LDAPError):
     pass
 
 def initialize(server: str) -> LDAPObject: ...
@@ -1,8 +1,12 @@
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 class LDAPObject:
+    def abandon(self, msgid: int, serverctrls: Optional[Any] = ..., clientctrls: Optional[Any] = ...) -> None: ...
+    def result(self, msgid: int = ..., all: int = ..., timeout: Optional[float] = ...) -> Tuple[int, List[Tuple[str, Dict[str, List[bytes]]]]]: ...
+    def search(self, base: str, scope: int, filterstr: Optional[str] = ..., attrlist: Optional[Sequence[str]] = ..., attrsonly: int = ...) -> int: ...
     def search_s(self, base: str, scope: int, filterstr: Optional[str] = ..., attrlist: Optional[Sequence[str]] = ..., attrsonly: int = ..., timeout: int = ...) -> List[Tuple[str, Dict[str, List[bytes]]]]: ...
-    def set_option(self, option: int, invalue: int) -> None: ...
+    def set_option(self, option: int, invalue: Union[int, float]) -> None: ...
     def simple_bind(self, who: Optional[str] = ..., cred: Optional[str] = ..., serverctrls: Optional[Any] = ..., clientctrls: Optional[Any] = ...) -> int: ...
     def simple_bind_s(self, username: str, password: str) -> None: ...
     def unbind(self) -> None: ...
+    def whoami_s(self, serverctrls: Optional[Any] = ..., clientctrls: Optional[Any] = ...) -> str: ...